@@ -18,7 +18,71 @@ class Config(object):
     LOG_WITH_GUNICORN = os.getenv('LOG_WITH_GUNICORN', default=False)
     EXPLAIN_TEMPLATE_LOADING = True   
     MEMBERS_PER_PAGE = 8
+    EXPORT_BATCH_SIZE = 1000
+    IMPORT_BATCH_SIZE = 1000
+    MEMBER_BATCH_LIMIT = 1000
+    MEMBERS_API_PER_PAGE = 100
+    # The most matches counted for a filtered member list; beyond this the total is shown as e.g. '1000+'
+    MEMBER_COUNT_LIMIT = 1000
     WTF_CSRF_SECRET_KEY = os.environ.get("CSRF_SECRET_KEY")
+    # Password hashing: the bcrypt cost, and the threads which run it ('flask' CLI commands hash on the calling thread)
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', default=12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', default=os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE_SIZE = 8
+    PASSWORD_HASH_RETRY_AFTER = 2
+    # Logged-in users cached by each process, rechecked against the users version after USER_CACHE_TTL seconds
+    USER_CACHE_SIZE = 256
+    USER_CACHE_TTL = 30
+    # Rate limits, shared by the worker processes on this machine through RATELIMIT_STORAGE ('memory' or 'sqlite:///<path>')
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE = os.getenv('RATELIMIT_STORAGE', default=f"sqlite:///{os.path.join(BASEDIR, 'instance', 'ratelimit.db')}")
+    RATELIMIT_LOGIN = '10/minute'  # per IP address
+    RATELIMIT_LOGIN_ACCOUNT = '5/minute'  # per username
+    RATELIMIT_SIGNUP = '5/minute'  # per IP address
+    # Bearer token a metrics scraper sends to read /metrics without logging in (None: logged-in users only)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Bloom filter of member emails shared by the workers on this machine (None to turn it off)
+    EMAIL_FILTER_PATH = os.getenv('EMAIL_FILTER_PATH', default=os.path.join(BASEDIR, 'instance', 'email-filter.bin'))
+    EMAIL_FILTER_CAPACITY = 1000000
+    # Address of the site used in links in emails, e.g. unsubscribe links
+    SITE_URL = os.getenv('SITE_URL', default='http://localhost:5000')
+    # Outgoing email, sent by the outbox worker ('flask outbox-worker')
+    MAIL_SERVER = os.getenv('MAIL_SERVER', default='localhost')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', default=25))
+    MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', default='false').lower() == 'true'
+    MAIL_USERNAME = os.getenv('MAIL_USERNAME')
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', default='noreply@yord.local')
+    MAIL_CONTACT_RECIPIENT = os.getenv('MAIL_CONTACT_RECIPIENT', default='contact@yord.local')
+    MAIL_POOL_SIZE = 2
+    MAIL_TIMEOUT = 10
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BACKOFF = 30
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_POLL_INTERVAL = 5
+    OUTBOX_CLAIM_TIMEOUT = 300  # seconds a worker has to send the messages it claims
+    # Newsletter campaigns ('flask send-campaign')
+    CAMPAIGN_CONNECTIONS = 4
+    CAMPAIGN_RATE_LIMIT = 50
+    CAMPAIGN_BATCH_SIZE = 500
+    # Background jobs ('flask worker')
+    WORKER_CONCURRENCY = 2
+    WORKER_POLL_INTERVAL = 1
+    JOB_VISIBILITY_TIMEOUT = 300
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_BACKOFF = 10
+    # Bounce processing ('flask ingest-bounces')
+    BOUNCE_BATCH_SIZE = 1000
+    # Data retention ('flask purge-members' and the purge_members job)
+    PURGE_UNSUBSCRIBED_AFTER_DAYS = 30
+    PURGE_STALE_AFTER_DAYS = None  # also purge members added this many days ago; None keeps them
+    PURGE_CHUNK_SIZE = 500
+    PURGE_PAUSE = 0.2  # seconds between chunks, so sign-ups get the write lock in between
+    PURGE_INTERVAL_HOURS = 24
+    # Schema migrations ('flask migrate')
+    MIGRATION_BATCH_SIZE = 1000
+    MIGRATION_PAUSE = 0.1  # seconds between backfill batches
+    MIGRATION_LOCK_TIMEOUT = 5  # seconds DDL waits for a table lock on PostgreSQL
 
 
 class ProductionConfig(Config):
@@ -34,3 +98,9 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URI',
                                         default=f"sqlite:///{os.path.join(BASEDIR, 'instance', 'test.db')}")
     WTF_CSRF_ENABLED = False
+    EMAIL_FILTER_PATH = None
+    PURGE_PAUSE = 0
+    MIGRATION_PAUSE = 0
+    BCRYPT_LOG_ROUNDS = 4
+    RATELIMIT_ENABLED = False
+    RATELIMIT_STORAGE = 'memory'
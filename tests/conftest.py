@@ -1,5 +1,8 @@
 import pytest
 import os
+import email
+import socketserver
+import threading
 from datetime import datetime
 from sqlalchemy.orm import Session
 from yord_website import create_app, db
@@ -51,23 +54,25 @@ def init_database(test_client):
 
     yield
 
+    # Forget the rows loaded in this test, whose ids the next test's rows will reuse
+    db.session.remove()
     db.drop_all()
 
 @pytest.fixture(scope='function')
 def log_in_default_user(test_client, init_database):
-    test_client.post('/auth/login',
+    test_client.post('/login',
                      data={'username': 'test_user', 'password': 'test123$'}) 
     
     yield
 
-    test_client.get('/auth/logout')
+    test_client.get('/logout')
 
 @pytest.fixture(scope='function')
 def log_in_test_user(test_client):
-    test_client.post('/auth/login', data={'email': 'test_user', 'password': 'test123$'})
+    test_client.post('/login', data={'email': 'test_user', 'password': 'test123$'})
     yield
 
-    test_client.get('/auth/logout')
+    test_client.get('/logout')
 
 @pytest.fixture(scope='module')
 def cli_test_client():
@@ -83,9 +88,70 @@ def init_empty_database(test_client):
     db.create_all()
 
     yield
-    
+
+    db.session.remove()
     db.drop_all()
 
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to send messages, which are kept on the server."""
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost fake SMTP server')
+        lines = None
+
+        for raw_line in self.rfile:
+            line = raw_line.decode('utf-8', 'replace').rstrip('\r\n')
+            if lines is not None:
+                if line == '.':
+                    self.server.messages.append(email.message_from_string('\n'.join(lines)))
+                    lines = None
+                    self.reply('250 OK')
+                else:
+                    lines.append(line[1:] if line.startswith('.') else line)
+                continue
+
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'RCPT' and self.server.reject_code:
+                self.reply(f'{self.server.reject_code} Recipient rejected')
+            elif command == 'DATA':
+                lines = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('utf-8'))
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.port = self.server_address[1]
+        self.messages = []
+        self.connections = 0
+        self.reject_code = None
+
+
+@pytest.fixture(scope='function')
+def smtp_server():
+    server = FakeSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
 def pytest_addoption(parser):
     parser.addoption('--minpass', type=int, default=0, help='minimum amount of tests to pass')
 
@@ -95,3 +95,55 @@ def test_missing_username_login(test_client_request):
     with test_client_request.test_request_context("/login", method="POST", data={"username": "", "password":"test123$"}):
         request.form["username"] == ['Please fill in this field.']
 
+
+
+def test_login_when_password_hashing_is_saturated(test_client, init_database):
+    """
+    GIVEN a Flask application configured for testing whose password hashing pool is full
+    WHEN the '/login' page is posted to
+    THEN the '503' status code is returned with a Retry-After header, without waiting for a thread
+    """
+    from flask import current_app
+    from yord_website.passwords import PasswordHasherBusy
+
+    class SaturatedHasher:
+        def check(self, password_hash, password):
+            raise PasswordHasherBusy(retry_after=2)
+
+    hasher = current_app.extensions.get('password_hasher')
+    current_app.extensions['password_hasher'] = SaturatedHasher()
+    try:
+        response = test_client.post('/login', data=dict(username='test_user', password='test123$'))
+    finally:
+        current_app.extensions['password_hasher'] = hasher
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert b"Please try again in a few seconds" in response.data
+
+
+def test_login_rate_limited(test_client, init_database):
+    """
+    GIVEN a Flask application configured for testing with a limit of 2 login attempts per username
+    WHEN a third login for the same username is posted straight away
+    THEN the '429' status code is returned with a Retry-After header, while other usernames can still try
+    """
+    from flask import current_app
+    from yord_website.ratelimit import get_backend
+
+    config = current_app.config
+    get_backend().reset()
+    config.update(RATELIMIT_ENABLED=True, RATELIMIT_LOGIN_ACCOUNT='2/minute')
+    try:
+        for _ in range(2):
+            response = test_client.post('/login', data=dict(username='someone', password='wrong'))
+            assert response.status_code == 200
+        response = test_client.post('/login', data=dict(username='Someone', password='wrong'))
+        other = test_client.post('/login', data=dict(username='someone.else', password='wrong'))
+    finally:
+        config.update(RATELIMIT_ENABLED=False, RATELIMIT_LOGIN_ACCOUNT='5/minute')
+        get_backend().reset()
+
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+    assert other.status_code == 200
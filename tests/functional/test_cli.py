@@ -4,6 +4,8 @@ This file (test_cli.py) contains the functional tests for the CLI (Command-Line
 
 import pytest
 
+from yord_website.migrations import latest_version
+
 
 def test_initialize_database(cli_test_client):
     """
@@ -15,6 +17,146 @@ def test_initialize_database(cli_test_client):
     assert output.exit_code == 0
     assert 'Initialized the database!' in output.output
 
+def test_bootstrap_db(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask bootstrap-db' command is called twice from the command line with an admin user
+    THEN the schema version is outputted, and the admin user is only added to an empty users table
+    """
+    cli_test_client.invoke(args=['init_db'])
+    output = cli_test_client.invoke(args=['bootstrap-db', '--admin-username', 'admin', '--admin-password', 'secret'])
+    assert output.exit_code == 0
+    assert f'The database is at schema version {latest_version()}.' in output.output
+    assert 'Added the admin user admin.' in output.output
+
+    output = cli_test_client.invoke(args=['bootstrap-db', '--admin-username', 'admin', '--admin-password', 'secret'])
+    assert output.exit_code == 0
+    assert 'Added the admin user' not in output.output
+
+def test_migrate(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing, with a bootstrapped database
+    WHEN the 'flask migrate' command is called from the command line
+    THEN no migrations are applied, as the tables were created from the current models, and all are listed as applied
+    """
+    cli_test_client.invoke(args=['init_db'])
+    cli_test_client.invoke(args=['bootstrap-db'])
+    output = cli_test_client.invoke(args=['migrate'])
+    assert output.exit_code == 0
+    assert f'Applied 0 migrations; the database is at schema version {latest_version()}.' in output.output
+
+    output = cli_test_client.invoke(args=['migrate', '--list'])
+    assert output.exit_code == 0
+    assert 'pending' not in output.output
+    assert 'applied' in output.output
+
+def test_startup_profile(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask startup-profile' command is called from the command line
+    THEN the time taken by each phase of starting the app and the slowest imports are outputted
+    """
+    output = cli_test_client.invoke(args=['startup-profile', '--top', '3'])
+    assert output.exit_code == 0
+    assert 'import yord_website' in output.output
+    assert 'create_app: extensions' in output.output
+    assert 'Slowest imports' in output.output
+
+def test_recount_members(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask recount-members' command is called from the command line
+    THEN the number of members on the mailing list is outputted
+    """
+    output = cli_test_client.invoke(args=['recount-members'])
+    assert output.exit_code == 0
+    assert 'The mailing list has 0 members.' in output.output
+
+def test_export_members(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask export-members' command is called from the command line
+    THEN the mailing list is written out as CSV
+    """
+    output = cli_test_client.invoke(args=['export-members', '--format', 'csv'])
+    assert output.exit_code == 0
+    assert 'id,name,email,date_added' in output.output
+
+def test_import_members(cli_test_client, tmp_path):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask import-members' command is called from the command line with a CSV file
+    THEN a report of the inserted, updated and rejected rows is outputted
+    """
+    csv_file = tmp_path / 'members.csv'
+    csv_file.write_text('name,email\nCli Import,cli.import@gmails.com\nNo Email,\n')
+
+    output = cli_test_client.invoke(args=['import-members', str(csv_file)])
+    assert output.exit_code == 0
+    assert 'Inserted 1, updated 0, rejected 1.' in output.output
+    assert 'Line 3 rejected' in output.output
+
+def test_member_changes(cli_test_client, tmp_path):
+    """
+    GIVEN a Flask application configured for testing and a member who has been imported
+    WHEN the 'flask member-changes' command is called from the command line
+    THEN the change log is outputted as NDJSON followed by the cursor to resume from
+    """
+    csv_file = tmp_path / 'members.csv'
+    csv_file.write_text('name,email\nCli Changes,cli.changes@gmails.com\n')
+    cli_test_client.invoke(args=['init_db'])
+    assert cli_test_client.invoke(args=['import-members', str(csv_file)]).exit_code == 0
+
+    output = cli_test_client.invoke(args=['member-changes', '--since', '0'])
+    assert output.exit_code == 0
+    assert '"operation": "insert"' in output.output
+    assert 'cli.changes@gmails.com' in output.output
+    assert 'Next cursor:' in output.output
+
+def test_rebuild_rollups(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask rebuild-rollups' command is called from the command line
+    THEN the daily sign-up totals are rebuilt and the number of days is outputted
+    """
+    output = cli_test_client.invoke(args=['rebuild-rollups'])
+    assert output.exit_code == 0
+    assert 'Rebuilt the sign-up totals for' in output.output
+
+def test_find_duplicates(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask find-duplicates' command is called from the command line
+    THEN a CSV report of possible duplicates is outputted
+    """
+    output = cli_test_client.invoke(args=['find-duplicates', '--limit', '10'])
+    assert output.exit_code == 0
+    assert 'score,reason,keep_id' in output.output
+    assert 'possible duplicates.' in output.output
+
+def test_purge_members_dry_run(cli_test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'flask purge-members --dry-run' command is called from the command line
+    THEN the number of members who would be purged is outputted and nobody is deleted
+    """
+    output = cli_test_client.invoke(args=['purge-members', '--dry-run'])
+    assert output.exit_code == 0
+    assert 'members would be purged.' in output.output
+
+def test_ingest_bounces(cli_test_client, tmp_path):
+    """
+    GIVEN a Flask application configured for testing and an mbox file with a bounce for an unknown address
+    WHEN the 'flask ingest-bounces' command is called from the command line
+    THEN the mailbox is read and the number of members flagged is outputted
+    """
+    mbox = tmp_path / 'bounces.mbox'
+    mbox.write_text('From MAILER-DAEMON Thu Jan  1 00:00:00 2026\n'
+                    'From: mailer-daemon@mx.example.com\nX-Failed-Recipients: nobody@example.com\n\nFailed.\n')
+    output = cli_test_client.invoke(args=['ingest-bounces', str(mbox)])
+    assert output.exit_code == 0
+    assert 'Read 1 messages with 1 failed recipients; flagged 0 members as bounced.' in output.output
+
 @pytest.mark.skip(reason="takes too long to run")
 def test_run_all_tests(cli_test_client):
     """
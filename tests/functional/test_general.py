@@ -54,6 +54,40 @@ def test_contact(test_client):
 
     assert response.status_code == 200
 
+def test_contact_query_queued(test_client, init_database):
+    """
+    GIVEN a Flask application has been configured for testing
+    WHEN a query is submitted (POST) on the '/contact' page
+    THEN the query is added to the outbox and acknowledged straight away
+    """
+    from yord_website import db
+    from yord_website.models import OutboxMessage, Job
+
+    response = test_client.post('/contact', data={'name': 'Jane Doe', 'email': 'jane.doe@gmails.com',
+                                                  'query': 'When is the next event?'})
+
+    assert response.status_code == 200
+    assert b"Thanks for getting in touch!" in response.data
+    message = db.session.scalars(db.select(OutboxMessage)).one()
+    assert (message.email, message.body, message.status) == ('jane.doe@gmails.com', 'When is the next event?', 'pending')
+    assert db.session.scalars(db.select(Job.name)).all() == ['deliver_outbox']
+
+def test_contact_name_with_line_break_rejected(test_client, init_database):
+    """
+    GIVEN a Flask application has been configured for testing
+    WHEN a query is submitted (POST) on the '/contact' page with a line break in the name
+    THEN the form is shown again with an error and nothing is added to the outbox
+    """
+    from yord_website import db
+    from yord_website.models import OutboxMessage
+
+    response = test_client.post('/contact', data={'name': 'Jane Doe\r\nBcc: everyone@gmails.com', 'email': 'jane.doe@gmails.com',
+                                                  'query': 'When is the next event?'})
+
+    assert response.status_code == 200
+    assert b"Name must be on one line." in response.data
+    assert db.session.scalars(db.select(OutboxMessage)).all() == []
+
 def test_about(test_client):
     """
     GIVEN a Flask application has been configured for testing
@@ -107,7 +141,58 @@ def test_signup_action_success(test_client, init_database):
     assert response.request.path == '/confirm'
     assert b"Thank you for subscribing" in response.data
 
+def test_signup_action_email_registered(test_client, init_database):
+    """
+    GIVEN a Flask application has been configured for testing
+    WHEN the '/home' is posted to with an email address already on the mailing list in a different case
+    THEN the 'already registered' alert is displayed
+    """
+    data = {"name":'Jane Doe', "email":'Jane.Doe@Gmails.com'}
+    response = test_client.post('/home', data=data, follow_redirects=True)
+
+    assert response.status_code == 200
+    assert response.request.path == '/home'
+    assert b"This email is already registered." in response.data
+
+def test_metrics(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the '/metrics' page is requested (GET)
+    THEN the number of members and the job queue depth are returned in the Prometheus text format
+    """
+    response = test_client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b"yord_members 1" in response.data
+    assert b'yord_jobs{status="ready"} 0' in response.data
+    assert b"yord_jobs_oldest_ready_age_seconds 0.000" in response.data
+
+def test_metrics_with_token(test_client, init_database, monkeypatch):
+    """
+    GIVEN a Flask application configured with a metrics token
+    WHEN the '/metrics' page is requested (GET) by a scraper which isn't logged in, with and without the token
+    THEN the metrics are only returned with the right token
+    """
+    monkeypatch.setitem(test_client.application.config, 'METRICS_TOKEN', 'scrape-secret')
+
+    assert test_client.get('/metrics').status_code == 401
+    assert test_client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = test_client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b"yord_members 1" in response.data
+
 # Unhappy path
+def test_metrics_logged_out(test_client, init_database):
+    """
+    GIVEN a Flask application has been configured for testing, with no metrics token
+    WHEN the '/metrics' page is requested (GET) without logging in
+    THEN a '401' (Unauthorized) status code is returned and no metrics are shown
+    """
+    response = test_client.get('/metrics')
+    assert response.status_code == 401
+    assert b"yord_members" not in response.data
+
 def test_about_page_method_not_allowed(test_client):
     """
     GIVEN a Flask application has been configured for testing
@@ -213,3 +298,74 @@ def test_register_improper_email(test_client_request, init_database, log_in_defa
     """
     with test_client_request.test_request_context("/home", method="POST", data={"name": "Pat Butcher", "email":"pat.butcher.gmails.com"}):
         request.form["email"] == ['Please enter a valid email address.']                
+
+def test_join_list(test_client, init_database):
+    """
+    GIVEN a Flask application configured for testing with a mailing list
+    WHEN the list's '/join/<slug>' page is requested (GET) and submitted (POST) twice with the same details
+    THEN the first sign-up is confirmed and the second is told the email is already on the list
+    """
+    from yord_website.lists import create_list
+    create_list('Events')
+
+    response = test_client.get('/join/events')
+    assert b"Join Events" in response.data
+
+    data = dict(name='New Person', email='new.person@gmails.com')
+    response = test_client.post('/join/events', data=data)
+    assert response.status_code == 302
+    assert b"/confirm" in response.data
+
+    response = test_client.post('/join/events', data=data)
+    assert b"This email is already on Events" in response.data
+
+    assert test_client.get('/join/unknown').status_code == 404
+
+def test_unsubscribe_link(test_client, init_database):
+    """
+    GIVEN a Flask application configured for testing and a member's signed unsubscribe link
+    WHEN the link is opened (GET), then confirmed (POST) without a session, and a tampered link is opened
+    THEN the member is only unsubscribed by the POST, and the tampered link is rejected
+    """
+    from yord_website import db
+    from yord_website.models import Member
+    from yord_website.unsubscribe import unsubscribe_token
+    token = unsubscribe_token(1, 'jane.doe@gmails.com')
+
+    response = test_client.get(f'/unsubscribe/{token}')
+    assert b"Unsubscribe from our mailing list?" in response.data
+    assert db.session.get(Member, 1).unsubscribed_at is None
+
+    response = test_client.post(f'/unsubscribe/{token}', data={'List-Unsubscribe': 'One-Click'})
+    assert response.status_code == 200
+    assert b"You have been unsubscribed" in response.data
+    db.session.expire_all()
+    assert db.session.get(Member, 1).unsubscribed_at is not None
+
+    response = test_client.get(f'/unsubscribe/{token[:-3]}abc')
+    assert response.status_code == 400
+
+def test_signup_rate_limited(test_client, init_database):
+    """
+    GIVEN a Flask application configured for testing with a limit of one sign-up per IP address
+    WHEN the home page is posted to twice, and then requested (GET)
+    THEN the second sign-up gets the '429' status code with Retry-After, and the page itself isn't limited
+    """
+    from flask import current_app
+    from yord_website.ratelimit import get_backend
+
+    config = current_app.config
+    get_backend().reset()
+    config.update(RATELIMIT_ENABLED=True, RATELIMIT_SIGNUP='1/hour')
+    try:
+        first = test_client.post('/home', data=dict(name='First Person', email='first@gmails.com'))
+        second = test_client.post('/home', data=dict(name='Second Person', email='second@gmails.com'))
+        page = test_client.get('/home')
+    finally:
+        config.update(RATELIMIT_ENABLED=False, RATELIMIT_SIGNUP='5/minute')
+        get_backend().reset()
+
+    assert first.status_code == 302
+    assert second.status_code == 429
+    assert second.headers['Retry-After'] == '3600'
+    assert page.status_code == 200
@@ -178,4 +178,370 @@ def test_edit_email_exceeds_max_length(test_client_request, init_database, log_i
         """    
         with test_client_request.test_request_context("/mailing/edit/1", method="POST", data={"name": "Jane Doey", "email": long_email}):
             request.form["email"] == ['Email address must be between 3 and 255 characters.']
-            
\ No newline at end of file
+            
+def test_view_members_pagination(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    AND there are more members than fit on one page
+    WHEN the second page of the mailing list is requested (GET) by page number and by cursor
+    THEN the page range navigation and the members on the second page are displayed
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    for number in range(10):
+        db.session.add(Member(f'Paged Member {number}', f'paged.member.{number}@gmails.com'))
+    db.session.commit()
+
+    response = test_client.get('/mailing/members')
+    html = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert 'page=2&amp;after=' in html
+    assert 'Paged Member 6' in html
+    assert 'Paged Member 7' not in html
+
+    response = test_client.get('/mailing/members?page=2')
+    html = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert 'Paged Member 7' in html
+    assert 'Paged Member 6' not in html
+
+def test_view_members_invalid_cursor(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the mailing list is requested (GET) with a cursor which cannot be decoded
+    THEN the user is redirected to the page without the cursor
+    """
+    response = test_client.get('/mailing/members?page=2&after=garbage', follow_redirects=True)
+
+    assert response.status_code == 200
+    assert response.request.path == '/mailing/members'
+
+def test_export_members(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the '/mailing/export' page is requested (GET)
+    THEN the mailing list is downloaded as a CSV file
+    """
+    response = test_client.get('/mailing/export')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'members.csv' in response.headers['Content-Disposition']
+    assert b'jane.doe@gmails.com' in response.data
+
+def test_export_members_invalid_date(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the '/mailing/export' page is requested (GET) with a date which cannot be parsed
+    THEN the '400' (Bad Request) status code is returned
+    """
+    response = test_client.get('/mailing/export?since=last-week')
+
+    assert response.status_code == 400
+
+def test_export_not_logged_in(test_client):
+    """
+    GIVEN a Flask application is configured for testing
+    WHEN the '/mailing/export' page is requested (GET) by an anonymous user
+    THEN the mailing list is not downloaded
+    """
+    response = test_client.get('/mailing/export', follow_redirects=True)
+
+    assert response.mimetype == 'text/html'
+
+def test_import_members_upload(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN a CSV file of members is posted to the '/mailing/import' page (POST)
+    THEN the import report is displayed
+    """
+    import io
+    csv_file = b'name,email\nPolly Pocket,polly.pocket@gmails.com\nJane Doe,jane.doe@gmails.com\nNo Email,\n'
+    data = {'file': (io.BytesIO(csv_file), 'members.csv')}
+    response = test_client.post('/mailing/import', data=data, content_type='multipart/form-data')
+    html = response.data.decode('utf-8')
+
+    assert response.status_code == 200
+    assert '<td>1</td>\n                    <td>1</td>\n                    <td>1</td>' in html
+
+def test_import_members_wrong_file_type(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN a file which isn't a CSV file is posted to the '/mailing/import' page (POST)
+    THEN a validation error is displayed
+    """
+    import io
+    data = {'file': (io.BytesIO(b'not a csv'), 'members.txt')}
+    response = test_client.post('/mailing/import', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert b"Please upload a CSV file." in response.data
+
+def test_view_members_search(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the mailing list is searched (GET)
+    THEN only the matching members are displayed
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    db.session.add(Member('Polly Pocket', 'polly.pocket@gmails.com'))
+    db.session.commit()
+
+    response = test_client.get('/mailing/members?q=poll')
+    html = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert 'polly.pocket@gmails.com' in html
+    assert 'jane.doe@gmails.com' not in html
+
+    response = test_client.get('/mailing/members?q=nobody')
+    assert b"No members match your search." in response.data
+
+def test_view_members_sorted_and_filtered(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the mailing list is requested (GET) sorted by name and filtered by email domain
+    THEN only the matching members are displayed and the filters are kept in the page links
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    db.session.add_all([Member('Zed Pocket', 'zed@yopmail.com'), Member('Amy Pocket', 'amy@yopmail.com')])
+    db.session.commit()
+
+    response = test_client.get('/mailing/members?sort=name&domain=yopmail.com')
+    html = response.data.decode('utf-8')
+
+    assert response.status_code == 200
+    assert 'jane.doe@gmails.com' not in html
+    assert html.index('amy@yopmail.com') < html.index('zed@yopmail.com')
+
+def test_view_members_invalid_sort(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the mailing list is requested (GET) sorted by an unknown key
+    THEN the '400' (Bad Request) status code is returned
+    """
+    response = test_client.get('/mailing/members?sort=password')
+
+    assert response.status_code == 400
+
+def test_batch_members_json(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN a batch of deletes and updates is posted (POST) as JSON
+    THEN the changes are applied and the outcome of each row is returned as JSON
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    members = [Member('Bounce One', 'bounce1@gmails.com'), Member('Bounce Two', 'bounce2@gmails.com')]
+    db.session.add_all(members)
+    db.session.commit()
+    ids = [member.id for member in members]
+
+    response = test_client.post('/mailing/batch', json={'delete': ids, 'update': [{'id': 9999, 'name': 'Nobody'}]})
+
+    assert response.status_code == 200
+    assert response.json == {'deleted': 2, 'updated': 0, 'errors': [{'id': 9999, 'errors': ['Member not found.']}]}
+    assert db.session.scalar(db.select(db.func.count()).select_from(Member)) == 1
+
+def test_batch_members_form(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN members selected on the mailing list page are deleted (POST)
+    THEN the members are removed and the user is redirected to the mailing list
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    member = Member('Bounce One', 'bounce1@gmails.com')
+    db.session.add(member)
+    db.session.commit()
+
+    response = test_client.post('/mailing/batch', data={'id': [member.id]}, follow_redirects=True)
+
+    assert response.status_code == 200
+    assert b'bounce1@gmails.com' not in response.data
+    assert b'jane.doe@gmails.com' in response.data
+
+def test_batch_members_form_stale_id(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN a member who has already been removed is selected on the mailing list page and deleted (POST)
+    THEN the mailing list is shown again with an error
+    """
+    response = test_client.post('/mailing/batch', data={'id': [9999]})
+
+    assert response.status_code == 200
+    assert b'There was an issue deleting the member' in response.data
+    assert b'jane.doe@gmails.com' in response.data
+
+def test_batch_members_invalid_json(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN a batch with member IDs that aren't numbers, or are true or false, is posted (POST)
+    THEN the '400' (Bad Request) status code is returned
+    """
+    response = test_client.post('/mailing/batch', json={'delete': ['1; DROP TABLE members']})
+
+    assert response.status_code == 400
+
+    response = test_client.post('/mailing/batch', json={'delete': [True]})
+
+    assert response.status_code == 400
+
+def test_api_members(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the mailing list is requested (GET) as JSON, a page at a time
+    THEN each page of members is returned with a cursor for the next page and a weak ETag of its own
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    db.session.add_all([Member('Polly Pocket', 'polly.pocket@gmails.com'), Member('Zed Pocket', 'zed@yopmail.com')])
+    db.session.commit()
+
+    response = test_client.get('/mailing/api/members?per_page=2')
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('W/')
+    assert response.json['total'] == 3
+    assert [member['email'] for member in response.json['members']] == ['jane.doe@gmails.com', 'polly.pocket@gmails.com']
+
+    etag = response.headers['ETag']
+
+    # The first page's ETag doesn't match the second page
+    response = test_client.get(f"/mailing/api/members?per_page=2&after={response.json['next']}", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [member['email'] for member in response.json['members']] == ['zed@yopmail.com']
+    assert response.json['next'] is None
+
+def test_api_members_not_modified(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the JSON mailing list is requested (GET) again with the ETag of the previous response
+    THEN '304' (Not Modified) is returned until a member is added, changed or removed
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    etag = test_client.get('/mailing/api/members').headers['ETag']
+    response = test_client.get('/mailing/api/members', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    member = db.session.scalars(db.select(Member)).first()
+    member.name = 'Janet Doe'
+    db.session.commit()
+
+    response = test_client.get('/mailing/api/members', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['members'][0]['name'] == 'Janet Doe'
+    new_etag = response.headers['ETag']
+
+    db.session.delete(member)
+    db.session.commit()
+    assert test_client.get('/mailing/api/members', headers={'If-None-Match': new_etag}).status_code == 200
+
+def test_api_changes(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the changes to the mailing list are requested (GET) after a cursor
+    THEN only the changes made since then are returned, with the cursor to use next time
+    """
+    from yord_website import db
+    from yord_website.models import Member
+
+    cursor = test_client.get('/mailing/api/changes').json['cursor']
+    member = db.session.scalars(db.select(Member)).first()
+    db.session.delete(member)
+    db.session.commit()
+
+    response = test_client.get(f'/mailing/api/changes?since={cursor}')
+
+    assert response.status_code == 200
+    assert [(change['operation'], change['email']) for change in response.json['changes']] == [('delete', 'jane.doe@gmails.com')]
+    assert response.json['cursor'] > cursor
+    assert response.json['has_more'] is False
+
+def test_dashboard(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the sign-ups dashboard is requested (GET)
+    THEN the sign-ups per week are shown
+    """
+    response = test_client.get('/mailing/dashboard?days=30')
+
+    assert response.status_code == 200
+    assert b"Week starting" in response.data
+    assert b"1 sign-ups and 0 removals in the last 30 days." in response.data
+
+def test_dashboard_invalid_period(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application has been configured for testing and the user is logged in
+    WHEN the sign-ups dashboard is requested (GET) with an unknown period
+    THEN the '400' (Bad Request) status code is returned
+    """
+    response = test_client.get('/mailing/dashboard?period=fortnight')
+
+    assert response.status_code == 400
+
+def test_view_lists(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a Flask application configured for testing and the user is logged in
+    WHEN a mailing list is added on the '/mailing/lists' page (POST), and then added again
+    THEN the list is shown with its member count, and the repeat is refused
+    """
+    response = test_client.post('/mailing/lists', data={'name': 'Youth Convention'}, follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Youth Convention" in response.data
+    assert b"/join/youth-convention" in response.data
+
+    response = test_client.post('/mailing/lists', data={'name': 'youth convention'})
+    assert b"There is already a mailing list with that name" in response.data
+
+def test_view_list_members(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a mailing list with one member on it
+    WHEN the list's members page is requested (GET)
+    THEN only that member is shown, with links to edit and remove them scoped to the list
+    """
+    from yord_website.lists import create_list, join_list
+    join_list(create_list('Parents'), 1)
+
+    response = test_client.get('/mailing/lists/parents/members')
+    assert response.status_code == 200
+    assert b"jane.doe@gmails.com" in response.data
+    assert b"john.doe@gmails.com" not in response.data
+    assert b"/mailing/lists/parents/edit/1" in response.data
+    assert b"/mailing/lists/parents/remove/1" in response.data
+
+    assert test_client.get('/mailing/lists/unknown/members').status_code == 404
+
+def test_edit_and_remove_list_member(test_client, init_database, log_in_default_user):
+    """
+    GIVEN a mailing list with one member on it
+    WHEN the member is edited from the list, someone not on it is edited, and the member is removed
+    THEN edits return to the list, members of other lists can't be edited from it, and removal leaves them on the main list
+    """
+    from yord_website import db
+    from yord_website.lists import create_list, join_list, list_member_count
+    from yord_website.models import Member
+    parents = create_list('Parents')
+    join_list(parents, 1)
+
+    response = test_client.post('/mailing/lists/parents/edit/1', data={'name': 'Janey Doe', 'email': 'janey@gmails.com'}, follow_redirects=True)
+    assert response.request.path == '/mailing/lists/parents/members'
+    assert b"janey@gmails.com" in response.data
+
+    response = test_client.get('/mailing/lists/parents/edit/2', follow_redirects=True)
+    assert response.request.path == '/mailing/lists/parents/members'
+
+    response = test_client.get('/mailing/lists/parents/remove/1')
+    assert response.status_code == 302
+    assert list_member_count(parents) == 0
+    assert db.session.get(Member, 1) is not None
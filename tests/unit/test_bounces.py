@@ -0,0 +1,109 @@
+"""
+This file (test_bounces.py) contains the unit tests for flagging bounced members in the bounces.py file.
+"""
+
+import os
+from yord_website import db
+from yord_website.bounces import mbox_messages, maildir_messages, mailbox_messages, failed_recipients, ingest_bounces
+from yord_website.campaigns import recipient_batches
+from yord_website.models import Member
+
+
+def dsn(recipient, action='failed', status='5.1.1'):
+    return f"""From: MAILER-DAEMON@mx.example.com
+To: news@yord.local
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="BOUNDARY"
+
+--BOUNDARY
+Content-Type: text/plain
+
+Your message could not be delivered.
+
+--BOUNDARY
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.com
+
+Final-Recipient: rfc822; {recipient}
+Action: {action}
+Status: {status}
+
+--BOUNDARY
+Content-Type: message/rfc822
+
+From: news@yord.local
+To: {recipient}
+Subject: News
+
+From the archive: this line would be escaped in a real mbox.
+
+--BOUNDARY--
+"""
+
+
+def write_mbox(path, messages):
+    with open(path, 'w') as file:
+        for message in messages:
+            file.write('From MAILER-DAEMON Thu Jan  1 00:00:00 2026\n')
+            file.write(message.replace('\nFrom the archive', '\n>From the archive'))
+            file.write('\n')
+
+
+def test_failed_recipients():
+    """
+    GIVEN bounce messages for a permanent failure, a delay and a server using X-Failed-Recipients
+    WHEN their failed recipients are read
+    THEN only the permanent failures are returned, normalised
+    """
+    from email import message_from_string
+    assert failed_recipients(message_from_string(dsn('Jane.Doe@gmails.com'))) == {'jane.doe@gmails.com'}
+    assert failed_recipients(message_from_string(dsn('jane.doe@gmails.com', 'delayed', '4.2.2'))) == set()
+
+    exim = message_from_string('From: mailer-daemon@mx\nX-Failed-Recipients: john.doe@gmails.com\n\nFailed.\n')
+    assert failed_recipients(exim) == {'john.doe@gmails.com'}
+
+
+def test_mbox_and_maildir_messages(tmp_path):
+    """
+    GIVEN the same bounces in an mbox file and a Maildir directory
+    WHEN the messages are read from each
+    THEN every message is returned once from both
+    """
+    messages = [dsn(f'member{number}@gmails.com') for number in range(3)]
+    write_mbox(tmp_path / 'bounces.mbox', messages)
+    for folder in ('new', 'cur', 'tmp'):
+        os.makedirs(tmp_path / 'Maildir' / folder)
+    for number, message in enumerate(messages):
+        (tmp_path / 'Maildir' / ('new' if number else 'cur') / f'{number}.eml').write_text(message)
+
+    from_mbox = [failed_recipients(message) for message in mbox_messages(tmp_path / 'bounces.mbox')]
+    from_maildir = [failed_recipients(message) for message in maildir_messages(tmp_path / 'Maildir')]
+
+    assert sorted(map(sorted, from_mbox)) == sorted(map(sorted, from_maildir)) == [[f'member{number}@gmails.com'] for number in range(3)]
+    assert len(list(mailbox_messages(str(tmp_path / 'Maildir')))) == 3
+
+
+def test_ingest_bounces(test_client, init_empty_database, tmp_path):
+    """
+    GIVEN members, and an mbox with hard bounces for some of them, a repeat, a delay and an unknown address
+    WHEN the bounces are ingested in small batches
+    THEN each bounced member is flagged once and campaigns no longer go to them
+    """
+    db.session.add_all([Member(f'Member {number}', f'member{number}@gmails.com') for number in range(5)])
+    db.session.commit()
+    write_mbox(tmp_path / 'bounces.mbox',
+               [dsn('member0@gmails.com'), dsn('MEMBER1@gmails.com'), dsn('member0@gmails.com'),
+                dsn('member2@gmails.com', 'delayed', '4.4.1'), dsn('stranger@gmails.com')])
+
+    reports = []
+    report = ingest_bounces(mbox_messages(tmp_path / 'bounces.mbox'), batch_size=2,
+                            progress_callback=lambda report: reports.append(report.flagged))
+
+    assert (report.messages, report.bounces, report.flagged) == (5, 4, 2)
+    assert reports == [2, 2]
+    bounced = db.session.scalars(db.select(Member.email).where(Member.bounced_at.is_not(None)).order_by(Member.email)).all()
+    assert bounced == ['member0@gmails.com', 'member1@gmails.com']
+    recipients = [row.email for batch in recipient_batches(0, 10) for row in batch]
+    assert recipients == ['member2@gmails.com', 'member3@gmails.com', 'member4@gmails.com']
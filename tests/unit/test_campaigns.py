@@ -0,0 +1,83 @@
+"""
+This file (test_campaigns.py) contains the unit tests for sending newsletter campaigns in the campaigns.py file.
+"""
+
+import time
+import pytest
+from jinja2 import TemplateError
+from yord_website import db
+from yord_website.campaigns import TokenBucket, create_campaign, send_campaign
+from yord_website.mail import SMTPPool
+from yord_website.models import Member, CampaignDelivery
+
+
+def add_members(count):
+    db.session.add_all([Member(f'Member {number}', f'member{number}@gmails.com') for number in range(count)])
+    db.session.commit()
+
+
+def test_send_campaign(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN a mailing list of 25 members and a campaign
+    WHEN the campaign is sent over several SMTP connections
+    THEN every member receives one email rendered from the template, over reused connections
+    """
+    add_members(25)
+    campaign = create_campaign('News', 'Hello {{ name }}!')
+    reports = []
+
+    progress = send_campaign(campaign, SMTPPool('127.0.0.1', smtp_server.port, size=3), 'news@yord.local',
+                             connections=3, batch_size=10, progress_callback=lambda progress: reports.append(progress.sent))
+
+    assert (progress.sent, progress.failed) == (25, 0)
+    assert reports == [10, 20, 25]
+    assert sorted(message['To'] for message in smtp_server.messages) == sorted(f'member{number}@gmails.com' for number in range(25))
+    assert 'Hello Member 0!' in next(message for message in smtp_server.messages if message['To'] == 'member0@gmails.com').get_payload()
+    assert smtp_server.connections <= 3
+    assert (campaign.status, campaign.sent_count) == ('sent', 25)
+
+
+def test_send_campaign_resumes_without_duplicates(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN a campaign whose previous run died part way through a batch
+    WHEN the campaign is sent again
+    THEN only the members after the checkpoint are emailed and the interrupted deliveries aren't resent
+    """
+    add_members(6)
+    campaign = create_campaign('News', 'Hello {{ name }}!')
+    first_ids = db.session.scalars(db.select(Member.id).order_by(Member.id).limit(2)).all()
+    db.session.add_all([CampaignDelivery(campaign_id=campaign.id, member_id=member_id, status='sending') for member_id in first_ids])
+    campaign.status = 'sending'
+    campaign.last_member_id = first_ids[-1]
+    db.session.commit()
+
+    progress = send_campaign(campaign, SMTPPool('127.0.0.1', smtp_server.port), 'news@yord.local', connections=2)
+
+    assert (progress.sent, progress.skipped) == (4, 2)
+    assert len(smtp_server.messages) == 4
+    statuses = db.session.scalars(db.select(CampaignDelivery.status).order_by(CampaignDelivery.member_id)).all()
+    assert statuses == ['unknown', 'unknown', 'sent', 'sent', 'sent', 'sent']
+
+
+def test_create_campaign_invalid_template(test_client, init_empty_database):
+    """
+    GIVEN a campaign template with a syntax error
+    WHEN the campaign is created
+    THEN an error is raised
+    """
+    with pytest.raises(TemplateError):
+        create_campaign('News', 'Hello {{ name }!')
+
+
+def test_token_bucket_limits_rate():
+    """
+    GIVEN a token bucket allowing 100 events per second with no bursts
+    WHEN 20 tokens are taken
+    THEN it takes at least the time needed to refill them
+    """
+    bucket = TokenBucket(100, capacity=1)
+    started = time.monotonic()
+    for _ in range(20):
+        bucket.acquire()
+
+    assert time.monotonic() - started >= 0.18
@@ -0,0 +1,52 @@
+"""
+This file (test_changes.py) contains the unit tests for the member change feed in the changes.py file.
+"""
+
+from yord_website import db
+from yord_website.models import Member
+from yord_website.changes import changes_since, latest_change
+from yord_website.members import register_member, apply_member_batch
+
+
+def test_changes_since(test_client, init_empty_database):
+    """
+    GIVEN an empty mailing list
+    WHEN members are added, changed and removed through the ORM and the bulk operations
+    THEN every change is logged in order, with deletes as tombstones
+    """
+    jane = Member('Jane Doe', 'jane.doe@gmails.com')
+    db.session.add(jane)
+    db.session.commit()
+    john_id = register_member('John Doe', 'john.doe@gmails.com')
+    jane.name = 'Janet Doe'
+    db.session.commit()
+    apply_member_batch(delete_ids=[john_id])
+
+    changes, cursor = changes_since(0)
+
+    assert [(change['operation'], change['email']) for change in changes] == [
+        ('insert', 'jane.doe@gmails.com'),
+        ('insert', 'john.doe@gmails.com'),
+        ('update', 'jane.doe@gmails.com'),
+        ('delete', 'john.doe@gmails.com'),
+    ]
+    assert changes[0]['member']['name'] == 'Janet Doe'
+    assert changes[1]['member'] is None and changes[3]['member'] is None
+    assert cursor == latest_change() == changes[-1]['seq']
+
+
+def test_changes_since_cursor(test_client, init_empty_database):
+    """
+    GIVEN a change log with several changes
+    WHEN the changes after a cursor are requested a page at a time
+    THEN only the later changes are returned and an empty page keeps the cursor
+    """
+    for number in range(3):
+        register_member(f'Member {number}', f'member{number}@gmails.com')
+
+    first, cursor = changes_since(0, limit=2)
+    rest, cursor = changes_since(cursor, limit=2)
+    empty, final_cursor = changes_since(cursor)
+
+    assert [change['email'] for change in first + rest] == ['member0@gmails.com', 'member1@gmails.com', 'member2@gmails.com']
+    assert empty == [] and final_cursor == cursor
@@ -0,0 +1,142 @@
+"""
+This file (test_counters.py) contains the unit tests for the cached member count in the counters.py file.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from yord_website import db
+from yord_website.dialects import begin_write
+from yord_website.events import members_inserted
+from yord_website.models import Member, Counter
+from yord_website.counters import member_count, members_version, reset_counter, member_count_query, MEMBER_COUNT
+
+
+def test_member_count_seeded_from_table(test_client, init_empty_database):
+    """
+    GIVEN a database with members but no member counter
+    WHEN the member count is read
+    THEN the counter is seeded from the members table
+    """
+    db.session.add_all([Member('Jane Doe', 'jane.doe@gmails.com'), Member('John Doe', 'john.doe@gmails.com')])
+    db.session.commit()
+
+    assert member_count() == 2
+    assert db.session.get(Counter, MEMBER_COUNT).value == 2
+
+
+def test_member_count_seeding_waits_for_writers(test_client, init_empty_database):
+    """
+    GIVEN a member being added in another transaction while the member counter hasn't been seeded
+    WHEN the member count is read before that transaction commits
+    THEN seeding waits for it, so the new member is counted rather than missed by both
+    """
+    app = test_client.application
+    results = []
+    members = Member.__table__
+    row = {'name': 'Jane Doe', 'email': 'jane.doe@gmails.com', 'email_domain': 'gmails.com',
+           'date_added': datetime.now(timezone.utc)}
+
+    def read_count():
+        with app.app_context():
+            results.append(member_count())
+            db.session.remove()
+
+    with db.engine.connect() as connection:
+        begin_write(connection)
+        member_id = connection.execute(db.insert(members).values(**row).returning(members.c.id)).scalar()
+        members_inserted(connection, [dict(row, id=member_id)])
+        reader = threading.Thread(target=read_count)
+        reader.start()
+        time.sleep(0.2)
+        assert results == []
+        connection.commit()
+    reader.join()
+
+    assert results == [1]
+    assert member_count() == 1
+
+
+def test_member_count_leaves_session_alone(test_client, init_empty_database):
+    """
+    GIVEN a transaction in progress in the session
+    WHEN the member counter is seeded
+    THEN the session's transaction isn't committed
+    """
+    db.session.scalar(db.select(db.func.count()).select_from(Member))
+    assert member_count() == 0
+    assert db.session().in_transaction()
+    db.session.rollback()
+
+
+def test_member_count_follows_inserts_and_deletes(test_client, init_empty_database):
+    """
+    GIVEN a seeded member counter
+    WHEN members are added and removed
+    THEN the member count is kept up to date without counting the table
+    """
+    assert member_count() == 0
+
+    member = Member('Jane Doe', 'jane.doe@gmails.com')
+    db.session.add_all([member, Member('John Doe', 'john.doe@gmails.com')])
+    db.session.commit()
+    assert member_count() == 2
+
+    db.session.delete(member)
+    db.session.commit()
+    assert member_count() == 1
+
+
+def test_member_count_after_rollback(test_client, init_empty_database):
+    """
+    GIVEN a seeded member counter
+    WHEN a new member is flushed and the transaction is rolled back
+    THEN the member count is unchanged
+    """
+    assert member_count() == 0
+
+    db.session.add(Member('Jane Doe', 'jane.doe@gmails.com'))
+    db.session.flush()
+    db.session.rollback()
+
+    assert member_count() == 0
+
+
+def test_reset_counter(test_client, init_empty_database):
+    """
+    GIVEN a member counter which has drifted from the members table
+    WHEN the counter is reset
+    THEN it matches the number of rows in the members table again
+    """
+    db.session.add(Member('Jane Doe', 'jane.doe@gmails.com'))
+    db.session.commit()
+    assert member_count() == 1
+
+    db.session.execute(db.update(Counter).where(Counter.name == MEMBER_COUNT).values(value=40))
+    db.session.commit()
+
+    assert reset_counter(MEMBER_COUNT, member_count_query()) == 1
+
+
+def test_members_version_changes_with_members(test_client, init_empty_database):
+    """
+    GIVEN a seeded members version
+    WHEN members are added, changed and removed
+    THEN the version changes each time
+    """
+    versions = [members_version()]
+
+    member = Member('Jane Doe', 'jane.doe@gmails.com')
+    db.session.add(member)
+    db.session.commit()
+    versions.append(members_version())
+
+    member.name = 'Janet Doe'
+    db.session.commit()
+    versions.append(members_version())
+
+    db.session.delete(member)
+    db.session.commit()
+    versions.append(members_version())
+
+    assert len(set(versions)) == 4
@@ -0,0 +1,79 @@
+"""
+This file (test_duplicates.py) contains the unit tests for finding and merging duplicate members in the mailing/duplicates.py file.
+"""
+
+from yord_website import db
+from yord_website.models import Member
+from yord_website.mailing.duplicates import clean_address, name_key, similarity, find_duplicates, merge_members
+
+
+def test_clean_address():
+    """
+    GIVEN email addresses with gmail dots, plus-tags and a misspelt domain
+    WHEN they are cleaned
+    THEN they all become the same address
+    """
+    assert clean_address('Jane.Doe+news@googlemail.com') == ('janedoe@gmail.com', 'janedoe')
+    assert clean_address('janedoe@gmial.com') == ('janedoe@gmail.com', 'janedoe')
+    assert clean_address('jane.doe@yopmail.com') == ('jane.doe@yopmail.com', 'jane.doe')
+
+
+def test_name_key():
+    """
+    GIVEN names written in different orders, cases and with accents
+    WHEN their keys are calculated
+    THEN they are the same
+    """
+    assert name_key('Zoë  Smith-Jones') == name_key('jones, smith ZOE') == 'jones smith zoe'
+
+
+def test_similarity():
+    """
+    GIVEN strings which are the same, differ by a typo and have nothing in common
+    WHEN their similarity is calculated
+    THEN the scores are ordered accordingly
+    """
+    assert similarity('jane.doe@gmail.com', 'jane.doe@gmail.com') == 1.0
+    assert similarity('jane.doe@gmail.com', 'jane.dow@gmail.com') > 0.85
+    assert similarity('jane.doe@gmail.com', 'xyz@qq.cn') < 0.2
+
+
+def test_find_duplicates(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with members who signed up twice in different ways, and members who are different people
+    WHEN duplicates are searched for
+    THEN only the duplicated members are reported, with the earlier sign-up to keep, best match first
+    """
+    db.session.add_all([
+        Member('Jane Doe', 'jane.doe@gmail.com'),
+        Member('John Smith', 'john.smith@yopmail.com'),
+        Member('Amy Pond', 'amy@yopmail.com'),
+        Member('jane doe', 'janedoe+news@gmial.com'),
+        Member('John Smith', 'john.smiht@yopmail.com'),
+        Member('Rory Williams', 'rory@gmails.com'),
+    ])
+    db.session.commit()
+
+    candidates = find_duplicates(threshold=0.8)
+
+    assert [(candidate.keep.email, candidate.duplicate.email) for candidate in candidates] == [
+        ('jane.doe@gmail.com', 'janedoe+news@gmial.com'),
+        ('john.smith@yopmail.com', 'john.smiht@yopmail.com'),
+    ]
+    assert candidates[0].score == 1.0
+
+
+def test_merge_members(test_client, init_empty_database):
+    """
+    GIVEN a member who signed up twice
+    WHEN the duplicate is merged into the original, which takes the duplicate's email address
+    THEN the duplicate is deleted and the original updated in one batch
+    """
+    original, duplicate = Member('Jane Doe', 'jane.doe@gmail.com'), Member('Jane Doe', 'jane@doe.com')
+    db.session.add_all([original, duplicate])
+    db.session.commit()
+
+    result = merge_members(original.id, [duplicate.id], email='jane@doe.com')
+
+    assert (result.deleted, result.updated, result.errors) == (1, 1, [])
+    assert db.session.scalars(db.select(Member.email)).all() == ['jane@doe.com']
@@ -0,0 +1,84 @@
+"""
+This file (test_email_filter.py) contains the unit tests for the shared filter of member emails in the email_filter.py file.
+"""
+
+import pytest
+from flask import current_app
+from yord_website import db
+from yord_website.email_filter import EmailFilter, build_email_filter, get_email_filter, possibly_registered
+from yord_website.members import register_member, apply_member_batch
+from yord_website.models import Member
+
+
+@pytest.fixture(scope='function')
+def email_filter_path(test_client, tmp_path):
+    current_app.config['EMAIL_FILTER_PATH'] = str(tmp_path / 'email-filter.bin')
+
+    yield current_app.config['EMAIL_FILTER_PATH']
+
+    current_app.extensions.pop('email_filter').close()
+    current_app.config['EMAIL_FILTER_PATH'] = None
+
+
+def test_email_filter(tmp_path):
+    """
+    GIVEN a counting Bloom filter
+    WHEN addresses are added and removed
+    THEN added addresses are always reported as possible members and removed ones no longer are
+    """
+    email_filter = EmailFilter(str(tmp_path / 'filter.bin'), capacity=1000)
+    email_filter.build(['jane.doe@gmails.com'])
+    email_filter.add(['john.doe@gmails.com'])
+
+    assert email_filter.might_contain('Jane.Doe@gmails.com')
+    assert email_filter.might_contain('john.doe@gmails.com')
+    assert not email_filter.might_contain('someone.else@gmails.com')
+
+    email_filter.remove(['john.doe@gmails.com'])
+    assert not email_filter.might_contain('john.doe@gmails.com')
+    email_filter.close()
+
+
+def test_email_filter_shared_between_processes(tmp_path):
+    """
+    GIVEN a filter file opened by one worker
+    WHEN another worker opens the same file and adds an address
+    THEN the first worker sees the address without reloading anything
+    """
+    path = str(tmp_path / 'filter.bin')
+    first, second = EmailFilter(path, capacity=1000), EmailFilter(path, capacity=1000)
+    first.build([])
+
+    second.add(['jane.doe@gmails.com'])
+
+    assert first.built
+    assert first.might_contain('jane.doe@gmails.com')
+    first.close()
+    second.close()
+
+
+def test_register_member_with_email_filter(test_client, init_empty_database, email_filter_path):
+    """
+    GIVEN a mailing list with one member and the email filter turned on
+    WHEN members sign up, including a repeat of an existing address, and a member is removed
+    THEN every address is a possible repeat until the filter is built, which it then follows, and duplicates are still turned away
+    """
+    db.session.add(Member('Jane Doe', 'jane.doe@gmails.com'))
+    db.session.commit()
+
+    # Sign-ups don't build the filter themselves
+    assert possibly_registered('john.doe@gmails.com')
+    assert not get_email_filter().built
+
+    assert build_email_filter()
+    assert not build_email_filter()
+    assert possibly_registered('jane.doe@gmails.com')
+    assert not possibly_registered('john.doe@gmails.com')
+
+    john_id = register_member('John Doe', 'john.doe@gmails.com')
+    assert possibly_registered('john.doe@gmails.com')
+    assert register_member('Jane Doe', 'JANE.DOE@gmails.com') is None
+
+    apply_member_batch(delete_ids=[john_id])
+    assert not possibly_registered('john.doe@gmails.com')
+    assert register_member('John Doe', 'john.doe@gmails.com') is not None
@@ -0,0 +1,87 @@
+"""
+This file (test_export.py) contains the unit tests for the streaming mailing list export in the mailing/export.py file.
+"""
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+from yord_website import db
+from yord_website.models import Member
+from yord_website.mailing.export import export_members, parse_date
+import pytest
+
+
+def add_members():
+    for month in range(1, 4):
+        member = Member(f'Member {month}', f'member.{month}@gmails.com')
+        member.date_added = datetime(2024, month, 1, 9, 30, tzinfo=timezone.utc)
+        db.session.add(member)
+    db.session.commit()
+
+
+def test_parse_date():
+    """
+    GIVEN a date without a timezone
+    WHEN it is parsed
+    THEN it is treated as UTC
+    """
+    assert parse_date('2024-02-01') == datetime(2024, 2, 1, tzinfo=timezone.utc)
+    assert parse_date('') is None
+
+    with pytest.raises(ValueError):
+        parse_date('yesterday')
+
+
+def test_export_csv(test_client, init_empty_database):
+    """
+    GIVEN a database with members
+    WHEN the mailing list is exported as CSV
+    THEN a header row and one row per member are written in the order they were added
+    """
+    add_members()
+
+    output = b''.join(export_members('csv')).decode('utf-8')
+    rows = list(csv.reader(io.StringIO(output)))
+
+    assert rows[0] == ['id', 'name', 'email', 'date_added']
+    assert [row[1] for row in rows[1:]] == ['Member 1', 'Member 2', 'Member 3']
+
+
+def test_export_ndjson_date_range(test_client, init_empty_database):
+    """
+    GIVEN a database with members added in different months
+    WHEN the mailing list is exported as NDJSON for a date range
+    THEN only the members added in that range are written
+    """
+    add_members()
+
+    output = b''.join(export_members('ndjson', since=parse_date('2024-02-01'), until=parse_date('2024-03-01')))
+    records = [json.loads(line) for line in output.decode('utf-8').splitlines()]
+
+    assert len(records) == 1
+    assert records[0]['email'] == 'member.2@gmails.com'
+
+
+def test_export_gzip(test_client, init_empty_database):
+    """
+    GIVEN a database with members
+    WHEN the mailing list is exported with compression
+    THEN the output is valid gzip containing the CSV export
+    """
+    add_members()
+
+    compressed = b''.join(export_members('csv', compress=True))
+
+    assert gzip.decompress(compressed) == b''.join(export_members('csv'))
+
+
+def test_export_unknown_format(test_client, init_empty_database):
+    """
+    GIVEN a database with members
+    WHEN the mailing list is exported in an unsupported format
+    THEN a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        export_members('xml')
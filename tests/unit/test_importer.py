@@ -0,0 +1,73 @@
+"""
+This file (test_importer.py) contains the unit tests for the bulk member import in the mailing/importer.py file.
+"""
+
+import io
+from yord_website import db
+from yord_website.models import Member
+from yord_website.counters import member_count
+from yord_website.mailing.importer import import_members
+from conftest import long_name
+
+
+def test_import_new_members(test_client, init_empty_database):
+    """
+    GIVEN an empty mailing list
+    WHEN a CSV file of new members is imported in several batches
+    THEN every member is inserted and the member count is updated
+    """
+    assert member_count() == 0
+    rows = ''.join(f'Member {number},member.{number}@gmails.com\n' for number in range(25))
+
+    report = import_members(io.StringIO('Name,Email\n' + rows), batch_size=10)
+
+    assert (report.inserted, report.updated, report.rejected) == (25, 0, 0)
+    assert db.session.scalar(db.select(db.func.count()).select_from(Member)) == 25
+    assert member_count() == 25
+
+
+def test_import_updates_existing_members(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with an existing member
+    WHEN a CSV file containing that member's email address is imported
+    THEN the existing member's name is updated rather than a duplicate being added
+    """
+    db.session.add(Member('Jane Doe', 'jane.doe@gmails.com'))
+    db.session.commit()
+
+    csv_file = 'name,email\nJane Smith,jane.doe@gmails.com\nJohn Doe,john.doe@gmails.com\n'
+    report = import_members(io.StringIO(csv_file))
+
+    assert (report.inserted, report.updated, report.rejected) == (1, 1, 0)
+    member = db.session.execute(db.select(Member).filter_by(email='jane.doe@gmails.com')).scalar_one()
+    db.session.refresh(member)
+    assert member.name == 'Jane Smith'
+
+
+def test_import_rejects_invalid_rows(test_client, init_empty_database):
+    """
+    GIVEN a CSV file with some rows which fail the sign-up form's validation
+    WHEN the file is imported
+    THEN the invalid rows are rejected with their line numbers and errors
+    AND the valid rows are inserted
+    """
+    csv_file = f'name,email\nJane Doe,jane.doe@gmails.com\nNo Email,\n{long_name},long.name@gmails.com\nBad Email,bad.email\n'
+    report = import_members(io.StringIO(csv_file))
+
+    assert (report.inserted, report.updated, report.rejected) == (1, 0, 3)
+    assert [line_number for line_number, errors in report.rejections] == [3, 4, 5]
+    assert 'Please enter a valid email address.' in report.rejections[2][1]
+
+
+def test_import_duplicate_rows_in_file(test_client, init_empty_database):
+    """
+    GIVEN a CSV file containing the same email address twice
+    WHEN the file is imported
+    THEN only one member is added, with the name from the later row
+    """
+    csv_file = 'name,email\nJane Doe,jane.doe@gmails.com\nJane Smith,jane.doe@gmails.com\n'
+    report = import_members(io.StringIO(csv_file))
+
+    assert report.inserted == 1
+    member = db.session.execute(db.select(Member).filter_by(email='jane.doe@gmails.com')).scalar_one()
+    assert member.name == 'Jane Smith'
@@ -0,0 +1,141 @@
+"""
+This file (test_jobs.py) contains the unit tests for the background job queue in the jobs.py file.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from yord_website import db
+from yord_website.jobs import task, enqueue, claim_job, run_job, run_worker, queue_stats, heartbeat
+from yord_website.models import Job
+
+calls = []
+
+
+@task('test_record')
+def record(value):
+    calls.append((value, threading.current_thread().name))
+
+
+@task('test_long')
+def long_running(takeover=False):
+    heartbeat()
+    calls.append(db.session.scalar(db.select(Job.run_at)))
+    if takeover:
+        # Another worker claims the job, as though this one had stopped responding
+        claim_job(30, now=datetime.now(timezone.utc) + timedelta(days=1))
+    heartbeat()
+    calls.append('finished')
+
+
+@task('test_fail')
+def fail():
+    raise RuntimeError('Something went wrong')
+
+
+def test_run_worker(test_client, init_empty_database):
+    """
+    GIVEN several queued jobs
+    WHEN a worker with two threads runs until the queue is empty
+    THEN every job is run exactly once and marked as done
+    """
+    calls.clear()
+    for value in range(10):
+        enqueue('test_record', value=value)
+
+    run_worker(current_app._get_current_object(), concurrency=2, once=True)
+
+    assert sorted(value for value, _ in calls) == list(range(10))
+    assert set(db.session.scalars(db.select(Job.status))) == {'done'}
+    assert queue_stats()['ready'] == 0
+
+
+def test_failed_job_is_retried_then_given_up(test_client, init_empty_database):
+    """
+    GIVEN a queued job whose task raises an error, with two attempts allowed
+    WHEN it is claimed and run until it runs out of attempts
+    THEN it is queued again with a backoff after the first failure and marked as failed after the second
+    """
+    job = enqueue('test_fail', max_attempts=2)
+    now = datetime.now(timezone.utc)
+
+    assert run_job(claim_job(60), retry_backoff=10) is False
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert 'Something went wrong' in job.last_error
+    assert claim_job(60) is None
+
+    assert run_job(claim_job(60, now=now + timedelta(seconds=15)), retry_backoff=10) is False
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert queue_stats()['failed'] == 1
+
+
+def test_expired_claim_is_taken_over(test_client, init_empty_database):
+    """
+    GIVEN a job claimed by a worker which has stopped responding
+    WHEN its visibility timeout passes
+    THEN another worker claims it, and the first worker can no longer record an outcome
+    """
+    calls.clear()
+    enqueue('test_record', value='late')
+    now = datetime.now(timezone.utc)
+
+    first = claim_job(30, now=now)
+    assert claim_job(30, now=now + timedelta(seconds=10)) is None
+    second = claim_job(30, now=now + timedelta(seconds=31))
+
+    assert (first.id, second.attempts) == (second.id, 2)
+    assert run_job(second, retry_backoff=10) is True
+    run_job(first, retry_backoff=10)
+    job = db.session.get(Job, first.id)
+    assert (job.status, job.attempts) == ('done', 2)
+
+
+def test_heartbeat_extends_claim(test_client, init_empty_database):
+    """
+    GIVEN a running job whose task calls heartbeat() as it goes
+    WHEN the task runs past its original claim
+    THEN the claim is extended by the visibility timeout so no other worker takes the job over
+    """
+    calls.clear()
+    enqueue('test_long')
+    now = datetime.now(timezone.utc)
+    job = claim_job(1, now=now)
+
+    assert run_job(job, retry_backoff=10) is True
+    extended = calls[0].replace(tzinfo=timezone.utc)
+    assert extended >= now + timedelta(seconds=current_app.config['JOB_VISIBILITY_TIMEOUT'])
+    assert calls[1] == 'finished'
+    heartbeat()  # does nothing outside a job
+
+
+def test_heartbeat_after_takeover(test_client, init_empty_database):
+    """
+    GIVEN a running job which another worker has taken over
+    WHEN its task calls heartbeat()
+    THEN JobLost stops the task, and the other worker's claim is left alone
+    """
+    calls.clear()
+    job = enqueue('test_long', takeover=True)
+
+    assert run_job(claim_job(30), retry_backoff=10) is False
+    assert 'finished' not in calls
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('running', 2)
+
+
+def test_queue_stats(test_client, init_empty_database):
+    """
+    GIVEN a job which has been ready for a minute and one due in the future
+    WHEN the queue statistics are read
+    THEN only the ready job is counted and its age is reported
+    """
+    now = datetime.now(timezone.utc)
+    enqueue('test_record', run_at=now - timedelta(seconds=60), value=1)
+    enqueue('test_record', run_at=now + timedelta(hours=1), value=2)
+
+    stats = queue_stats(now)
+
+    assert stats['ready'] == 1
+    assert 59 <= stats['oldest_ready_age'] <= 61
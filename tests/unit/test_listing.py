@@ -0,0 +1,135 @@
+"""
+This file (test_listing.py) contains the unit tests for searching, filtering and sorting the mailing list in the mailing/listing.py file.
+"""
+
+from datetime import datetime, timezone
+from werkzeug.datastructures import MultiDict
+from yord_website import db
+from yord_website.models import Member
+from yord_website.mailing.listing import MemberListing
+import pytest
+
+
+def add_members():
+    members = [
+        ('Charlie Brown', 'charlie@peanuts.com', 1),
+        ('Alice Liddell', 'alice@wonderland.org', 2),
+        ('Bob Builder', 'bob@peanuts.com', 3),
+        ('Dora Explorer', 'dora@peanuts.com', 4),
+    ]
+    for name, email, month in members:
+        member = Member(name, email)
+        member.date_added = datetime(2024, month, 1, tzinfo=timezone.utc)
+        db.session.add(member)
+    db.session.commit()
+
+
+def names(page):
+    return [member.name for member in page.items]
+
+
+def test_member_email_domain():
+    """
+    GIVEN a Member model
+    WHEN a new Member is created
+    THEN the domain of their email address is recorded
+    """
+    assert Member('Jane Doe', 'Jane.Doe@Gmails.COM').email_domain == 'gmails.com'
+
+
+def test_listing_from_args():
+    """
+    GIVEN query string arguments for the mailing list
+    WHEN a listing is created from them
+    THEN the arguments needed to recreate the listing omit the defaults
+    """
+    listing = MemberListing.from_args(MultiDict({'q': ' jane ', 'domain': '@Gmails.com', 'since': '2024-02-01', 'sort': 'date'}))
+
+    assert listing.domain == 'gmails.com'
+    assert listing.args == {'q': 'jane', 'domain': 'gmails.com', 'since': '2024-02-01'}
+
+
+def test_listing_invalid_args():
+    """
+    GIVEN query string arguments with an unknown sort key, order or date
+    WHEN a listing is created from them
+    THEN a ValueError is raised
+    """
+    for args in ({'sort': 'password'}, {'order': 'sideways'}, {'until': 'soon'}):
+        with pytest.raises(ValueError):
+            MemberListing.from_args(MultiDict(args))
+
+
+def test_listing_sort_by_name_descending(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the listing is sorted by name in descending order over several pages
+    THEN the members are returned in reverse alphabetical order
+    """
+    add_members()
+    listing = MemberListing(sort='name', order='desc')
+
+    first = listing.paginate(3)
+    assert names(first) == ['Dora Explorer', 'Charlie Brown', 'Bob Builder']
+
+    second = listing.paginate(3, page=2, after=first.next_cursor)
+    assert names(second) == ['Alice Liddell']
+
+    back = listing.paginate(3, page=1, before=second.prev_cursor)
+    assert names(back) == names(first)
+
+    assert names(listing.paginate(3, page=2)) == ['Alice Liddell']
+
+
+def test_listing_filter_by_domain_and_date(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the listing is filtered by email domain and date range
+    THEN only the matching members are returned and counted
+    """
+    add_members()
+    listing = MemberListing(domain='peanuts.com',
+                            since=datetime(2024, 2, 1, tzinfo=timezone.utc),
+                            until=datetime(2024, 4, 1, tzinfo=timezone.utc),
+                            sort='email')
+
+    page = listing.paginate(8)
+    assert names(page) == ['Bob Builder']
+    assert page.total == 1
+
+
+def test_listing_total_is_capped(test_client, init_empty_database, monkeypatch):
+    """
+    GIVEN more members matching a filter than MEMBER_COUNT_LIMIT
+    WHEN the listing is paginated
+    THEN only up to the limit is counted, the total is a lower bound and the pages grow as later ones are visited
+    """
+    add_members()
+    monkeypatch.setitem(test_client.application.config, 'MEMBER_COUNT_LIMIT', 2)
+    listing = MemberListing(domain='peanuts.com', sort='email')
+
+    first = listing.paginate(1)
+    assert first.total == 2 and not first.total_exact
+    assert first.pages == 2
+
+    third = listing.paginate(1, page=3)
+    assert names(third) == ['Dora Explorer']
+    assert third.pages == 3
+
+    monkeypatch.setitem(test_client.application.config, 'MEMBER_COUNT_LIMIT', 3)
+    page = listing.paginate(1)
+    assert page.total == 3 and page.total_exact
+    assert page.pages == 3
+
+
+def test_listing_sort_by_id(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the listing is sorted by member ID as rows of selected columns
+    THEN the rows are returned in the order the members were added
+    """
+    add_members()
+    listing = MemberListing(sort='id')
+
+    page = listing.paginate(8, columns=(Member.id, Member.name))
+    assert [row.name for row in page.items] == ['Charlie Brown', 'Alice Liddell', 'Bob Builder', 'Dora Explorer']
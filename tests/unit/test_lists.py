@@ -0,0 +1,108 @@
+"""
+This file (test_lists.py) contains the unit tests for the separate mailing lists in the lists.py file.
+"""
+
+from yord_website import db
+from yord_website.models import Member, ListMembership
+from yord_website.lists import (create_list, get_list, slugify, join_list, leave_list, list_member_count,
+                                is_on_list, paginate_list)
+from yord_website.members import subscribe_member, apply_member_batch
+from yord_website.counters import member_count
+
+
+def test_create_list(test_client, init_empty_database):
+    """
+    GIVEN an empty database
+    WHEN a mailing list is created, and then another with the same name in a different case
+    THEN the first is saved with a slug and the second is refused
+    """
+    mailing_list = create_list('Youth Convention 2026')
+
+    assert mailing_list.slug == 'youth-convention-2026'
+    assert get_list('youth-convention-2026').name == 'Youth Convention 2026'
+    assert create_list('youth convention 2026') is None
+    assert slugify('  Parents & Guardians! ') == 'parents-guardians'
+
+
+def test_subscribe_member(test_client, init_empty_database):
+    """
+    GIVEN a mailing list
+    WHEN a new person signs up to it, then signs up again, then an existing member signs up
+    THEN new people join the main mailing list too, repeats are turned away and the counts follow
+    """
+    parents = create_list('Parents')
+    db.session.add(Member('John Doe', 'john.doe@gmails.com'))
+    db.session.commit()
+
+    jane_id, joined = subscribe_member(parents, 'Jane Doe', 'jane.doe@gmails.com')
+    assert joined
+    assert subscribe_member(parents, 'Jane Doe', 'Jane.Doe@gmails.com') == (jane_id, False)
+    john_id, joined = subscribe_member(parents, 'John Doe', 'john.doe@gmails.com')
+    assert joined
+
+    assert member_count() == 2
+    assert list_member_count(parents) == 2
+    assert is_on_list(parents, jane_id) and is_on_list(parents, john_id)
+
+
+def test_leave_list(test_client, init_empty_database):
+    """
+    GIVEN a member on two mailing lists
+    WHEN they leave one of them
+    THEN they stay on the main mailing list and the other list
+    """
+    events, parents = create_list('Events'), create_list('Parents')
+    member_id, _ = subscribe_member(events, 'Jane Doe', 'jane.doe@gmails.com')
+    join_list(parents, member_id)
+
+    assert leave_list(events, [member_id]) == 1
+    assert leave_list(events, [member_id]) == 0
+
+    assert list_member_count(events) == 0
+    assert list_member_count(parents) == 1
+    assert member_count() == 1
+
+
+def test_deleting_member_leaves_lists(test_client, init_empty_database):
+    """
+    GIVEN members on several mailing lists
+    WHEN they are deleted one at a time and in a batch
+    THEN their memberships are removed and every list's count follows
+    """
+    events, parents = create_list('Events'), create_list('Parents')
+    jane_id, _ = subscribe_member(events, 'Jane Doe', 'jane.doe@gmails.com')
+    john_id, _ = subscribe_member(events, 'John Doe', 'john.doe@gmails.com')
+    join_list(parents, jane_id)
+    join_list(parents, john_id)
+    assert list_member_count(events) == list_member_count(parents) == 2
+
+    db.session.delete(db.session.get(Member, jane_id))
+    db.session.commit()
+    assert list_member_count(events) == list_member_count(parents) == 1
+
+    apply_member_batch(delete_ids=[john_id])
+    assert list_member_count(events) == list_member_count(parents) == 0
+    assert db.session.scalar(db.select(db.func.count()).select_from(ListMembership)) == 0
+
+
+def test_paginate_list(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with some, but not all, of the members on it
+    WHEN its members are paged through in the order they joined
+    THEN only the list's members are returned, with the list's count as the total
+    """
+    events = create_list('Events')
+    for number in range(5):
+        member_id, _ = subscribe_member(events, f'Member {number}', f'member{number}@gmails.com')
+    db.session.add(Member('Not On List', 'elsewhere@gmails.com'))
+    db.session.commit()
+
+    first = paginate_list(events, 2)
+    assert [row.name for row in first.items] == ['Member 0', 'Member 1']
+    assert first.total == 5 and first.pages == 3
+
+    second = paginate_list(events, 2, page=2, after=first.next_cursor)
+    assert [row.name for row in second.items] == ['Member 2', 'Member 3']
+
+    newest = paginate_list(events, 2, descending=True)
+    assert [row.name for row in newest.items] == ['Member 4', 'Member 3']
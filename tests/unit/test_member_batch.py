@@ -0,0 +1,86 @@
+"""
+This file (test_member_batch.py) contains the unit tests for bulk edits and deletes in the members.py file.
+"""
+
+from yord_website import db
+from yord_website.models import Member
+from yord_website.members import apply_member_batch
+from yord_website.counters import member_count
+
+
+def add_members(*emails):
+    members = [Member('Member', email) for email in emails]
+    db.session.add_all(members)
+    db.session.commit()
+    return [member.id for member in members]
+
+
+def test_apply_member_batch(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with several members
+    WHEN a batch deleting some members and updating others is applied
+    THEN all of the changes are made and the member count is updated
+    """
+    ids = add_members('a@gmails.com', 'b@gmails.com', 'c@gmails.com', 'd@gmails.com')
+
+    result = apply_member_batch(delete_ids=ids[:2], updates=[{'id': ids[2], 'name': 'Carol'},
+                                                             {'id': ids[3], 'email': 'Dave@Yopmail.com'}])
+
+    assert (result.deleted, result.updated, result.errors) == (2, 2, [])
+    assert member_count() == 2
+    assert db.session.get(Member, ids[0]) is None
+    assert db.session.get(Member, ids[2]).name == 'Carol'
+    dave = db.session.get(Member, ids[3])
+    assert (dave.email, dave.email_domain) == ('dave@yopmail.com', 'yopmail.com')
+
+
+def test_apply_member_batch_reports_errors(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with several members
+    WHEN a batch containing invalid, missing and conflicting rows is applied
+    THEN the other rows are still applied and each rejected row is reported
+    """
+    ids = add_members('a@gmails.com', 'b@gmails.com', 'c@gmails.com')
+
+    result = apply_member_batch(delete_ids=[ids[0], 9999], updates=[{'id': ids[1], 'email': 'not an email'},
+                                                                     {'id': ids[2], 'email': 'B@gmails.com'},
+                                                                     {'id': ids[1]},
+                                                                     {'name': 'No ID'}])
+
+    assert (result.deleted, result.updated) == (1, 0)
+    errors = {(error['id'], error['errors'][0]) for error in result.errors}
+    assert (9999, 'Member not found.') in errors
+    assert (ids[2], 'This email address is already registered.') in errors
+    assert (None, 'A member ID is required.') in errors
+    assert len(result.errors) == 5
+    assert db.session.get(Member, ids[2]).email == 'c@gmails.com'
+
+
+def test_apply_member_batch_rejects_values_which_are_not_text(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with a member
+    WHEN a batch sets the member's name to a list, or gives true as a member ID
+    THEN the rows are reported as errors and nothing is changed
+    """
+    ids = add_members('a@gmails.com')
+
+    result = apply_member_batch(updates=[{'id': ids[0], 'name': ['a']}, {'id': True, 'name': 'Bool'}])
+
+    assert result.updated == 0
+    assert [(error['id'], error['errors']) for error in result.errors] == \
+        [(ids[0], ['The name must be text.']), (True, ['A member ID is required.'])]
+    assert db.session.get(Member, ids[0]).name == 'Member'
+
+
+def test_apply_member_batch_reuses_deleted_email(test_client, init_empty_database):
+    """
+    GIVEN a mailing list with two members
+    WHEN a batch deletes one member and gives their email address to the other
+    THEN both changes are applied
+    """
+    ids = add_members('a@gmails.com', 'b@gmails.com')
+
+    result = apply_member_batch(delete_ids=[ids[0]], updates=[{'id': ids[1], 'email': 'a@gmails.com'}])
+
+    assert (result.deleted, result.updated, result.errors) == (1, 1, [])
+    assert db.session.get(Member, ids[1]).email == 'a@gmails.com'
@@ -0,0 +1,190 @@
+"""
+This file (test_migrations.py) contains the unit tests for the schema migrations in the migrations package.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+import sqlalchemy as sa
+from yord_website import db
+from yord_website.bootstrap import bootstrap_database
+from yord_website.migrations import (BASELINE_VERSION, Migrator, MigrationError, load_migrations, latest_version,
+                                     current_schema_version)
+from yord_website.mailing.duplicates import merge_members
+from yord_website.models import Counter, Member, SignupRollup
+from yord_website.search import member_search_filter
+
+
+@pytest.fixture(scope='function')
+def unversioned_database(test_client):
+    """A database with the users and members tables as they were before schema versions were recorded."""
+    db.session.remove()
+    db.drop_all()
+    metadata = sa.MetaData()
+    sa.Table('users', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('email', sa.String(120), unique=True),
+             sa.Column('password_hash', sa.String(256)),
+             sa.Column('authenticated', sa.Boolean))
+    members = sa.Table('members', metadata,
+                       sa.Column('id', sa.Integer, primary_key=True),
+                       sa.Column('name', sa.String(320), nullable=False),
+                       sa.Column('email', sa.String(320), nullable=False, unique=True),
+                       sa.Column('date_added', sa.DateTime(timezone=True)))
+    metadata.create_all(db.engine)
+    with db.engine.begin() as connection:
+        connection.execute(members.insert(), [{'name': f'Member {number}', 'email': f'Member{number}@Example{number % 2}.com',
+                                               'date_added': datetime.now(timezone.utc)} for number in range(5)])
+
+    yield
+
+    db.session.remove()
+    db.drop_all()
+
+
+def test_load_migrations():
+    """
+    GIVEN the migration modules in the migrations package
+    WHEN they are loaded
+    THEN they are in version order after the baseline, each with a description, and the last is the latest version
+    """
+    migrations = load_migrations()
+    versions = [migration.version for migration in migrations]
+    assert versions == sorted(versions)
+    assert versions[0] > BASELINE_VERSION
+    assert all(migration.description for migration in migrations)
+    assert latest_version() == versions[-1]
+
+
+def test_bootstrap_new_database_is_up_to_date(test_client, init_empty_database):
+    """
+    GIVEN a database whose tables were all created from the current models
+    WHEN it is bootstrapped
+    THEN it is recorded at the latest schema version, with no migrations to apply
+    """
+    assert bootstrap_database() == (latest_version(), False)
+    assert Migrator(pause=0).pending() == []
+
+
+def test_migrate_unversioned_database(test_client, unversioned_database):
+    """
+    GIVEN a database set up before schema versions were recorded, with members in it
+    WHEN it is bootstrapped and migrated
+    THEN the member columns and indexes are added, emails are normalised, email domains are filled in in batches,
+    search and the sign-up rollups cover the existing members, and every version is recorded
+    """
+    assert current_schema_version() is None
+    assert bootstrap_database() == (BASELINE_VERSION, False)
+
+    messages = []
+    migrator = Migrator(batch_size=2, pause=0, progress_callback=messages.append)
+    applied = migrator.run()
+
+    assert [migration.version for migration in applied] == [migration.version for migration in load_migrations()]
+    assert current_schema_version() == latest_version()
+    assert 'email_domain: 2 rows, up to id 2' in messages
+    assert 'email_domain: 5 rows, up to id 5' in messages
+    assert db.session.execute(db.select(Member.email_domain, db.func.count()).group_by(Member.email_domain)
+                              .order_by(Member.email_domain)).all() == [('example0.com', 3), ('example1.com', 2)]
+    assert db.session.scalar(db.select(db.func.count()).select_from(Counter)) == 0
+    assert all(not migrator.create_index(index) for index in Member.__table__.indexes)
+    assert not migrator.add_column(Member.__table__.c.bounced_at)
+    assert not migrator.drop_unique_constraint(Member.__table__, ['email'])
+    assert migrator.unique_constraints(Member.__table__, ['email']) == []
+
+    assert db.session.scalars(db.select(Member.email).order_by(Member.id)).first() == 'member0@example0.com'
+    search = member_search_filter(db.session.connection(), 'member3')
+    assert db.session.scalars(db.select(Member.email).where(search)).all() == ['member3@example1.com']
+    assert db.session.scalar(db.select(db.func.sum(SignupRollup.signups))) == 5
+
+    # The search triggers survived rebuilding the table without the constraint
+    db.session.add(Member('Jane Doe', 'jane.doe@gmails.com'))
+    db.session.commit()
+    search = member_search_filter(db.session.connection(), 'jane')
+    assert db.session.scalars(db.select(Member.email).where(search)).all() == ['jane.doe@gmails.com']
+
+    # Migrating again does nothing
+    assert migrator.run() == []
+
+
+def test_backfill_resumes_after_interruption(test_client, unversioned_database):
+    """
+    GIVEN a backfill which fails part way through
+    WHEN the migration is run again
+    THEN it carries on from the last batch which was committed
+    """
+    bootstrap_database()
+    migrator = Migrator(batch_size=2, pause=0)
+    migrator.version = 2
+    members = Member.__table__
+    migrator.add_column(members.c.email_domain)
+
+    def compute(row):
+        if row.id == 4:
+            raise RuntimeError('Interrupted')
+        return {'email_domain': 'done'}
+
+    with pytest.raises(RuntimeError):
+        migrator.backfill('email_domain', members, [members.c.email], members.c.email_domain.is_(None), compute)
+    db.session.rollback()
+    assert db.session.scalar(db.select(Counter.value).where(Counter.name == 'migration:2:email_domain')) == 2
+
+    messages = []
+    migrator.progress_callback = messages.append
+    migrator.run()
+
+    assert 'email_domain: 2 rows, up to id 4' in messages
+    assert 'email_domain: 3 rows, up to id 5' in messages
+    assert db.session.scalars(db.select(Member.email_domain).order_by(Member.id)).all() == \
+        ['done', 'done', 'example0.com', 'example1.com', 'example0.com']
+
+
+def test_migrate_reports_case_duplicates(test_client, unversioned_database):
+    """
+    GIVEN a database from before emails were normalised, with two members whose addresses differ only in case
+    WHEN it is migrated, and again after they have been merged
+    THEN the first migration stops with a MigrationError listing them, and the second succeeds
+    """
+    with db.engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO members (name, email, date_added) VALUES "
+                                   "('Jane Doe', 'Jane@Example.com', CURRENT_TIMESTAMP), ('Jane Doe', 'jane@example.com', CURRENT_TIMESTAMP)"))
+    bootstrap_database()
+    migrator = Migrator(pause=0)
+
+    with pytest.raises(MigrationError, match='jane@example.com: members 6, 7'):
+        migrator.run()
+    assert current_schema_version() == BASELINE_VERSION
+
+    merge_members(6, [7])
+    migrator.run()
+    assert current_schema_version() == latest_version()
+    assert db.session.scalar(db.select(Member.email).where(Member.id == 6)) == 'jane@example.com'
+
+
+def test_unique_index_failure(test_client, unversioned_database):
+    """
+    GIVEN existing rows which break a unique index
+    WHEN the index is created
+    THEN a MigrationError is raised rather than a database error
+    """
+    with db.engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO members (name, email, date_added) VALUES ('Jane Doe', 'member0@example0.com', CURRENT_TIMESTAMP)"))
+    index = next(index for index in Member.__table__.indexes if index.name == 'uq_members_email_lower')
+
+    with pytest.raises(MigrationError, match='uq_members_email_lower'):
+        Migrator(pause=0).create_index(index)
+
+
+def test_migrate_needs_bootstrap(test_client, unversioned_database):
+    """
+    GIVEN a database which hasn't been bootstrapped
+    WHEN it is migrated, or migrated back to an earlier version
+    THEN a MigrationError is raised
+    """
+    with pytest.raises(MigrationError, match='bootstrap-db'):
+        Migrator(pause=0).run()
+
+    bootstrap_database()
+    Migrator(pause=0).run()
+    with pytest.raises(MigrationError, match='cannot be undone'):
+        Migrator(pause=0).run(target=BASELINE_VERSION)
@@ -0,0 +1,127 @@
+"""
+This file (test_outbox.py) contains the unit tests for the email outbox in the outbox.py and mail.py files.
+"""
+
+import socket
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from yord_website import db
+from yord_website.mail import SMTPPool
+from yord_website.models import OutboxMessage
+from yord_website.outbox import enqueue_contact_message, deliver_pending, claim_messages, retry_delay
+
+
+def mail_config(port):
+    return dict(current_app.config, MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USERNAME=None, MAIL_USE_TLS=False)
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_deliver_pending(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN several contact form queries in the outbox
+    WHEN the outbox worker delivers the pending messages
+    THEN every message is sent over a single reused SMTP connection and marked as sent
+    """
+    for number in range(3):
+        enqueue_contact_message('Jane Doe', 'jane.doe@gmails.com', f'Query number {number}')
+    config = mail_config(smtp_server.port)
+    pool = SMTPPool.from_config(config)
+
+    assert deliver_pending(pool, config) == (3, 0)
+    pool.close()
+
+    assert len(smtp_server.messages) == 3
+    assert smtp_server.connections == 1
+    assert smtp_server.messages[0]['Reply-To'] == 'jane.doe@gmails.com'
+    assert 'Query number 0' in smtp_server.messages[0].get_payload()
+    assert {message.status for message in db.session.scalars(db.select(OutboxMessage))} == {'sent'}
+
+
+def test_deliver_pending_retries_with_backoff(test_client, init_empty_database):
+    """
+    GIVEN a contact form query in the outbox and a mail server which can't be reached
+    WHEN the outbox worker tries to deliver it
+    THEN the message stays pending and is retried later, until the attempts run out
+    """
+    message = enqueue_contact_message('Jane Doe', 'jane.doe@gmails.com', 'Hello there')
+    config = dict(mail_config(unused_port()), MAIL_MAX_ATTEMPTS=2, MAIL_RETRY_BACKOFF=30)
+    pool = SMTPPool.from_config(config)
+    now = datetime.now(timezone.utc)
+
+    assert deliver_pending(pool, config, now) == (0, 1)
+    assert message.status == 'pending'
+    assert message.next_attempt_at.replace(tzinfo=timezone.utc) == now + timedelta(seconds=30)
+    assert deliver_pending(pool, config, now) == (0, 0)
+
+    assert deliver_pending(pool, config, now + timedelta(seconds=30)) == (0, 1)
+    assert message.status == 'failed'
+    assert message.attempts == 2
+
+
+def test_deliver_pending_permanent_failure(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN a contact form query in the outbox and a mail server which rejects the recipient
+    WHEN the outbox worker tries to deliver it
+    THEN the message is marked as failed without being retried
+    """
+    message = enqueue_contact_message('Jane Doe', 'jane.doe@gmails.com', 'Hello there')
+    smtp_server.reject_code = 550
+    config = mail_config(smtp_server.port)
+
+    assert deliver_pending(SMTPPool.from_config(config), config) == (0, 1)
+    assert message.status == 'failed'
+    assert message.attempts == 1
+
+
+def test_deliver_pending_bad_message(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN a message in the outbox which can't be made into an email, queued before a good one
+    WHEN the outbox worker delivers the pending messages
+    THEN the bad message is marked as failed and the good one is still sent
+    """
+    bad = enqueue_contact_message('Jane Doe', 'jane.doe@gmails.com', 'Hello there')
+    bad.email = 'jane.doe@gmails.com\r\nBcc: everyone@gmails.com'
+    db.session.commit()
+    good = enqueue_contact_message('John Smith', 'john.smith@gmails.com', 'Hello again')
+    config = mail_config(smtp_server.port)
+
+    assert deliver_pending(SMTPPool.from_config(config), config) == (1, 1)
+    assert (bad.status, good.status) == ('failed', 'sent')
+    assert 'ValueError' in bad.last_error
+    assert len(smtp_server.messages) == 1
+
+
+def test_claim_messages(test_client, init_empty_database):
+    """
+    GIVEN contact form queries in the outbox
+    WHEN two workers claim the due messages, and again after the first claim has run out
+    THEN each message is only claimed by one worker until its claim runs out
+    """
+    for number in range(3):
+        enqueue_contact_message('Jane Doe', 'jane.doe@gmails.com', f'Query number {number}')
+    now = datetime.now(timezone.utc)
+
+    first = claim_messages(now, 2, 300)
+    second = claim_messages(now, 2, 300)
+    assert [message.body for message in first] == ['Query number 0', 'Query number 1']
+    assert [message.body for message in second] == ['Query number 2']
+    assert claim_messages(now, 2, 300) == []
+
+    reclaimed = claim_messages(now + timedelta(seconds=301), 5, 300)
+    assert len(reclaimed) == 3
+    assert {message.attempts for message in reclaimed} == {2}
+
+
+def test_retry_delay():
+    """
+    GIVEN a retry backoff of 30 seconds
+    WHEN the delay before each retry is calculated
+    THEN it doubles after each failed attempt, up to a limit
+    """
+    assert [retry_delay(attempts, 30).total_seconds() for attempts in (1, 2, 3)] == [30, 60, 120]
+    assert retry_delay(50, 30) == timedelta(hours=6)
@@ -0,0 +1,112 @@
+"""
+This file (test_pagination.py) contains the unit tests for the keyset pagination helpers in the pagination.py file.
+"""
+
+from datetime import datetime, timedelta, timezone
+from yord_website import db
+from yord_website.models import Member
+from yord_website.pagination import paginate, page_range, encode_cursor, decode_cursor, InvalidCursor
+import pytest
+
+
+def add_members(count):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for number in range(count):
+        member = Member(f'Member {number}', f'member.{number}@gmails.com')
+        member.date_added = start + timedelta(minutes=number)
+        db.session.add(member)
+    db.session.commit()
+
+
+def test_page_range_small():
+    """
+    GIVEN only a few pages of results
+    WHEN the page range is calculated
+    THEN every page number is included with no gaps
+    """
+    assert page_range(2, 4) == [1, 2, 3, 4]
+
+
+def test_page_range_with_gaps():
+    """
+    GIVEN many pages of results
+    WHEN the page range is calculated for a page in the middle
+    THEN the first, last and neighbouring pages are included with gaps in between
+    """
+    assert page_range(10, 20) == [1, None, 8, 9, 10, 11, 12, None, 20]
+
+
+def test_page_range_no_pages():
+    """
+    GIVEN no results
+    WHEN the page range is calculated
+    THEN no page numbers are returned
+    """
+    assert page_range(1, 0) == []
+
+
+def test_cursor_round_trip():
+    """
+    GIVEN the sort key of a row
+    WHEN it is encoded into a cursor and decoded again
+    THEN the original values are returned
+    """
+    key = [datetime(2024, 5, 1, 12, 30), 42]
+    assert decode_cursor(encode_cursor(key), 2) == key
+
+
+def test_invalid_cursor():
+    """
+    GIVEN a cursor which has been tampered with
+    WHEN it is decoded
+    THEN an InvalidCursor exception is raised
+    """
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor', 2)
+
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([1]), 2)
+
+
+def test_paginate_with_cursors(test_client, init_empty_database):
+    """
+    GIVEN a database with 20 members
+    WHEN the pages are followed using the next and previous cursors
+    THEN each page contains the right members in order of the date they were added
+    """
+    add_members(20)
+    order_by = (Member.date_added, Member.id)
+
+    first = paginate(db.select(Member), order_by, 8, total=20)
+    assert [member.name for member in first.items] == [f'Member {number}' for number in range(8)]
+    assert first.pages == 3
+    assert not first.has_prev
+    assert first.has_next
+
+    second = paginate(db.select(Member), order_by, 8, page=2, after=first.next_cursor)
+    assert [member.name for member in second.items] == [f'Member {number}' for number in range(8, 16)]
+
+    third = paginate(db.select(Member), order_by, 8, page=3, after=second.next_cursor)
+    assert [member.name for member in third.items] == [f'Member {number}' for number in range(16, 20)]
+    assert not third.has_next
+
+    back = paginate(db.select(Member), order_by, 8, page=2, before=third.prev_cursor)
+    assert [member.id for member in back.items] == [member.id for member in second.items]
+    assert back.has_prev and back.has_next
+
+
+def test_paginate_page_jump(test_client, init_empty_database):
+    """
+    GIVEN a database with 20 members
+    WHEN a page is requested by number rather than cursor
+    THEN the same members are returned as when following the cursors
+    """
+    add_members(20)
+    order_by = (Member.date_added, Member.id)
+
+    jumped = paginate(db.select(Member), order_by, 8, page=3)
+    assert [member.name for member in jumped.items] == [f'Member {number}' for number in range(16, 20)]
+    assert jumped.has_prev
+
+    beyond = paginate(db.select(Member), order_by, 8, page=9)
+    assert beyond.items == []
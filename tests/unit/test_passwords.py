@@ -0,0 +1,133 @@
+"""
+This file (test_passwords.py) contains the unit tests for the bounded password hashing pool in the passwords.py file.
+"""
+
+import threading
+import pytest
+from yord_website import db
+from yord_website.models import User, bcrypt
+from yord_website.passwords import PasswordHasher, PasswordHasherBusy, verify_login, get_password_hasher
+
+
+def test_check_and_dummy_hash():
+    """
+    GIVEN a password hasher
+    WHEN a password is hashed and checked, and checked with no hash at all
+    THEN the right password matches, and a missing hash is checked against a dummy of the same cost
+    """
+    hasher = PasswordHasher(rounds=4, workers=1)
+    password_hash = hasher.hash('secret')
+
+    assert hasher.check(password_hash, 'secret')
+    assert not hasher.check(password_hash, 'wrong')
+    assert not hasher.check(None, 'secret')
+    assert hasher.dummy_hash().startswith('$2b$04$')
+    hasher.shutdown()
+
+
+def test_busy_when_saturated():
+    """
+    GIVEN a password hasher with one thread and no queue, whose thread is busy
+    WHEN another password is checked
+    THEN it is refused straight away with PasswordHasherBusy, and accepted once the thread is free
+    """
+    hasher = PasswordHasher(rounds=4, workers=1, queue_size=0, retry_after=3)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    blocker = threading.Thread(target=hasher._run, args=(block,))
+    blocker.start()
+    started.wait(5)
+
+    with pytest.raises(PasswordHasherBusy) as busy:
+        hasher.hash('secret')
+    assert busy.value.retry_after == 3
+
+    release.set()
+    blocker.join()
+    assert hasher.check(hasher.hash('secret'), 'secret')
+    hasher.shutdown()
+
+
+def test_needs_rehash():
+    """
+    GIVEN hashes made with different costs
+    WHEN they are checked against the configured cost
+    THEN only hashes with another cost, or which can't be read, need rehashing
+    """
+    hasher = PasswordHasher(rounds=5, workers=1)
+
+    assert not hasher.needs_rehash(bcrypt.generate_password_hash('secret', 5).decode('utf-8'))
+    assert hasher.needs_rehash(bcrypt.generate_password_hash('secret', 4).decode('utf-8'))
+    assert hasher.needs_rehash('not a hash')
+    hasher.shutdown()
+
+
+def test_verify_login_rehashes_at_new_cost(test_client, init_empty_database):
+    """
+    GIVEN a user whose password was hashed with a lower cost than the one configured
+    WHEN they log in with the right password, and someone tries a user that doesn't exist
+    THEN their hash is replaced with one at the configured cost, and the missing user is refused
+    """
+    user = User(email='admin')
+    user.password_hash = bcrypt.generate_password_hash('secret', 5).decode('utf-8')
+    db.session.add(user)
+    db.session.commit()
+    old_hash = user.password_hash
+
+    assert not verify_login(user, 'wrong')
+    assert user.password_hash == old_hash
+    assert verify_login(user, 'secret')
+    assert user.password_hash.startswith('$2b$04$')
+    assert get_password_hasher().check(user.password_hash, 'secret')
+    assert not verify_login(None, 'secret')
+
+
+def test_verify_login_skips_rehash_when_busy(test_client, init_empty_database, monkeypatch):
+    """
+    GIVEN a user whose password was hashed with a lower cost than the one configured, and a busy hashing pool
+    WHEN they log in with the right password
+    THEN the login succeeds and the old hash is kept for a later login to replace
+    """
+    user = User(email='admin')
+    user.password_hash = bcrypt.generate_password_hash('secret', 5).decode('utf-8')
+    db.session.add(user)
+    db.session.commit()
+    old_hash = user.password_hash
+
+    def busy(password):
+        raise PasswordHasherBusy(retry_after=2)
+
+    monkeypatch.setattr(get_password_hasher(), 'hash', busy)
+    assert verify_login(user, 'secret')
+    assert user.password_hash == old_hash
+
+
+def test_rehash_ends_other_sessions(test_client, init_empty_database):
+    """
+    GIVEN a user whose password was hashed with a lower cost than the one configured, with a session open
+    WHEN they log in again, which rehashes their password, and then once more
+    THEN the rehash ends the open session as a password change would, and the later login changes nothing
+    """
+    from flask import current_app
+    cache = current_app.extensions['user_cache']
+    user = User(email='admin')
+    user.password_hash = bcrypt.generate_password_hash('secret', 5).decode('utf-8')
+    db.session.add(user)
+    db.session.commit()
+    old_id = user.get_id()
+    assert cache.get(user.id, old_id.partition(':')[2]) is not None
+
+    assert verify_login(user, 'secret')
+    db.session.commit()
+    new_id = user.get_id()
+    assert new_id != old_id
+    assert cache.get(user.id, old_id.partition(':')[2]) is None
+    assert cache.get(user.id, new_id.partition(':')[2]) is not None
+
+    assert verify_login(user, 'secret')
+    db.session.commit()
+    assert user.get_id() == new_id
@@ -0,0 +1,72 @@
+"""
+This file (test_ratelimit.py) contains the unit tests for the rate limiter in the ratelimit.py file.
+"""
+
+import pytest
+from yord_website.ratelimit import parse_limit, take_token, MemoryBackend, SQLiteBackend, create_backend
+
+
+def test_parse_limit():
+    """
+    GIVEN rate limits written as 'N/period'
+    WHEN they are parsed
+    THEN the bucket size and refill rate are returned, and nonsense is rejected
+    """
+    assert parse_limit('10/minute') == (10, 10 / 60)
+    assert parse_limit(' 2 / second ') == (2, 2)
+    for invalid in ('10', '0/minute', 'ten/minute', '10/fortnight'):
+        with pytest.raises(ValueError):
+            parse_limit(invalid)
+
+
+def test_take_token():
+    """
+    GIVEN a token bucket of 2 refilled at 1 token per second
+    WHEN tokens are taken faster than they are refilled
+    THEN the burst is allowed, the next request is told how long to wait, and the bucket refills over time
+    """
+    tokens, wait = take_token(None, 0, 2, 1, now=0)
+    assert (tokens, wait) == (1, 0)
+    tokens, wait = take_token(tokens, 0, 2, 1, now=0)
+    assert (tokens, wait) == (0, 0)
+    tokens, wait = take_token(tokens, 0, 2, 1, now=0.25)
+    assert wait == pytest.approx(0.75)
+    tokens, wait = take_token(tokens, 0.25, 2, 1, now=10)
+    assert (tokens, wait) == (1, 0)
+
+
+@pytest.mark.parametrize('make_backends', [
+    lambda tmp_path: [MemoryBackend()] * 2,
+    lambda tmp_path: [SQLiteBackend(str(tmp_path / 'ratelimit.db')) for _ in range(2)],
+], ids=['memory', 'sqlite'])
+def test_backends_share_buckets(tmp_path, make_backends):
+    """
+    GIVEN two handles on the same backend, as two worker processes would have
+    WHEN a client uses up its bucket through both of them
+    THEN the limit applies across both, separately for each key
+    """
+    first, second = make_backends(tmp_path)
+
+    assert first.hit('login:1.2.3.4', 3, 1 / 60, now=100) == 0
+    assert second.hit('login:1.2.3.4', 3, 1 / 60, now=100) == 0
+    assert first.hit('login:1.2.3.4', 3, 1 / 60, now=100) == 0
+    assert second.hit('login:1.2.3.4', 3, 1 / 60, now=100) == pytest.approx(60)
+    assert first.hit('login:5.6.7.8', 3, 1 / 60, now=100) == 0
+    assert second.hit('login:1.2.3.4', 3, 1 / 60, now=160) == 0
+
+    first.reset()
+    assert second.hit('login:1.2.3.4', 3, 1 / 60, now=160) == 0
+
+
+def test_create_backend(tmp_path):
+    """
+    GIVEN RATELIMIT_STORAGE settings
+    WHEN the backend is created
+    THEN the matching backend is returned, and unknown storage is rejected
+    """
+    assert isinstance(create_backend({'RATELIMIT_STORAGE': 'memory'}), MemoryBackend)
+    backend = create_backend({'RATELIMIT_STORAGE': f'sqlite:///{tmp_path}/limits/ratelimit.db'})
+    assert isinstance(backend, SQLiteBackend)
+    assert (tmp_path / 'limits' / 'ratelimit.db').exists()
+    with pytest.raises(ValueError):
+        create_backend({'RATELIMIT_STORAGE': 'redis://localhost'})
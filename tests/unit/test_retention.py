@@ -0,0 +1,99 @@
+"""
+This file (test_retention.py) contains the unit tests for purging expired members in the retention.py file.
+"""
+
+from datetime import datetime, timedelta, timezone
+from yord_website import db
+from yord_website.counters import member_count
+from yord_website.jobs import enqueue, claim_job, run_job
+from yord_website.lists import create_list, join_list, list_member_count
+from yord_website.models import Member, MemberChange, Job
+from yord_website.retention import purge_members, count_purgeable, purge_cutoffs
+
+
+def add_members(count, unsubscribed_days_ago=None, added_days_ago=0):
+    now = datetime.now(timezone.utc)
+    members = []
+    for number in range(count):
+        member = Member(f'Member {number}', f'member{len(members)}.{unsubscribed_days_ago}.{added_days_ago}@gmails.com')
+        member.date_added = now - timedelta(days=added_days_ago)
+        if unsubscribed_days_ago is not None:
+            member.unsubscribed_at = now - timedelta(days=unsubscribed_days_ago)
+        members.append(member)
+    db.session.add_all(members)
+    db.session.commit()
+    return members
+
+
+def test_purge_unsubscribed_in_chunks(test_client, init_empty_database):
+    """
+    GIVEN members who unsubscribed long ago, recently, or not at all
+    WHEN a purge runs with a chunk size smaller than the number to delete
+    THEN only the long-unsubscribed members are deleted, a chunk at a time, with progress reported
+    """
+    expired = add_members(7, unsubscribed_days_ago=40)
+    add_members(2, unsubscribed_days_ago=5)
+    add_members(3)
+    events = create_list('Events')
+    join_list(events, expired[0].id)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=30)
+    assert member_count() == 12
+
+    assert count_purgeable(unsubscribed_before=cutoff) == 7
+
+    reports = []
+    progress = purge_members(unsubscribed_before=cutoff, chunk_size=3, pause=0,
+                             progress_callback=lambda progress: reports.append(progress.deleted))
+
+    assert progress.deleted == 7
+    assert progress.chunks == 3
+    assert reports == [3, 6, 7]
+    assert member_count() == 5
+    assert list_member_count(events) == 0
+    assert db.session.scalar(db.select(db.func.count()).select_from(MemberChange).where(MemberChange.operation == 'delete')) == 7
+    assert count_purgeable(unsubscribed_before=cutoff) == 0
+
+
+def test_purge_stale(test_client, init_empty_database):
+    """
+    GIVEN members who signed up long ago and recently
+    WHEN a purge runs with a stale cutoff but no unsubscribe cutoff
+    THEN only the members who signed up before the cutoff are deleted
+    """
+    add_members(2, added_days_ago=800)
+    add_members(2, added_days_ago=10)
+
+    progress = purge_members(added_before=datetime.now(timezone.utc) - timedelta(days=730), pause=0)
+
+    assert progress.deleted == 2
+    assert member_count() == 2
+    assert purge_members(pause=0).deleted == 0
+
+
+def test_purge_cutoffs():
+    """
+    GIVEN retention settings with the stale purge turned off
+    WHEN the cutoffs are calculated
+    THEN only the unsubscribe cutoff is set
+    """
+    now = datetime(2026, 3, 31, tzinfo=timezone.utc)
+    config = {'PURGE_UNSUBSCRIBED_AFTER_DAYS': 30, 'PURGE_STALE_AFTER_DAYS': None}
+
+    assert purge_cutoffs(config, now) == (datetime(2026, 3, 1, tzinfo=timezone.utc), None)
+
+
+def test_purge_job_reschedules_itself(test_client, init_empty_database):
+    """
+    GIVEN a queued purge job
+    WHEN a worker runs it
+    THEN expired members are purged and the next purge is queued for later
+    """
+    add_members(2, unsubscribed_days_ago=40)
+    enqueue('purge_members')
+
+    assert run_job(claim_job(60), 10)
+
+    assert member_count() == 0
+    queued = db.session.scalars(db.select(Job).where(Job.status == 'queued')).all()
+    assert len(queued) == 1
+    assert queued[0].run_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(hours=23)
@@ -0,0 +1,75 @@
+"""
+This file (test_rollups.py) contains the unit tests for the daily sign-up totals in the rollups.py file.
+"""
+
+from datetime import datetime, date, timedelta, timezone
+from yord_website import db
+from yord_website.models import Member, SignupRollup
+from yord_website.members import register_member, apply_member_batch
+from yord_website.rollups import rebuild_rollups, signup_series
+
+
+def member_added_on(name, email, day):
+    member = Member(name, email)
+    member.date_added = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=12)
+    return member
+
+
+def rollups():
+    return {rollup.day: (rollup.signups, rollup.removals) for rollup in db.session.scalars(db.select(SignupRollup))}
+
+
+def test_rollups_follow_signups_and_removals(test_client, init_empty_database):
+    """
+    GIVEN an empty mailing list
+    WHEN members sign up and one is later removed
+    THEN the day they signed up and the day of the removal are updated
+    """
+    today = datetime.now(timezone.utc).date()
+    earlier = today - timedelta(days=3)
+    old_member = member_added_on('Old Member', 'old@gmails.com', earlier)
+    db.session.add(old_member)
+    db.session.commit()
+    register_member('Jane Doe', 'jane.doe@gmails.com')
+
+    apply_member_batch(delete_ids=[old_member.id])
+
+    assert rollups() == {earlier: (0, 0), today: (1, 1)}
+
+
+def test_rebuild_rollups(test_client, init_empty_database):
+    """
+    GIVEN members who signed up on different days, one of whom has been removed, and stale rollups
+    WHEN the rollups are rebuilt
+    THEN they match the totals maintained as the changes were made
+    """
+    today = datetime.now(timezone.utc).date()
+    days = [today - timedelta(days=offset) for offset in (10, 10, 2)]
+    members = [member_added_on(f'Member {number}', f'member{number}@gmails.com', day) for number, day in enumerate(days)]
+    db.session.add_all(members)
+    db.session.commit()
+    db.session.delete(members[0])
+    db.session.commit()
+    expected = rollups()
+
+    db.session.execute(db.update(SignupRollup).values(signups=99))
+    db.session.commit()
+
+    assert rebuild_rollups() == 3
+    assert rollups() == expected == {days[0]: (1, 0), days[2]: (1, 0), today: (0, 1)}
+
+
+def test_signup_series_by_week(test_client, init_empty_database):
+    """
+    GIVEN sign-up totals for several days
+    WHEN the totals for the last 14 days are requested by week
+    THEN the days are added up into weeks starting on Monday, including weeks with no sign-ups
+    """
+    db.session.add_all([SignupRollup(day=date(2024, 5, 6), signups=2, removals=0),
+                        SignupRollup(day=date(2024, 5, 8), signups=3, removals=1),
+                        SignupRollup(day=date(2024, 4, 1), signups=50, removals=0)])
+    db.session.commit()
+
+    series = signup_series(days=14, period='week', today=date(2024, 5, 19))
+
+    assert series == [(date(2024, 5, 6), 5, 1), (date(2024, 5, 13), 0, 0)]
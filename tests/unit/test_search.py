@@ -0,0 +1,95 @@
+"""
+This file (test_search.py) contains the unit tests for the member search in the search.py file.
+"""
+
+from yord_website import db
+from yord_website.models import Member
+from yord_website.search import search_terms, member_search_filter, rebuild_search_index
+
+
+def search(query):
+    statement = db.select(Member.name).where(member_search_filter(db.engine, query)).order_by(Member.name)
+    return db.session.scalars(statement).all()
+
+
+def add_members():
+    db.session.add_all([
+        Member('Jane Doe', 'jane.doe@gmails.com'),
+        Member('John Smith', 'jsmith@yopmail.com'),
+        Member('Janet Jackson', 'janet@gmails.com'),
+    ])
+    db.session.commit()
+
+
+def test_search_terms():
+    """
+    GIVEN a search query containing punctuation and capital letters
+    WHEN it is split into search terms
+    THEN the lower-case words are returned
+    """
+    assert search_terms(' Jane.Doe@Gm ') == ['jane', 'doe', 'gm']
+    assert search_terms('!!') == []
+
+
+def test_search_no_terms(test_client, init_empty_database):
+    """
+    GIVEN a search query with nothing to search for
+    WHEN the search filter is built
+    THEN no filter is returned
+    """
+    assert member_search_filter(db.engine, '  ') is None
+
+
+def test_search_name_prefix(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the members are searched for the start of a name
+    THEN every member with a word in their name or email address starting with it is returned
+    """
+    add_members()
+
+    assert search('jan') == ['Jane Doe', 'Janet Jackson']
+    assert search('JANE D') == ['Jane Doe']
+
+
+def test_search_email_prefix(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the members are searched for part of an email address
+    THEN the members with a matching email address are returned
+    """
+    add_members()
+
+    assert search('gmails') == ['Jane Doe', 'Janet Jackson']
+    assert search('jsmith@yop') == ['John Smith']
+    assert search('nobody') == []
+
+
+def test_search_index_follows_changes(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN a member is updated and another is deleted
+    THEN the search results reflect the changes
+    """
+    add_members()
+    jane = db.session.execute(db.select(Member).filter_by(email='jane.doe@gmails.com')).scalar_one()
+    jane.name = 'Jane Bloggs'
+    janet = db.session.execute(db.select(Member).filter_by(email='janet@gmails.com')).scalar_one()
+    db.session.delete(janet)
+    db.session.commit()
+
+    assert search('bloggs') == ['Jane Bloggs']
+    assert search('doe') == ['Jane Bloggs']
+    assert search('janet') == []
+
+
+def test_rebuild_search_index(test_client, init_empty_database):
+    """
+    GIVEN members on the mailing list
+    WHEN the search index is rebuilt
+    THEN searching still returns the same members
+    """
+    add_members()
+    rebuild_search_index()
+
+    assert search('jan') == ['Jane Doe', 'Janet Jackson']
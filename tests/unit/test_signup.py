@@ -0,0 +1,79 @@
+"""
+This file (test_signup.py) contains the unit tests for signing up to the mailing list in the members.py file.
+"""
+
+import threading
+from yord_website import db
+from yord_website.models import Member
+from yord_website.members import register_member
+from yord_website.unsubscribe import unsubscribe
+from yord_website.counters import member_count
+
+
+def test_register_member(test_client, init_empty_database):
+    """
+    GIVEN an empty mailing list
+    WHEN a new member signs up
+    THEN the member is added with a normalised email address and the member count is updated
+    """
+    member_id = register_member(' Jane Doe ', ' Jane.Doe@Gmails.com ')
+
+    member = db.session.get(Member, member_id)
+    assert member.name == 'Jane Doe'
+    assert member.email == 'jane.doe@gmails.com'
+    assert member_count() == 1
+
+
+def test_register_member_duplicate_email(test_client, init_empty_database):
+    """
+    GIVEN a member on the mailing list
+    WHEN someone signs up with the same email address in a different case
+    THEN no new member is added
+    """
+    assert register_member('Jane Doe', 'jane.doe@gmails.com') is not None
+    assert register_member('Jane Doe', 'JANE.DOE@gmails.com') is None
+    assert member_count() == 1
+
+
+def test_register_member_after_unsubscribing(test_client, init_empty_database):
+    """
+    GIVEN a member who has unsubscribed from the mailing list
+    WHEN they sign up again with the same email address
+    THEN they are subscribed again rather than being told they are already registered, and not counted twice
+    """
+    member_id = register_member('Jane Doe', 'jane.doe@gmails.com')
+    assert unsubscribe(member_id, 'jane.doe@gmails.com')
+
+    assert register_member('Jane Doe', 'Jane.Doe@gmails.com') == member_id
+    assert db.session.get(Member, member_id).unsubscribed_at is None
+    assert member_count() == 1
+    assert register_member('Jane Doe', 'jane.doe@gmails.com') is None
+
+
+def test_register_member_concurrent_duplicates(test_client, init_empty_database):
+    """
+    GIVEN an empty mailing list
+    WHEN several sign-ups with the same email address are submitted at the same time
+    THEN exactly one of them adds a member
+    """
+    assert member_count() == 0
+    app = test_client.application
+    barrier = threading.Barrier(8)
+    results = []
+
+    def sign_up(number):
+        with app.app_context():
+            barrier.wait()
+            results.append(register_member(f'Jane Doe {number}', 'Jane.Doe@gmails.com'))
+            db.session.remove()
+
+    threads = [threading.Thread(target=sign_up, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert len([member_id for member_id in results if member_id is not None]) == 1
+    assert db.session.scalar(db.select(db.func.count()).select_from(Member)) == 1
+    assert member_count() == 1
@@ -0,0 +1,67 @@
+"""
+This file (test_unsubscribe.py) contains the unit tests for the signed unsubscribe links in the unsubscribe.py file.
+"""
+
+import pytest
+from flask import current_app
+from itsdangerous import BadSignature
+from yord_website import db
+from yord_website.campaigns import create_campaign, send_campaign
+from yord_website.mail import SMTPPool
+from yord_website.models import Member, MemberChange
+from yord_website.unsubscribe import unsubscribe_token, read_unsubscribe_token, unsubscribe, unsubscribe_url_builder
+
+
+def test_unsubscribe_token_round_trip(test_client):
+    """
+    GIVEN a member's id and email address
+    WHEN an unsubscribe token is made and read back, and a tampered copy is read
+    THEN the original details are returned and the tampered token is rejected
+    """
+    token = unsubscribe_token(7, 'Jane.Doe@gmails.com')
+
+    assert read_unsubscribe_token(token) == (7, 'jane.doe@gmails.com')
+    with pytest.raises(BadSignature):
+        read_unsubscribe_token(unsubscribe_token(8, 'jane.doe@gmails.com')[:-2] + token[-2:])
+
+
+def test_unsubscribe_is_idempotent(test_client, init_empty_database):
+    """
+    GIVEN a subscribed member
+    WHEN they unsubscribe twice, and a token with the wrong email address is used
+    THEN they are marked unsubscribed once, with one change recorded, and the wrong address changes nothing
+    """
+    member = Member('Jane Doe', 'jane.doe@gmails.com')
+    other = Member('John Doe', 'john.doe@gmails.com')
+    db.session.add_all([member, other])
+    db.session.commit()
+
+    assert unsubscribe(member.id, 'jane.doe@gmails.com')
+    assert not unsubscribe(member.id, 'jane.doe@gmails.com')
+    assert not unsubscribe(other.id, 'jane.doe@gmails.com')
+
+    assert db.session.get(Member, member.id).unsubscribed_at is not None
+    assert db.session.get(Member, other.id).unsubscribed_at is None
+    assert db.session.scalar(db.select(db.func.count()).select_from(MemberChange).where(MemberChange.operation == 'update')) == 1
+
+
+def test_campaign_skips_unsubscribed_and_links_to_unsubscribe(test_client, init_empty_database, smtp_server):
+    """
+    GIVEN two members, one of whom has unsubscribed
+    WHEN a campaign is sent
+    THEN only the subscribed member is emailed, with a List-Unsubscribe link which unsubscribes them
+    """
+    jane, john = Member('Jane Doe', 'jane.doe@gmails.com'), Member('John Doe', 'john.doe@gmails.com')
+    db.session.add_all([jane, john])
+    db.session.commit()
+    unsubscribe(john.id, john.email)
+
+    campaign = create_campaign('News', 'Hello {{ name }}! Unsubscribe: {{ unsubscribe_url }}')
+    send_campaign(campaign, SMTPPool('127.0.0.1', smtp_server.port), 'news@yord.local', connections=1)
+
+    assert [message['To'] for message in smtp_server.messages] == ['jane.doe@gmails.com']
+    message = smtp_server.messages[0]
+    link = unsubscribe_url_builder(current_app.config)(jane.id, jane.email)
+    assert message['List-Unsubscribe'] == f'<{link}>'
+    assert message['List-Unsubscribe-Post'] == 'List-Unsubscribe=One-Click'
+    assert link in message.get_payload()
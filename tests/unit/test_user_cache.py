@@ -0,0 +1,154 @@
+"""
+This file (test_user_cache.py) contains the unit tests for the cache of logged-in users in the user_cache.py file.
+"""
+
+from contextlib import contextmanager
+from yord_website import db
+from yord_website.counters import adjust_counter, users_version, USERS_VERSION
+from yord_website.models import User, bcrypt
+from yord_website.user_cache import UserCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@contextmanager
+def count_queries(tables=('users',)):
+    """Count the statements run against the given tables."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if any(f'FROM {table}' in statement for table in tables):
+            statements.append(statement)
+
+    engine = db.engine
+    db.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        db.event.remove(engine, 'before_cursor_execute', record)
+
+
+def add_user(email):
+    user = User(email=email)
+    user.set_password('test123$')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def test_cached_within_ttl(test_client, init_empty_database):
+    """
+    GIVEN a user cache with a 30 second time to live
+    WHEN the same user is loaded repeatedly within the TTL, and again after it with nothing changed
+    THEN the users table is read once, and the expired entry is revalidated from the version counter alone
+    """
+    clock = FakeClock()
+    cache = UserCache(ttl=30, clock=clock)
+    user_id = add_user('admin@yord.local')
+    users_version()
+
+    with count_queries() as user_queries, count_queries(('counters',)) as counter_queries:
+        for _ in range(5):
+            assert cache.get(user_id).email == 'admin@yord.local'
+        assert len(user_queries) == 1 and len(counter_queries) == 1
+
+        clock.now = 31
+        assert cache.get(user_id).email == 'admin@yord.local'
+        assert len(user_queries) == 1 and len(counter_queries) == 2
+
+
+def test_changes_noticed_after_ttl(test_client, init_empty_database):
+    """
+    GIVEN a cached user
+    WHEN another process changes the users table (bumping the version) and then removes the user
+    THEN the change is seen once the TTL has passed, and the removed user loads as None
+    """
+    clock = FakeClock()
+    cache = UserCache(ttl=30, clock=clock)
+    user_id = add_user('admin@yord.local')
+    users_version()
+    assert cache.get(user_id).email == 'admin@yord.local'
+
+    # As another process would: change the row and the version without touching this cache
+    db.session.execute(db.update(User.__table__).where(User.__table__.c.id == user_id).values(email='new@yord.local'))
+    adjust_counter(db.session.connection(), USERS_VERSION, 1)
+    db.session.commit()
+    assert cache.get(user_id).email == 'admin@yord.local'
+
+    clock.now = 31
+    assert cache.get(user_id).email == 'new@yord.local'
+
+    db.session.execute(db.delete(User.__table__).where(User.__table__.c.id == user_id))
+    adjust_counter(db.session.connection(), USERS_VERSION, 1)
+    db.session.commit()
+    clock.now = 62
+    assert cache.get(user_id) is None
+    assert len(cache) == 0
+
+
+def test_local_change_invalidates_at_once(test_client, init_empty_database):
+    """
+    GIVEN a user cached by the app's own cache
+    WHEN the user's password is changed through the ORM in this process
+    THEN the cached entry is dropped straight away
+    """
+    from flask import current_app
+    cache = current_app.extensions['user_cache']
+    user_id = add_user('admin@yord.local')
+    cache.get(user_id)
+    assert len(cache) == 1
+
+    user = db.session.get(User, user_id)
+    user.set_password('changed')
+    db.session.commit()
+
+    assert len(cache) == 0
+
+
+def test_least_recently_used_evicted(test_client, init_empty_database):
+    """
+    GIVEN a user cache which holds two users
+    WHEN three users are loaded, the first being reused before the third is loaded
+    THEN the least recently used user is evicted
+    """
+    cache = UserCache(max_size=2, ttl=30, clock=FakeClock())
+    first, second, third = (add_user(f'user{number}@yord.local') for number in range(3))
+
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    cache.get(third)
+
+    assert set(cache._entries) == {first, third}
+
+
+def test_password_change_ends_sessions(test_client, init_empty_database):
+    """
+    GIVEN a cached user and the session id they logged in with
+    WHEN another process changes their password
+    THEN once the change is noticed the old session id no longer loads the user, and one made after the change does
+    """
+    clock = FakeClock()
+    cache = UserCache(ttl=30, clock=clock)
+    user_id = add_user('admin@yord.local')
+    users_version()
+    old_id = db.session.get(User, user_id).get_id()
+    assert cache.get(user_id, old_id.partition(':')[2]).get_id() == old_id
+
+    # As another process would: change the password and the version without touching this cache
+    db.session.execute(db.update(User.__table__).where(User.__table__.c.id == user_id)
+                       .values(password_hash=bcrypt.generate_password_hash('changed', 4).decode('utf-8')))
+    adjust_counter(db.session.connection(), USERS_VERSION, 1)
+    db.session.commit()
+
+    clock.now = 31
+    assert cache.get(user_id, old_id.partition(':')[2]) is None
+    new_id = db.session.get(User, user_id).get_id()
+    assert new_id != old_id
+    assert cache.get(user_id, new_id.partition(':')[2]).email == 'admin@yord.local'
@@ -4,9 +4,12 @@ from flask_wtf.csrf import CSRFProtect
 import logging
 from logging.handlers import RotatingFileHandler
 from flask.logging import default_handler
+import json
+import click
 from click import echo
-import sqlalchemy as sa
-import pytest
+import sys
+import time
+import subprocess
 
 from .extensions import db, login_manager
 
@@ -16,8 +19,6 @@ from .extensions import db, login_manager
 csrf_protect = CSRFProtect()
 login_manager.login_view = 'auth.login'
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
-admin_username = f'{os.environ.get("ADMIN_USERNAME")}'
-admin_password = f'{os.environ.get("ADMIN_PASSWORD")}'
 location_split = BASEDIR.split('/yord_website')
 instance_file_location = location_split[0] + '/instance'
 test_results = location_split[0] + '/test_results'
@@ -26,50 +27,55 @@ test_results = location_split[0] + '/test_results'
 # Application Factory Function
 # -----------------------------
 def create_app():
+    """Create the app without touching the database; run 'flask bootstrap-db' to set the database up."""
     app = Flask(__name__)
+    timings = []
 
     # Configure the Flask application
     config_type_dev = os.getenv('CONFIG_TYPE', default='config.DevelopmentConfig')
-    app.config.from_object(config_type_dev)
-
-    initialise_extensions(app)
-    register_blueprints(app)
-    configure_logging(app)
-    register_cli_commands(app)
-
-    # Check if the database needs to be initialized
-    engine = sa.create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    inspector = sa.inspect(engine)
-    if not inspector.has_table("users"):
-        with app.app_context():
-            db.drop_all()
-            from .models import User, Member
-            db.create_all()
-            user = User(email = admin_username)
-            user.set_password(admin_password)
-            user.authenticated = True
-            db.session.add(user)
-            db.session.commit()
-            app.logger.info('Initialized the database!')
-    else:
-        app.logger.info('Database already contains the users table.')
+    timed(timings, 'config', app.config.from_object, config_type_dev)
+
+    timed(timings, 'extensions', initialise_extensions, app)
+    timed(timings, 'blueprints', register_blueprints, app)
+    timed(timings, 'logging', configure_logging, app)
+    timed(timings, 'cli commands', register_cli_commands, app)
 
+    # Reported by 'flask startup-profile'
+    app.extensions['startup_timings'] = timings
     return app
 
 # -----------------
 # Helper functions
 # -----------------
+def timed(timings, phase, function, *args):
+    """Call function(*args), adding (phase, seconds taken) to timings."""
+    started = time.perf_counter()
+    function(*args)
+    timings.append((phase, time.perf_counter() - started))
+
+
 def initialise_extensions(app):
     db.init_app(app)
     csrf_protect.init_app(app)
     login_manager.init_app(app)
 
-    from .models import User
+    from .models import bcrypt
+    bcrypt.init_app(app)  # new password hashes use BCRYPT_LOG_ROUNDS
+    from . import events  # registers the listeners which maintain the member counters
+    from . import search  # registers the DDL for the member search index
+    from . import tasks  # registers the tasks run by 'flask worker'
+    from .user_cache import UserCache
+
+    user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    app.extensions['user_cache'] = user_cache
 
     @login_manager.user_loader
     def load_user(user_id):
-        """Given user_id, return the associated User object"""
-        return User.query.get(int(user_id))
+        """Given the session's 'id:stamp', return a cached record of the user, or None if they no longer exist or changed password"""
+        user_id, _, stamp = user_id.partition(':')
+        if not user_id.isdigit() or not stamp:
+            return None
+        return user_cache.get(int(user_id), stamp)
     
 
 def register_blueprints(app):
@@ -124,22 +130,338 @@ def register_cli_commands(app):
         db.create_all()
         echo('Initialized the database!')
 
+    @app.cli.command('bootstrap-db')
+    @click.option('--admin-username', envvar='ADMIN_USERNAME', help='Username of the admin user added to an empty users table.')
+    @click.option('--admin-password', envvar='ADMIN_PASSWORD', help='Password of the admin user added to an empty users table.')
+    def bootstrap_database_command(admin_username, admin_password):
+        """Creates missing tables, records the schema version, adds the admin user and builds the email filter. Safe to run on every deploy."""
+        from .bootstrap import bootstrap_database
+        from .email_filter import build_email_filter
+        from .migrations import latest_version
+        version, admin_added = bootstrap_database(admin_username, admin_password)
+        echo(f'The database is at schema version {version}.')
+        if admin_added:
+            echo(f'Added the admin user {admin_username}.')
+        if build_email_filter():
+            echo('Built the email filter.')
+        if version < latest_version():
+            echo(f"Run 'flask migrate' to bring it up to version {latest_version()}.")
+
+    @app.cli.command('migrate')
+    @click.option('--to', 'target', type=click.IntRange(min=1), help='Stop at this schema version rather than the latest.')
+    @click.option('--list', 'list_only', is_flag=True, help='Only list the migrations and whether they have been applied.')
+    @click.option('--batch-size', type=click.IntRange(min=1), help='Number of rows updated in each backfill transaction.')
+    @click.option('--pause', type=click.FloatRange(min=0), help='Seconds to wait between backfill batches.')
+    def migrate_command(target, list_only, batch_size, pause):
+        """Applies pending schema migrations in order. An interrupted migration resumes when run again."""
+        from .migrations import Migrator, MigrationError, load_migrations, current_schema_version
+        if list_only:
+            current = current_schema_version() or 0
+            for migration in load_migrations():
+                status = 'applied' if migration.version <= current else 'pending'
+                echo(f'{migration.version:>5}  {status:<8} {migration.description}')
+            return
+
+        migrator = Migrator.from_config(app.config, batch_size=batch_size, pause=pause,
+                                        progress_callback=lambda message: echo(message, err=True))
+        try:
+            applied = migrator.run(target)
+        except MigrationError as error:
+            raise click.ClickException(str(error))
+        echo(f'Applied {len(applied)} migrations; the database is at schema version {current_schema_version()}.')
+
+    @app.cli.command('startup-profile')
+    @click.option('--top', type=click.IntRange(min=0), default=10, help='Number of slowest imports to list.')
+    @click.option('--fail-over', type=click.FloatRange(min=0), help='Exit with an error if startup takes longer than this many seconds.')
+    def startup_profile_command(top, fail_over):
+        """Reports how long importing the app and each phase of create_app take, in a fresh interpreter."""
+        script = ('import json, time\n'
+                  'started = time.perf_counter()\n'
+                  'import yord_website\n'
+                  'imported = time.perf_counter()\n'
+                  'app = yord_website.create_app()\n'
+                  'print(json.dumps({"import": imported - started, "phases": app.extensions["startup_timings"],'
+                  ' "total": time.perf_counter() - started}))\n')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                capture_output=True, text=True, cwd=os.path.dirname(BASEDIR))
+        if result.returncode != 0:
+            raise click.ClickException(f'Starting the app failed:\n{result.stderr[-2000:]}')
+        profile = json.loads(result.stdout.strip().splitlines()[-1])
+
+        echo(f'{"import yord_website":<24}{profile["import"] * 1000:9.1f} ms')
+        for phase, seconds in profile['phases']:
+            echo(f'{"create_app: " + phase:<24}{seconds * 1000:9.1f} ms')
+        echo(f'{"total":<24}{profile["total"] * 1000:9.1f} ms')
+
+        imports = []
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                own, cumulative, module = line[len('import time:'):].split('|', 2)
+                if own.strip().isdigit():
+                    imports.append((int(own), int(cumulative), module.strip()))
+        if top and imports:
+            echo(f'\nSlowest imports (own time, including children):')
+            for own, cumulative, module in sorted(imports, reverse=True)[:top]:
+                echo(f'{module:<40}{own / 1000:9.1f} ms {cumulative / 1000:9.1f} ms')
+
+        if fail_over is not None and profile['total'] > fail_over:
+            raise click.ClickException(f'Startup took {profile["total"]:.2f}s, over the limit of {fail_over:.2f}s.')
+
+    @app.cli.command('recount-members')
+    def recount_members():
+        """Recalculates the cached member counts of the main mailing list and every other list."""
+        from .counters import reset_counter, member_count_query, MEMBER_COUNT
+        from .lists import list_counter, list_count_query
+        from .models import MailingList
+        count = reset_counter(MEMBER_COUNT, member_count_query())
+        echo(f'The mailing list has {count} members.')
+        for mailing_list in db.session.scalars(db.select(MailingList).order_by(MailingList.name)).all():
+            count = reset_counter(list_counter(mailing_list.id), list_count_query(mailing_list.id))
+            echo(f'{mailing_list.name} has {count} members.')
+
+    @app.cli.command('create-list')
+    @click.argument('name')
+    def create_list_command(name):
+        """Adds a mailing list, e.g. 'flask create-list "Youth convention"'."""
+        from .lists import create_list
+        mailing_list = create_list(name)
+        if mailing_list is None:
+            raise click.BadParameter(f'There is already a list called {name!r}.')
+        echo(f'Added {mailing_list.name}; people can sign up at /join/{mailing_list.slug}.')
+
+    @app.cli.command('export-members')
+    @click.option('--format', 'export_format', type=click.Choice(['csv', 'ndjson']), default='csv', help='Output format.')
+    @click.option('--since', help='Only export members added on or after this ISO date.')
+    @click.option('--until', help='Only export members added before this ISO date.')
+    @click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+    @click.option('--output', type=click.File('wb'), default='-', help='File to write to (default: stdout).')
+    def export_members_command(export_format, since, until, compress, output):
+        """Streams the mailing list to a file as CSV or NDJSON."""
+        from .mailing.export import export_members, parse_date
+        try:
+            since, until = parse_date(since), parse_date(until)
+        except ValueError as error:
+            raise click.BadParameter(str(error))
+
+        for chunk in export_members(export_format, since, until, compress, app.config['EXPORT_BATCH_SIZE']):
+            output.write(chunk)
+        output.flush()
+
+    @app.cli.command('import-members')
+    @click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--batch-size', type=click.IntRange(min=1), help='Number of rows written per transaction.')
+    def import_members_command(csv_file, batch_size):
+        """Adds or updates members from a CSV file with 'name' and 'email' columns."""
+        from .mailing.importer import import_members
+        report = import_members(csv_file, batch_size or app.config['IMPORT_BATCH_SIZE'])
+
+        for line_number, errors in report.rejections:
+            echo(f'Line {line_number} rejected: {" ".join(errors)}', err=True)
+        echo(f'Inserted {report.inserted}, updated {report.updated}, rejected {report.rejected}.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Creates the member search index if it is missing and rebuilds it."""
+        from .search import rebuild_search_index
+        rebuild_search_index()
+        echo('Rebuilt the member search index.')
+
+    @app.cli.command('member-changes')
+    @click.option('--since', type=click.IntRange(min=0), default=0, help='Cursor of the last change already seen.')
+    @click.option('--limit', type=click.IntRange(min=1), default=1000, help='Maximum number of changes to print.')
+    def member_changes_command(since, limit):
+        """Prints the changes to the mailing list after a cursor as NDJSON, then the cursor to resume from."""
+        from .changes import changes_since
+        changes, cursor = changes_since(since, limit)
+        for change in changes:
+            echo(json.dumps(change))
+        echo(f'Next cursor: {cursor}', err=True)
+
+    @app.cli.command('outbox-worker')
+    @click.option('--once', is_flag=True, help='Send what is due and exit rather than polling.')
+    def outbox_worker_command(once):
+        """Sends the emails waiting in the outbox over pooled SMTP connections."""
+        from .mail import SMTPPool
+        from .outbox import run_outbox_worker
+        result = run_outbox_worker(SMTPPool.from_config(app.config), app.config, once=once)
+        if once:
+            echo(f'Sent {result[0]}, failed {result[1]}.')
+
+    @app.cli.command('create-campaign')
+    @click.argument('subject')
+    @click.argument('template_file', type=click.File('r', encoding='utf-8'))
+    def create_campaign_command(subject, template_file):
+        """Adds a newsletter campaign whose body is the Jinja template in TEMPLATE_FILE."""
+        from jinja2 import TemplateError
+        from .campaigns import create_campaign
+        try:
+            campaign = create_campaign(subject, template_file.read())
+        except TemplateError as error:
+            raise click.BadParameter(f'Invalid template: {error}')
+        echo(f'Created campaign {campaign.id}.')
+
+    @app.cli.command('send-campaign')
+    @click.argument('campaign_id', type=int)
+    @click.option('--connections', type=click.IntRange(min=1), help='Number of SMTP connections to send over.')
+    @click.option('--rate', type=click.FloatRange(min=0), help='Maximum emails per second (0 for no limit).')
+    @click.option('--batch-size', type=click.IntRange(min=1), help='Number of recipients checkpointed at a time.')
+    def send_campaign_command(campaign_id, connections, rate, batch_size):
+        """Sends a campaign to the mailing list, resuming where it left off if it was interrupted."""
+        from .campaigns import send_campaign
+        from .mail import SMTPPool
+        from .models import Campaign
+        campaign = db.session.get(Campaign, campaign_id)
+        if campaign is None:
+            raise click.BadParameter(f'No campaign with ID {campaign_id}.')
+
+        connections = connections or app.config['CAMPAIGN_CONNECTIONS']
+        rate = app.config['CAMPAIGN_RATE_LIMIT'] if rate is None else rate
+
+        def report(progress):
+            echo(f'\rSent {progress.sent}, failed {progress.failed} ({progress.rate:.1f} msgs/sec)', nl=False)
+
+        progress = send_campaign(campaign, SMTPPool.from_config(app.config, size=connections), app.config['MAIL_DEFAULT_SENDER'],
+                                 connections=connections,
+                                 rate=rate or None,
+                                 batch_size=batch_size or app.config['CAMPAIGN_BATCH_SIZE'],
+                                 progress_callback=report)
+        echo('')
+        if progress.skipped:
+            echo(f'{progress.skipped} emails from the interrupted run were not resent as they may already have been delivered.')
+        echo(f'Campaign {campaign.id} finished: sent {campaign.sent_count}, failed {campaign.failed_count}.')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recalculates the daily sign-up totals from the members table and the change log."""
+        from .rollups import rebuild_rollups
+        days = rebuild_rollups()
+        echo(f'Rebuilt the sign-up totals for {days} days.')
+
+    @app.cli.command('rebuild-email-filter')
+    def rebuild_email_filter_command():
+        """Rebuilds the shared filter of member email addresses used to speed up sign-ups."""
+        from .email_filter import rebuild_email_filter
+        if rebuild_email_filter() is None:
+            echo('The email filter is turned off (EMAIL_FILTER_PATH is not set).')
+        else:
+            echo('Rebuilt the email filter.')
+
+    @app.cli.command('find-duplicates')
+    @click.option('--threshold', type=click.FloatRange(0, 1), default=0.85, help='Minimum score for a pair to be reported.')
+    @click.option('--window', type=click.IntRange(min=2), default=5, help='Number of neighbours compared after sorting.')
+    @click.option('--limit', type=click.IntRange(min=1), default=1000, help='Maximum number of pairs to report.')
+    @click.option('--output', type=click.File('w'), default='-', help='CSV file to write the report to (default: stdout).')
+    def find_duplicates_command(threshold, window, limit, output):
+        """Reports pairs of members who have probably signed up twice, most likely first."""
+        import csv
+        from .mailing.duplicates import find_duplicates
+        writer = csv.writer(output)
+        writer.writerow(['score', 'reason', 'keep_id', 'keep_name', 'keep_email', 'duplicate_id', 'duplicate_name', 'duplicate_email'])
+        candidates = find_duplicates(threshold, window, limit)
+        for candidate in candidates:
+            keep, duplicate = candidate.keep, candidate.duplicate
+            writer.writerow([candidate.score, candidate.reason, keep.id, keep.name, keep.email, duplicate.id, duplicate.name, duplicate.email])
+        echo(f'Found {len(candidates)} possible duplicates.', err=True)
+
+    @app.cli.command('merge-members')
+    @click.argument('keep_id', type=int)
+    @click.argument('duplicate_ids', type=int, nargs=-1, required=True)
+    @click.option('--name', help='New name for the member being kept.')
+    @click.option('--email', help="New email address for the member being kept, e.g. a duplicate's.")
+    def merge_members_command(keep_id, duplicate_ids, name, email):
+        """Merges duplicate members into KEEP_ID, deleting DUPLICATE_IDS in the same transaction."""
+        from .mailing.duplicates import merge_members
+        result = merge_members(keep_id, duplicate_ids, name=name, email=email)
+        for error in result.errors:
+            echo(f'Member {error["id"]}: {" ".join(error["errors"])}', err=True)
+        echo(f'Deleted {result.deleted}, updated {result.updated}.')
+
+    @app.cli.command('ingest-bounces')
+    @click.argument('path', type=click.Path(exists=True))
+    @click.option('--batch-size', type=click.IntRange(min=1), help='Number of addresses flagged in each update.')
+    def ingest_bounces_command(path, batch_size):
+        """Flags members whose email bounced, from an mbox file or Maildir directory of bounce messages."""
+        from .bounces import ingest_bounces, mailbox_messages
+
+        def report(progress):
+            echo(f'Read {progress.messages} messages, flagged {progress.flagged} members', err=True)
+
+        result = ingest_bounces(mailbox_messages(path), batch_size or app.config['BOUNCE_BATCH_SIZE'], progress_callback=report)
+        echo(f'Read {result.messages} messages with {result.bounces} failed recipients; flagged {result.flagged} members as bounced.')
+
+    @app.cli.command('purge-members')
+    @click.option('--dry-run', is_flag=True, help='Only report how many members would be purged.')
+    @click.option('--unsubscribed-days', type=click.IntRange(min=0), help='Purge members who unsubscribed this many days ago.')
+    @click.option('--stale-days', type=click.IntRange(min=0), help='Purge members who signed up this many days ago.')
+    @click.option('--chunk-size', type=click.IntRange(min=1), help='Number of members deleted in each transaction.')
+    @click.option('--pause', type=click.FloatRange(min=0), help='Seconds to wait between chunks.')
+    def purge_members_command(dry_run, unsubscribed_days, stale_days, chunk_size, pause):
+        """Deletes members past the retention period in small chunks, defaulting to the PURGE_* settings."""
+        from .retention import purge_cutoffs, count_purgeable, purge_members
+        config = dict(app.config)
+        if unsubscribed_days is not None:
+            config['PURGE_UNSUBSCRIBED_AFTER_DAYS'] = unsubscribed_days
+        if stale_days is not None:
+            config['PURGE_STALE_AFTER_DAYS'] = stale_days
+        unsubscribed_before, added_before = purge_cutoffs(config)
+
+        if dry_run:
+            echo(f'{count_purgeable(unsubscribed_before, added_before)} members would be purged.')
+            return
+
+        def report(progress):
+            echo(f'Purged {progress.deleted} members in {progress.chunks} chunks ({progress.elapsed:.1f}s)', err=True)
+
+        progress = purge_members(unsubscribed_before, added_before,
+                                 chunk_size=chunk_size or app.config['PURGE_CHUNK_SIZE'],
+                                 pause=app.config['PURGE_PAUSE'] if pause is None else pause,
+                                 progress_callback=report)
+        echo(f'Purged {progress.deleted} members.')
+
+    @app.cli.command('worker')
+    @click.option('--concurrency', type=click.IntRange(min=1), help='Number of jobs run at the same time.')
+    @click.option('--once', is_flag=True, help='Exit when there are no jobs ready rather than polling.')
+    def worker_command(concurrency, once):
+        """Runs queued background jobs until interrupted."""
+        from .jobs import run_worker
+        run_worker(app, concurrency or app.config['WORKER_CONCURRENCY'], once=once)
+
+    @app.cli.command('enqueue-job')
+    @click.argument('name')
+    @click.option('--payload', default='{}', help='JSON object of keyword arguments for the task.')
+    def enqueue_job_command(name, payload):
+        """Queues a background job, e.g. 'flask enqueue-job send_campaign --payload '{"campaign_id": 1}'."""
+        from .jobs import enqueue, TASKS
+        if name not in TASKS:
+            raise click.BadParameter(f'Unknown task {name!r}; choose from {", ".join(sorted(TASKS))}.')
+        try:
+            kwargs = json.loads(payload)
+        except ValueError as error:
+            raise click.BadParameter(f'Invalid JSON payload: {error}')
+        if not isinstance(kwargs, dict):
+            raise click.BadParameter('The payload must be a JSON object.')
+        job = enqueue(name, **kwargs)
+        echo(f'Queued job {job.id}.')
+
     @app.cli.command()
     def test():
         """Runs all tests."""
         echo('Running all tests and producing an XML report...')
+        import pytest
         exit(pytest.main(["-s", "--minpass=86", "--junit-xml=test_results/junit.xml", 'tests']))
         
 
     @app.cli.command()
     def unittest():
         """Runs all unit tests."""    
+        import pytest
         pytest.main(["-s", "--cov=yord_website", 'tests/unit/'])
         echo('All unit tests have been run.')
 
     @app.cli.command()
     def functionaltest():
         """Runs all functional tests."""    
+        import pytest
         pytest.main(["-s", "--cov=yord_website", 'tests/functional/'])
         echo('All functional tests have been run.')
 
@@ -147,5 +469,6 @@ def register_cli_commands(app):
     @app.cli.command()
     def testhtml():
        """Runs all tests and generates a HTML report."""
+       import pytest
        pytest.main(["-s", "--cov", "--cov-report=html:test_coverage_reports", 'tests'])    
        echo('All tests have been run and an HTML report has been generated.')     
\ No newline at end of file
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_user, logout_user, current_user
 from yord_website.extensions import db, login_manager
 from yord_website.models import User, LoginForm
+from yord_website.passwords import verify_login, PasswordHasherBusy
+from yord_website.ratelimit import rate_limit, form_field
 
 
 auth_bp = Blueprint(
@@ -11,11 +13,15 @@ auth_bp = Blueprint(
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('RATELIMIT_LOGIN')
+@rate_limit('RATELIMIT_LOGIN_ACCOUNT', key=form_field('username'))
 def login():
     """Login page
     
     For GET requests, the login form is displayed.
     For POST requests, the user is logged in by submitting the form.
+    Passwords are checked on the bounded password hashing pool, and when it
+    is saturated the login is refused with 503 and Retry-After.
     """
 
     if current_user.is_authenticated:
@@ -29,10 +35,19 @@ def login():
 
         user = db.session.scalar(db.select(User).filter_by(email=email))
 
-        if user is None or not user.check_password(password):
+        try:
+            valid = verify_login(user, password)
+        except PasswordHasherBusy as busy:
+            login_busy_alert = True
+            return (render_template('auth/login.html', login_busy_alert=login_busy_alert, form=form), 503,
+                    {'Retry-After': str(busy.retry_after)})
+
+        if not valid:
             error_login_alert = True
             return render_template('auth/login.html', error_login_alert=error_login_alert, form=form)
-        
+
+        # Saves the password's new hash if verify_login upgraded its cost
+        db.session.commit()
         user.is_active = True
         login_user(user, remember=form.remember_me.data)
         return redirect(url_for('mailing.view_members'))
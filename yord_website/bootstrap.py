@@ -0,0 +1,49 @@
+"""
+Setting up the database, run explicitly with 'flask bootstrap-db' rather than on every start.
+
+Creating the app doesn't look at the database at all, so workers and tests
+start without connecting to it. Deployments run 'flask bootstrap-db' once,
+before starting the app, to create any missing tables, record the schema
+version in the schema_version table, add the admin user and build the
+shared email filter, and then 'flask migrate' to bring existing tables up
+to date.
+"""
+
+import sqlalchemy as sa
+
+from .extensions import db
+from .migrations import BASELINE_VERSION, current_schema_version, latest_version
+from .models import SchemaVersion, User
+
+
+def bootstrap_database(admin_username=None, admin_password=None):
+    """
+    Create any missing tables, record the schema version and add the admin user if there are no users yet.
+
+    Safe to run on every deployment: existing tables and users are left alone.
+    A database set up before schema versions were recorded is recorded at the
+    baseline version, leaving its tables to be brought up to date by
+    'flask migrate'. Returns (schema version, whether the admin user was added).
+    """
+    inspector = sa.inspect(db.engine)
+    unversioned = inspector.has_table(User.__tablename__) and not inspector.has_table(SchemaVersion.__tablename__)
+    db.create_all()
+
+    version = current_schema_version()
+    if version is None:
+        if unversioned:
+            version, description = BASELINE_VERSION, 'Schema from before versions were recorded'
+        else:
+            version, description = latest_version(), 'Created from the models'
+        db.session.add(SchemaVersion(version=version, description=description))
+
+    admin_added = False
+    if admin_username and admin_password and db.session.scalar(db.select(User.id).limit(1)) is None:
+        user = User(email=admin_username)
+        user.set_password(admin_password)
+        user.authenticated = True
+        db.session.add(user)
+        admin_added = True
+
+    db.session.commit()
+    return version, admin_added
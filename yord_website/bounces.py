@@ -0,0 +1,166 @@
+"""
+Flagging members whose email bounces, from a mailbox of bounce messages.
+
+Mailboxes are read one message at a time, so memory use stays the same
+however large they are. mailbox.mbox and mailbox.Maildir index every message
+in the mailbox before returning the first one, so instead mbox files are
+split on their 'From ' lines as they are read and Maildir directories are
+listed with os.scandir, with each message parsed by the email package.
+
+Failed recipients are taken from the delivery status notifications (RFC 3464)
+in each message, falling back to the X-Failed-Recipients header some mail
+servers add instead. Only permanent failures count; delays and temporary
+failures are ignored. Addresses are flagged in batches, each one
+UPDATE ... WHERE lower(email) IN (...) on the unique email index.
+"""
+
+import os
+from datetime import datetime, timezone
+from email import policy
+from email.feedparser import BytesFeedParser
+from email.parser import BytesParser
+from email.utils import getaddresses
+
+from .dialects import begin_write
+from .events import members_updated
+from .extensions import db
+from .models import Member, normalize_email
+
+
+class BounceReport:
+    """
+    The outcome of reading a mailbox of bounces.
+
+    Attributes
+    ----------
+    messages : int
+        messages read
+    bounces : int
+        permanently failed recipients found, including repeats
+    flagged : int
+        members newly marked as bounced
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.bounces = 0
+        self.flagged = 0
+
+    def __repr__(self):
+        return f'<BounceReport messages={self.messages} bounces={self.bounces} flagged={self.flagged}>'
+
+
+def mbox_messages(path):
+    """Yield the messages in an mbox file one at a time."""
+    parser = None
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.startswith(b'From '):
+                if parser is not None:
+                    yield parser.close()
+                parser = BytesFeedParser(policy=policy.compat32)
+            elif parser is not None:
+                parser.feed(line)
+    if parser is not None:
+        yield parser.close()
+
+
+def maildir_messages(path):
+    """Yield the messages in a Maildir directory one at a time."""
+    parser = BytesParser(policy=policy.compat32)
+    for folder in ('new', 'cur'):
+        with os.scandir(os.path.join(path, folder)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                with open(entry.path, 'rb') as file:
+                    yield parser.parse(file)
+
+
+def mailbox_messages(path):
+    """Yield the messages in a Maildir directory or an mbox file."""
+    if os.path.isdir(path):
+        return maildir_messages(path)
+    return mbox_messages(path)
+
+
+def recipient_address(value):
+    """Return the address from a DSN recipient field such as 'rfc822; jane@example.com'."""
+    address_type, _, address = value.partition(';')
+    if not address:
+        address = address_type
+    address = address.strip().strip('<>')
+    return normalize_email(address) if '@' in address else None
+
+
+def failed_recipients(message):
+    """Return the addresses which permanently failed according to a bounce message."""
+    failed = set()
+    for part in message.walk():
+        if part.get_content_type() != 'message/delivery-status' or not part.is_multipart():
+            continue
+        # The first block describes the reporting server; each one after it is a recipient
+        for block in part.get_payload()[1:]:
+            action = (block.get('Action') or '').strip().lower()
+            status = (block.get('Status') or '').strip()
+            recipient = block.get('Final-Recipient') or block.get('Original-Recipient')
+            if recipient and (action == 'failed' or status.startswith('5.')) and not status.startswith('4.'):
+                address = recipient_address(str(recipient))
+                if address:
+                    failed.add(address)
+
+    if not failed:
+        for header in message.get_all('X-Failed-Recipients', []):
+            failed.update(normalize_email(address) for _, address in getaddresses([str(header)]) if '@' in address)
+    return failed
+
+
+def flag_bounced(emails, now=None):
+    """Mark the members with these (normalised) addresses as bounced, returning how many were newly flagged."""
+    if not emails:
+        return 0
+    members = Member.__table__
+    connection = db.session.connection()
+    begin_write(connection)
+    rows = connection.execute(db.update(members)
+                              .where(db.func.lower(members.c.email).in_(sorted(emails)), members.c.bounced_at.is_(None))
+                              .values(bounced_at=now or datetime.now(timezone.utc))
+                              .returning(members.c.id, members.c.email, members.c.date_added)).all()
+    members_updated(connection, [row._asdict() for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def ingest_bounces(messages, batch_size=1000, progress_callback=None):
+    """
+    Flag the members whose email bounced in the given messages, returning a BounceReport.
+
+    Parameters
+    ----------
+    messages : iterable
+        email.message.Message objects, e.g. from mailbox_messages
+    batch_size : int
+        number of distinct addresses flagged in each UPDATE
+    progress_callback : callable
+        called with the BounceReport after each batch
+    """
+    report = BounceReport()
+    pending = set()
+
+    def flush():
+        report.flagged += flag_bounced(pending)
+        pending.clear()
+        if progress_callback is not None:
+            progress_callback(report)
+
+    for message in messages:
+        report.messages += 1
+        failed = failed_recipients(message)
+        report.bounces += len(failed)
+        pending.update(failed)
+        if len(pending) >= batch_size:
+            flush()
+
+    if pending:
+        flush()
+    return report
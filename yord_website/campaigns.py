@@ -0,0 +1,227 @@
+"""
+Sending newsletter campaigns to the whole mailing list.
+
+Recipients are read from the members table in batches with keyset
+pagination on id, so memory use doesn't grow with the size of the list. The
+campaign's template is compiled once and rendered for each member on a pool
+of threads, each sending over its own reused SMTP connection, with a token
+bucket shared between them capping the overall rate.
+
+Before a batch is sent its deliveries are recorded as 'sending' and the
+campaign's checkpoint is moved past it in one commit. If a run is killed, the
+next run marks those deliveries 'unknown' rather than risk emailing the same
+people twice, and carries on from the checkpoint.
+
+Members who have unsubscribed or whose email bounces are skipped, and every email carries a signed
+List-Unsubscribe link which mail clients can follow with one click.
+"""
+
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timezone
+from email import policy
+from email.message import EmailMessage
+
+from flask import current_app
+from jinja2 import Environment, StrictUndefined
+
+from .extensions import db
+from .models import Campaign, CampaignDelivery, Member
+from .unsubscribe import unsubscribe_url_builder
+
+# Signed unsubscribe URLs are longer than the default 78 character line, and must not be folded into encoded words
+EMAIL_POLICY = policy.default.clone(max_line_length=998)
+
+# Campaign templates are plain text, so nothing is HTML-escaped
+template_environment = Environment(autoescape=False, undefined=StrictUndefined, keep_trailing_newline=True)
+
+
+class TokenBucket:
+    """
+    A thread-safe rate limiter allowing rate events per second, with bursts of up to capacity.
+
+    Attributes
+    ----------
+    rate : float
+        tokens added per second
+    capacity : float
+        the most tokens that can be saved up
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens are reserved even when there aren't enough, so waiting threads queue up fairly
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class CampaignProgress:
+    """
+    Running totals for a campaign send.
+
+    Attributes
+    ----------
+    sent : int
+        emails sent in this run
+    failed : int
+        emails which could not be sent in this run
+    skipped : int
+        deliveries from an interrupted run which were marked 'unknown'
+    started : float
+        time.monotonic() when the run started
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        """Messages handled per second so far."""
+        elapsed = time.monotonic() - self.started
+        return (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return f'<CampaignProgress sent={self.sent} failed={self.failed} rate={self.rate:.1f}/s>'
+
+
+def create_campaign(subject, template):
+    """Add a draft campaign, checking that its template compiles and renders."""
+    template_environment.from_string(template).render(name='', email='', unsubscribe_url='')
+    campaign = Campaign(subject=subject, template=template, status='draft', last_member_id=0,
+                        sent_count=0, failed_count=0)
+    db.session.add(campaign)
+    db.session.commit()
+    return campaign
+
+
+def recipient_batches(after_id, batch_size):
+    """Yield batches of subscribed, deliverable members' rows with IDs above after_id, in ID order."""
+    while True:
+        batch = db.session.execute(db.select(Member.id, Member.name, Member.email)
+                                   .where(Member.id > after_id, Member.unsubscribed_at.is_(None), Member.bounced_at.is_(None))
+                                   .order_by(Member.id)
+                                   .limit(batch_size)).all()
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1].id
+
+
+def build_campaign_email(subject, template, member, sender, unsubscribe_url):
+    """Build a campaign email for a member, with the one-click unsubscribe headers from RFC 8058."""
+    link = unsubscribe_url(member.id, member.email)
+    email = EmailMessage(policy=EMAIL_POLICY)
+    email['Subject'] = subject
+    email['From'] = sender
+    email['To'] = member.email
+    email['List-Unsubscribe'] = f'<{link}>'
+    email['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
+    email.set_content(template.render(name=member.name, email=member.email, unsubscribe_url=link))
+    return email
+
+
+def send_campaign(campaign, pool, sender, connections=4, rate=None, batch_size=500, progress_callback=None):
+    """
+    Send a campaign to every member it hasn't already been sent to, returning a CampaignProgress.
+
+    Parameters
+    ----------
+    campaign : Campaign
+        the campaign to send, which is resumed if it was interrupted
+    pool : SMTPPool
+        connections to the mail server; it should allow at least `connections` idle connections
+    sender : str
+        the From address
+    connections : int
+        number of emails sent at the same time
+    rate : float
+        maximum emails per second across all connections, or None for no limit
+    batch_size : int
+        number of recipients read and checkpointed at a time
+    progress_callback : callable
+        called with the CampaignProgress after each batch
+    """
+    progress = CampaignProgress()
+    progress.skipped = abandon_interrupted_deliveries(campaign)
+
+    template = template_environment.from_string(campaign.template)
+    subject = campaign.subject
+    bucket = TokenBucket(rate) if rate else None
+    unsubscribe_url = unsubscribe_url_builder(current_app.config)
+    deliveries = CampaignDelivery.__table__
+
+    campaign.status = 'sending'
+    db.session.commit()
+
+    def deliver(member):
+        try:
+            if bucket is not None:
+                bucket.acquire()
+            pool.send(build_campaign_email(subject, template, member, sender, unsubscribe_url))
+        except (smtplib.SMTPException, OSError) as error:
+            return member.id, str(error)[:1000]
+        return member.id, None
+
+    with ThreadPoolExecutor(max_workers=connections) as executor, closing(pool):
+        for batch in recipient_batches(campaign.last_member_id, batch_size):
+            db.session.execute(db.insert(deliveries),
+                               [{'campaign_id': campaign.id, 'member_id': member.id, 'status': 'sending'} for member in batch])
+            campaign.last_member_id = batch[-1].id
+            db.session.commit()
+
+            results = list(executor.map(deliver, batch))
+
+            failures = [{'member': member_id, 'new_status': 'failed', 'new_error': error}
+                        for member_id, error in results if error is not None]
+            successes = [{'member': member_id, 'new_status': 'sent', 'new_error': None}
+                         for member_id, error in results if error is None]
+            db.session.execute(db.update(deliveries)
+                               .where(deliveries.c.campaign_id == campaign.id,
+                                      deliveries.c.member_id == db.bindparam('member'))
+                               .values(status=db.bindparam('new_status'), error=db.bindparam('new_error')),
+                               successes + failures)
+            campaign.sent_count += len(successes)
+            campaign.failed_count += len(failures)
+            db.session.commit()
+
+            progress.sent += len(successes)
+            progress.failed += len(failures)
+            if progress_callback is not None:
+                progress_callback(progress)
+
+    campaign.status = 'sent'
+    campaign.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return progress
+
+
+def abandon_interrupted_deliveries(campaign):
+    """Mark deliveries left 'sending' by a run that died as 'unknown', returning how many there were.
+
+    They may or may not have gone out, and sending them again risks a duplicate.
+    """
+    deliveries = CampaignDelivery.__table__
+    result = db.session.execute(db.update(deliveries)
+                                .where(deliveries.c.campaign_id == campaign.id, deliveries.c.status == 'sending')
+                                .values(status='unknown'))
+    db.session.commit()
+    return result.rowcount
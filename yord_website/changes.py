@@ -0,0 +1,65 @@
+"""
+The change feed: an append-only log of every insert, update and delete on the members table.
+
+Changes are recorded by the hooks in events.py in the same transaction as the
+change itself. On PostgreSQL an exclusive advisory lock is taken before the
+log id is taken from its sequence and held until commit, so ids are handed
+out in commit order and a consumer reading "everything after id N" never
+misses a change committed late with a lower id. On SQLite the write lock
+already does the same.
+"""
+
+from datetime import datetime, timezone
+
+from .dialects import advisory_lock
+from .extensions import db
+from .models import Member, MemberChange
+
+OPERATIONS = ('insert', 'update', 'delete')
+
+
+def record_changes(connection, operation, rows):
+    """Append a change to the log for each of the given member rows, which must include 'id' and 'email'."""
+    if not rows:
+        return
+
+    advisory_lock(connection, 'member_changes')
+    changed_at = datetime.now(timezone.utc)
+    connection.execute(db.insert(MemberChange.__table__), [
+        {'member_id': row['id'], 'operation': operation, 'email': row['email'], 'changed_at': changed_at}
+        for row in rows
+    ])
+
+
+def changes_since(since=0, limit=1000):
+    """
+    Return (changes, cursor) for up to limit changes logged after the cursor since.
+
+    Inserts and updates include the member's current details, or None if the
+    member has since been deleted; deletes are tombstones carrying only the
+    member's ID and email address. Pass the returned cursor as since to fetch
+    the next changes.
+    """
+    statement = (db.select(MemberChange.id, MemberChange.member_id, MemberChange.operation, MemberChange.email,
+                           MemberChange.changed_at, Member.name, Member.email.label('current_email'), Member.date_added)
+                 .outerjoin(Member, Member.id == MemberChange.member_id)
+                 .where(MemberChange.id > since)
+                 .order_by(MemberChange.id)
+                 .limit(limit))
+
+    changes = []
+    for row in db.session.execute(statement):
+        member = None
+        if row.operation != 'delete' and row.current_email is not None:
+            member = {'id': row.member_id, 'name': row.name, 'email': row.current_email,
+                      'date_added': row.date_added.isoformat()}
+        changes.append({'seq': row.id, 'operation': row.operation, 'member_id': row.member_id,
+                        'email': row.email, 'changed_at': row.changed_at.isoformat(), 'member': member})
+
+    cursor = changes[-1]['seq'] if changes else since
+    return changes, cursor
+
+
+def latest_change():
+    """Return the cursor of the most recent change, for consumers starting from a full export."""
+    return db.session.scalar(db.select(db.func.coalesce(db.func.max(MemberChange.id), 0)))
@@ -0,0 +1,95 @@
+"""
+Running totals stored in the counters table.
+
+Counters are adjusted with `UPDATE counters SET value = value + delta` on the
+same connection as the change being counted, so they commit or roll back with
+it and reading a total never needs to count the rows in a table.
+
+A counter is seeded by counting the table the first time it is read. The
+seeding holds a lock which every change to the counter also takes (the write
+lock on SQLite, an advisory lock on PostgreSQL), so no change can commit
+between the count and the counter being stored and be missed by both.
+"""
+
+import time
+
+from .dialects import advisory_lock, begin_write
+from .extensions import db
+from .models import Counter, Member
+
+MEMBER_COUNT = 'members'
+MEMBERS_VERSION = 'members_version'
+USERS_VERSION = 'users_version'
+
+
+def adjust_counter(connection, name, delta):
+    """Add delta to the named counter as part of the current transaction on connection.
+
+    A counter which has not been seeded yet is left alone; it will be seeded
+    from the table itself the next time it is read, which waits for this
+    transaction to finish so the change is counted.
+    """
+    if delta:
+        advisory_lock(connection, f'counter:{name}', shared=True)
+        connection.execute(
+            db.update(Counter.__table__)
+            .where(Counter.__table__.c.name == name)
+            .values(value=Counter.__table__.c.value + delta)
+        )
+
+
+def seed_counter(name, seed, replace=False):
+    """Store the named counter's value from the seed query, unless it already has one or replace is set.
+
+    Runs in a transaction of its own, which changes to the counter can't
+    commit during. Returns the counter's value.
+    """
+    counters = Counter.__table__
+    with db.engine.begin() as connection:
+        begin_write(connection)
+        advisory_lock(connection, f'counter:{name}')
+        if replace:
+            connection.execute(db.delete(counters).where(counters.c.name == name))
+        else:
+            value = connection.scalar(db.select(counters.c.value).where(counters.c.name == name))
+            if value is not None:
+                # Another request seeded the counter first
+                return value
+        connection.execute(db.insert(counters).from_select(['name', 'value'], db.select(db.literal(name), seed.scalar_subquery())))
+        return connection.scalar(db.select(counters.c.value).where(counters.c.name == name))
+
+
+def read_counter(name, seed):
+    """Return the value of the named counter, seeding it with the seed query if it doesn't exist yet."""
+    value = db.session.scalar(db.select(Counter.value).where(Counter.name == name))
+    if value is not None:
+        return value
+    return seed_counter(name, seed)
+
+
+def reset_counter(name, seed):
+    """Recalculate the named counter from the seed query, e.g. after changes made outside the application."""
+    return seed_counter(name, seed, replace=True)
+
+
+def member_count_query():
+    return db.select(db.func.count()).select_from(Member)
+
+
+def member_count():
+    """Return the number of members on the mailing list."""
+    return read_counter(MEMBER_COUNT, member_count_query())
+
+
+def members_version():
+    """Return a number which changes whenever a member is added, changed or removed.
+
+    The version is seeded from the clock rather than zero, so it doesn't
+    repeat an earlier value if the counters table is ever reset.
+    """
+    return read_counter(MEMBERS_VERSION, db.select(db.literal(int(time.time() * 1000), db.BigInteger)))
+
+
+def users_version():
+    """Return a number which changes whenever a user is added, changed or removed, seeded like members_version."""
+    return read_counter(USERS_VERSION, db.select(db.literal(int(time.time() * 1000), db.BigInteger)))
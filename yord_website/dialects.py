@@ -0,0 +1,52 @@
+"""
+Helpers for SQL which differs between the databases the app runs on (SQLite and PostgreSQL).
+"""
+
+import zlib
+
+from sqlalchemy import func, literal_column, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def is_postgresql(bind):
+    """Return True if the engine or connection is connected to PostgreSQL."""
+    return bind.dialect.name == 'postgresql'
+
+
+def insert(bind, table):
+    """Return an INSERT for the table which supports ON CONFLICT on the bind's database."""
+    if is_postgresql(bind):
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def begin_write(connection):
+    """Start a write transaction on the connection.
+
+    On SQLite the write lock is taken straight away with BEGIN IMMEDIATE.
+    Otherwise a connection which has already read inside its transaction
+    cannot wait for the lock, and concurrent writers fail with
+    'database is locked' instead of queueing behind each other.
+    """
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def advisory_lock(connection, name, shared=False):
+    """Take a PostgreSQL advisory lock on name, held until the end of the transaction.
+
+    Shared locks don't block each other, only the exclusive lock, which
+    waits for every shared holder to commit. Does nothing on SQLite, where
+    writers are serialised by the database's write lock anyway.
+    """
+    if is_postgresql(connection):
+        function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+        connection.execute(text(f'SELECT {function}(:key)'), {'key': zlib.crc32(name.encode('utf-8'))})
+
+
+def utc_date(bind, column):
+    """Return an expression for the UTC calendar date of a datetime column."""
+    if is_postgresql(bind):
+        return func.date(column.op('AT TIME ZONE')(literal_column("'UTC'")))
+    # SQLite stores datetimes as UTC text, which date() truncates to 'YYYY-MM-DD'
+    return func.date(column)
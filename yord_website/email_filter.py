@@ -0,0 +1,194 @@
+"""
+A counting Bloom filter of member email addresses, shared by every worker process through a memory-mapped file.
+
+Sign-ups are written with INSERT ... ON CONFLICT DO NOTHING, which on SQLite
+takes the database's write lock even when the address is already registered.
+The filter lets register_member tell most new addresses ("definitely not a
+member") from possible repeats: new addresses go straight to the insert, and
+only possible repeats are first checked with a read against the email index,
+so people signing up twice during a burst don't queue for the write lock.
+
+The filter only ever decides which of two correct paths to take. A stale,
+partly built or missing filter costs an extra read or an uncontended write,
+never a duplicate member. It is built by 'flask bootstrap-db' (or rebuilt by
+'flask rebuild-email-filter'), never by a request: until then every address
+is treated as a possible repeat.
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; the filter is only shared between processes on POSIX
+    fcntl = None
+
+from flask import current_app
+
+from .extensions import db
+from .models import Member, normalize_email
+
+# Magic number, number of counters, number of hash functions, whether the filter has been built
+HEADER = struct.Struct('<8sQQQ')
+MAGIC = b'YORDBF01'
+MAX_COUNT = 255
+
+
+class EmailFilter:
+    """
+    A counting Bloom filter stored in a file, with one byte per counter so addresses can be removed again.
+
+    Attributes
+    ----------
+    path : str
+        the file holding the filter
+    size : int
+        number of counters
+    hashes : int
+        number of counters set for each address
+    """
+
+    def __init__(self, path, capacity, error_rate=0.01):
+        self.path = path
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self._open()
+
+    def _open(self):
+        with open(self.path, 'a+b') as file:
+            with self._locked(file):
+                file.seek(0)
+                header = file.read(HEADER.size)
+                if len(header) < HEADER.size or HEADER.unpack(header)[:3] != (MAGIC, self.size, self.hashes):
+                    file.truncate(0)
+                    file.write(HEADER.pack(MAGIC, self.size, self.hashes, 0))
+                    file.truncate(HEADER.size + self.size)
+                file.flush()
+            self._map = mmap.mmap(file.fileno(), HEADER.size + self.size)
+        self._lock_file = open(self.path, 'rb')
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, file=None):
+        """Hold an exclusive lock on the filter, across processes as well as threads."""
+        file = file or self._lock_file
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def built(self):
+        return HEADER.unpack_from(self._map)[3] == 1
+
+    def _positions(self, email):
+        digest = hashlib.blake2b(normalize_email(email).encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack('<QQ', digest)
+        return [HEADER.size + (first + number * second) % self.size for number in range(self.hashes)]
+
+    def might_contain(self, email):
+        """False if the address is definitely not in the filter, True if it might be."""
+        return all(self._map[position] for position in self._positions(email))
+
+    def add(self, emails):
+        with self._thread_lock, self._locked():
+            for email in emails:
+                for position in self._positions(email):
+                    if self._map[position] < MAX_COUNT:
+                        self._map[position] += 1
+
+    def remove(self, emails):
+        with self._thread_lock, self._locked():
+            for email in emails:
+                for position in self._positions(email):
+                    # A saturated counter no longer knows how many addresses set it, so it is never decremented
+                    if 0 < self._map[position] < MAX_COUNT:
+                        self._map[position] -= 1
+
+    def build(self, emails):
+        """Replace the contents of the filter with the given addresses.
+
+        The counters are filled in a private buffer and copied into the shared
+        file at the end, so sign-ups only wait for the copy, not the whole scan.
+        """
+        counters = bytearray(self.size)
+        for email in emails:
+            for position in self._positions(email):
+                if counters[position - HEADER.size] < MAX_COUNT:
+                    counters[position - HEADER.size] += 1
+
+        with self._thread_lock, self._locked():
+            self._map[HEADER.size:] = counters
+            self._map[:HEADER.size] = HEADER.pack(MAGIC, self.size, self.hashes, 1)
+            self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._lock_file.close()
+
+
+def member_emails():
+    return db.session.scalars(db.select(Member.email).execution_options(yield_per=10000))
+
+
+def get_email_filter():
+    """Return this app's email filter, or None if it is turned off with EMAIL_FILTER_PATH = None."""
+    path = current_app.config.get('EMAIL_FILTER_PATH')
+    if not path:
+        return None
+
+    email_filter = current_app.extensions.get('email_filter')
+    if email_filter is None:
+        email_filter = EmailFilter(path, current_app.config['EMAIL_FILTER_CAPACITY'])
+        current_app.extensions['email_filter'] = email_filter
+    return email_filter
+
+
+def possibly_registered(email):
+    """True if the filter says the address may already be registered, or hasn't been built yet.
+
+    Always False when the filter is turned off, so callers go straight to the insert.
+    """
+    email_filter = get_email_filter()
+    if email_filter is None:
+        return False
+    return not email_filter.built or email_filter.might_contain(email)
+
+
+def rebuild_email_filter(email_filter=None):
+    """Rebuild the filter from the members table, returning it."""
+    email_filter = email_filter or get_email_filter()
+    if email_filter is not None:
+        email_filter.build(member_emails())
+        db.session.commit()
+    return email_filter
+
+
+def build_email_filter():
+    """Build the filter from the members table if it hasn't been built yet, returning whether it was built."""
+    email_filter = get_email_filter()
+    if email_filter is None or email_filter.built:
+        return False
+    rebuild_email_filter(email_filter)
+    return True
+
+
+def emails_added(emails):
+    """Add addresses to the shared filter, if there is one."""
+    email_filter = get_email_filter()
+    if email_filter is not None and emails:
+        email_filter.add(emails)
+
+
+def emails_removed(emails):
+    """Remove addresses from the shared filter, if there is one."""
+    email_filter = get_email_filter()
+    if email_filter is not None and emails:
+        email_filter.remove(emails)
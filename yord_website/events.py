@@ -0,0 +1,84 @@
+"""
+SQLAlchemy event listeners which keep derived data in step with the members and users tables.
+
+The ORM listeners below only see changes made through the session. Code that
+changes members with bulk statements must call members_inserted,
+members_updated and members_deleted itself, on the same connection, so the
+derived data is updated in the same transaction. Deletes must also call
+members_deleting before the DELETE, while the members' list memberships
+still refer to them.
+"""
+
+from .extensions import db
+from .models import Member, User
+from .counters import adjust_counter, MEMBER_COUNT, MEMBERS_VERSION, USERS_VERSION
+from .changes import record_changes
+from .rollups import members_added_to_rollups, members_removed_from_rollups
+from .email_filter import emails_added, emails_removed
+from .lists import remove_memberships
+from .user_cache import user_changed
+
+
+def members_inserted(connection, rows):
+    """Record that the given member rows have been inserted."""
+    adjust_counter(connection, MEMBER_COUNT, len(rows))
+    adjust_counter(connection, MEMBERS_VERSION, 1 if rows else 0)
+    record_changes(connection, 'insert', rows)
+    members_added_to_rollups(connection, rows)
+    emails_added([row['email'] for row in rows])
+
+
+def members_updated(connection, rows):
+    """Record that the given member rows have been changed."""
+    adjust_counter(connection, MEMBERS_VERSION, 1 if rows else 0)
+    record_changes(connection, 'update', rows)
+    # The old addresses are left in the email filter, where they can only cause an extra lookup
+    emails_added([row['email'] for row in rows])
+
+
+def members_deleting(connection, member_ids):
+    """Prepare for the given members to be deleted, by taking them off every mailing list."""
+    remove_memberships(connection, member_ids)
+
+
+def members_deleted(connection, rows):
+    """Record that the given member rows have been deleted."""
+    adjust_counter(connection, MEMBER_COUNT, -len(rows))
+    adjust_counter(connection, MEMBERS_VERSION, 1 if rows else 0)
+    record_changes(connection, 'delete', rows)
+    members_removed_from_rollups(connection, rows)
+    emails_removed([row['email'] for row in rows])
+
+
+def member_row(member):
+    return {'id': member.id, 'email': member.email, 'date_added': member.date_added}
+
+
+@db.event.listens_for(Member, 'after_insert')
+def after_member_insert(mapper, connection, member):
+    members_inserted(connection, [member_row(member)])
+
+
+@db.event.listens_for(Member, 'after_update')
+def after_member_update(mapper, connection, member):
+    members_updated(connection, [member_row(member)])
+
+
+@db.event.listens_for(Member, 'before_delete')
+def before_member_delete(mapper, connection, member):
+    members_deleting(connection, [member.id])
+
+
+@db.event.listens_for(Member, 'after_delete')
+def after_member_delete(mapper, connection, member):
+    members_deleted(connection, [member_row(member)])
+
+
+
+@db.event.listens_for(User, 'after_insert')
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def after_user_change(mapper, connection, user):
+    """Bump the users version, so every process's cached copy of the user is reloaded."""
+    adjust_counter(connection, USERS_VERSION, 1)
+    user_changed(user.id)
@@ -1,6 +1,18 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+import hmac
+from flask import Blueprint, render_template, request, redirect, url_for, Response, abort, current_app
+from flask_login import current_user
 from yord_website.extensions import db
-from yord_website.models import Member, RegistrationForm, ContactForm
+from yord_website.models import RegistrationForm, ContactForm
+from yord_website.counters import member_count
+from yord_website.jobs import queue_stats
+from yord_website.lists import get_list
+from yord_website.members import register_member, subscribe_member
+from yord_website.unsubscribe import read_unsubscribe_token, unsubscribe
+from yord_website import csrf_protect
+from yord_website.ratelimit import rate_limit
+from itsdangerous import BadSignature
+from yord_website.outbox import enqueue_contact_message
+from sqlalchemy.exc import SQLAlchemyError
 
 general_bp = Blueprint(
     'general', __name__,
@@ -9,6 +21,7 @@ general_bp = Blueprint(
 
 @general_bp.route('/', methods=['POST', 'GET'])
 @general_bp.route('/home', methods=['POST', 'GET'])
+@rate_limit('RATELIMIT_SIGNUP')
 def home():
     form = RegistrationForm()
     
@@ -17,21 +30,73 @@ def home():
     
     else:
         if form.validate_on_submit():
-            name = form.name.data
-            email = form.email.data
-        
-            member = Member.query.filter_by(email=email).first()
-            if member is not None:
+            try:
+                member_id = register_member(form.name.data, form.email.data)
+            except SQLAlchemyError:
+                db.session.rollback()
+                return redirect(url_for('general.error_signup'))
+
+            if member_id is None:
                 email_registered_alert = True
                 return render_template('general/index.html', form=form, email_registered_alert=email_registered_alert)
 
-            try:
-                new_entry = Member(name=name, email=email)
-                db.session.add(new_entry)
-                db.session.commit()
-                return redirect(url_for('general.confirm_signup'))  
-            except:
-                return redirect(url_for('general.error_signup'))      
+            return redirect(url_for('general.confirm_signup'))
+
+        return render_template('general/index.html', form=form)
+
+
+@general_bp.route('/join/<slug>', methods=['POST', 'GET'])
+@rate_limit('RATELIMIT_SIGNUP')
+def join_list(slug):
+    """Sign up to one of the mailing lists, joining the main mailing list too if not already on it."""
+    mailing_list = get_list(slug)
+    if mailing_list is None:
+        abort(404)
+
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        try:
+            member_id, joined = subscribe_member(mailing_list, form.name.data, form.email.data)
+        except SQLAlchemyError:
+            db.session.rollback()
+            return redirect(url_for('general.error_signup'))
+
+        if not joined:
+            email_registered_alert = True
+            return render_template('general/index.html', form=form, mailing_list=mailing_list, email_registered_alert=email_registered_alert)
+
+        return redirect(url_for('general.confirm_signup'))
+
+    return render_template('general/index.html', form=form, mailing_list=mailing_list)
+
+
+@general_bp.route('/unsubscribe/<token>', methods=['GET', 'POST'])
+@csrf_protect.exempt
+def unsubscribe_member(token):
+    """Unsubscribe page for the signed links in our emails.
+
+    The token is checked from its signature alone. GET only asks for
+    confirmation, so link scanners in mail filters can't unsubscribe anyone;
+    POST, from the page or a mail client's one-click unsubscribe, does it. It
+    needs no session or CSRF token, as the signed link is the proof.
+    """
+    try:
+        member_id, email = read_unsubscribe_token(token)
+    except BadSignature:
+        invalid_link = True
+        return render_template('general/unsubscribe.html', invalid_link=invalid_link), 400
+
+    if request.method == 'POST':
+        try:
+            unsubscribe(member_id, email)
+        except SQLAlchemyError:
+            db.session.rollback()
+            return redirect(url_for('general.error_signup'))
+        # Already unsubscribed and unknown members get the same answer, so the page gives nothing away
+        unsubscribed = True
+        return render_template('general/unsubscribe.html', unsubscribed=unsubscribed)
+
+    return render_template('general/unsubscribe.html', token=token)
 
 
 @general_bp.route('/confirm', methods=['GET'])
@@ -48,9 +113,24 @@ def about():
 
 @general_bp.route('/contact', methods=["GET", "POST"])
 def contact():
-    """Contact Page"""
+    """Contact Page
+
+    Queries are queued in the outbox and emailed by the outbox worker, so
+    submitting the form never waits on the mail server.
+    """
     form = ContactForm()
 
+    if form.validate_on_submit():
+        try:
+            enqueue_contact_message(form.name.data, form.email.data, form.query.data)
+        except SQLAlchemyError:
+            db.session.rollback()
+            error_sending_query = True
+            return render_template('general/contact.html', form=form, error_sending_query=error_sending_query)
+
+        query_sent_alert = True
+        return render_template('general/contact.html', form=ContactForm(formdata=None), query_sent_alert=query_sent_alert)
+
     return render_template('general/contact.html', form=form)
 
 @general_bp.route('/gallery', methods=["GET"])
@@ -61,4 +141,28 @@ def gallery():
 @general_bp.route('/error')
 def error_signup():
     """Error Page for failed mailing list registration"""
-    return render_template('general/error-signup.html')
\ No newline at end of file
+    return render_template('general/error-signup.html')
+
+@general_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Application metrics in the Prometheus text format, for logged-in users or a scraper sending METRICS_TOKEN"""
+    token = current_app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if not current_user.is_authenticated and not (token and hmac.compare_digest(authorization, f'Bearer {token}')):
+        abort(401)
+
+    jobs = queue_stats()
+    lines = [
+        '# HELP yord_members Number of members on the mailing list.',
+        '# TYPE yord_members gauge',
+        f'yord_members {member_count()}',
+        '# HELP yord_jobs Number of background jobs by status.',
+        '# TYPE yord_jobs gauge',
+        f'yord_jobs{{status="ready"}} {jobs["ready"]}',
+        f'yord_jobs{{status="running"}} {jobs["running"]}',
+        f'yord_jobs{{status="failed"}} {jobs["failed"]}',
+        '# HELP yord_jobs_oldest_ready_age_seconds How long the longest-waiting ready job has been due.',
+        '# TYPE yord_jobs_oldest_ready_age_seconds gauge',
+        f'yord_jobs_oldest_ready_age_seconds {jobs["oldest_ready_age"]:.3f}',
+    ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
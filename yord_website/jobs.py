@@ -0,0 +1,208 @@
+"""
+A small persistent job queue, for slow work which shouldn't hold up a request.
+
+Jobs are rows in the jobs table. A worker claims the job which has been ready
+for longest with a single UPDATE ... RETURNING, selecting it with FOR UPDATE
+SKIP LOCKED on PostgreSQL so concurrent workers never wait on each other, and
+inside BEGIN IMMEDIATE on SQLite, where writers are serialised anyway.
+
+Claiming a job moves its run_at forward by the visibility timeout. If the
+worker dies, the claim expires and another worker picks the job up again, so
+tasks must be safe to run more than once. Tasks which can run for longer than
+the timeout call heartbeat() as they go to extend their claim. The attempt
+number is used as a fencing token, so a worker whose claim was taken over
+can't record the outcome or extend the claim.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from .dialects import is_postgresql, begin_write
+from .extensions import db
+from .models import Job
+from .outbox import retry_delay
+
+logger = logging.getLogger(__name__)
+
+# Task functions by name, added with the @task decorator
+TASKS = {}
+
+# The job each worker thread is running, for heartbeat()
+_running = threading.local()
+
+
+class JobLost(Exception):
+    """Raised by heartbeat() when another worker has taken over the job, so the task should stop."""
+
+
+def task(name):
+    """Register a function as a task which can be queued with enqueue(name, **kwargs)."""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, run_at=None, max_attempts=None, commit=True, **payload):
+    """
+    Queue a job to run the named task with the given keyword arguments.
+
+    With commit=False the job is only added to the session, so it is queued
+    if and only if the caller's own transaction commits.
+    """
+    if name not in TASKS:
+        raise LookupError(f'Unknown task: {name}')
+
+    now = datetime.now(timezone.utc)
+    job = Job(name=name, payload=json.dumps(payload), status='queued', attempts=0,
+              max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+              run_at=run_at or now, enqueued_at=now)
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+
+def claim_job(visibility_timeout, now=None):
+    """Claim the job which has been ready for longest, returning its row or None if there isn't one."""
+    jobs = Job.__table__
+    now = now or datetime.now(timezone.utc)
+
+    connection = db.session.connection()
+    begin_write(connection)
+
+    ready = (db.select(jobs.c.id)
+             .where(jobs.c.status.in_(('queued', 'running')), jobs.c.run_at <= now)
+             .order_by(jobs.c.run_at, jobs.c.id)
+             .limit(1))
+    if is_postgresql(connection):
+        ready = ready.with_for_update(skip_locked=True)
+
+    claimed = connection.execute(
+        db.update(jobs)
+        .where(jobs.c.id == ready.scalar_subquery())
+        .values(status='running',
+                attempts=jobs.c.attempts + 1,
+                run_at=now + timedelta(seconds=visibility_timeout),
+                started_at=now)
+        .returning(jobs.c.id, jobs.c.name, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts, jobs.c.enqueued_at)
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def heartbeat():
+    """
+    Extend the claim on the job this thread is running by the visibility timeout.
+
+    Long tasks call this regularly, e.g. after each batch, so the job isn't
+    claimed again while it is still running. Does nothing outside a job, and
+    raises JobLost if the claim has already been taken over.
+    """
+    job = getattr(_running, 'job', None)
+    if job is None:
+        return
+    jobs = Job.__table__
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=current_app.config['JOB_VISIBILITY_TIMEOUT'])
+    result = db.session.execute(db.update(jobs)
+                                .where(jobs.c.id == job.id, jobs.c.status == 'running', jobs.c.attempts == job.attempts)
+                                .values(run_at=run_at))
+    db.session.commit()
+    if result.rowcount == 0:
+        raise JobLost(f'Job {job.id} was taken over by another worker during attempt {job.attempts}')
+
+
+def finish_job(job, values):
+    """Record the outcome of a claimed job, unless another worker has since taken it over."""
+    jobs = Job.__table__
+    result = db.session.execute(db.update(jobs)
+                                .where(jobs.c.id == job.id, jobs.c.status == 'running', jobs.c.attempts == job.attempts)
+                                .values(**values))
+    db.session.commit()
+    if result.rowcount == 0:
+        logger.warning('Job %s was taken over by another worker before attempt %s finished', job.id, job.attempts)
+
+
+def run_job(job, retry_backoff):
+    """Run a claimed job's task and record whether it succeeded, retrying it later if not."""
+    now = datetime.now(timezone.utc)
+    _running.job = job
+    try:
+        function = TASKS.get(job.name)
+        if function is None:
+            raise LookupError(f'Unknown task: {job.name}')
+        function(**json.loads(job.payload))
+    except Exception as error:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.name, job.attempts)
+        values = {'last_error': f'{type(error).__name__}: {error}'[:1000]}
+        if job.attempts >= job.max_attempts:
+            values.update(status='failed', finished_at=now)
+        else:
+            values.update(status='queued', run_at=now + retry_delay(job.attempts, retry_backoff))
+        finish_job(job, values)
+        return False
+    finally:
+        _running.job = None
+
+    finish_job(job, {'status': 'done', 'finished_at': datetime.now(timezone.utc), 'last_error': None})
+    return True
+
+
+def work(app, stop, once=False):
+    """Claim and run jobs one at a time until stop is set, or until the queue is empty with once."""
+    config = app.config
+    while not stop.is_set():
+        with app.app_context():
+            job = claim_job(config['JOB_VISIBILITY_TIMEOUT'])
+            if job is not None:
+                run_job(job, config['JOB_RETRY_BACKOFF'])
+        if job is None:
+            if once:
+                return
+            stop.wait(config['WORKER_POLL_INTERVAL'])
+
+
+def run_worker(app, concurrency=1, once=False, stop=None):
+    """Run jobs on concurrency threads, each with its own app context and database session."""
+    stop = stop or threading.Event()
+    threads = [threading.Thread(target=work, args=(app, stop, once), name=f'worker-{number}', daemon=True)
+               for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        logger.info('Stopping workers once their current jobs finish')
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def queue_stats(now=None):
+    """Return queue depth and latency figures for monitoring.
+
+    'ready' is the number of queued jobs which are due, and 'oldest_ready_age'
+    the number of seconds the longest-waiting one has been due for, which
+    grows when there aren't enough workers to keep up.
+    """
+    now = now or datetime.now(timezone.utc)
+    ready = db.select(db.func.count(), db.func.min(Job.run_at)).where(Job.status == 'queued', Job.run_at <= now)
+    ready_count, oldest = db.session.execute(ready).one()
+    running = db.session.scalar(db.select(db.func.count()).select_from(Job).where(Job.status == 'running'))
+    failed = db.session.scalar(db.select(db.func.count()).select_from(Job).where(Job.status == 'failed'))
+
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    return {
+        'ready': ready_count,
+        'running': running,
+        'failed': failed,
+        'oldest_ready_age': (now - oldest).total_seconds() if oldest is not None else 0.0,
+    }
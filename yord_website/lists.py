@@ -0,0 +1,119 @@
+"""
+Separate mailing lists, e.g. for events, the youth convention or parents.
+
+Every member is on the main mailing list; list_memberships records which
+other lists they have joined. Its primary key (mailing_list_id, member_id)
+answers "is this member on the list", the index on
+(mailing_list_id, joined_at, member_id) lets a list's members be paged
+through in the order they joined without reading the rest of the list, and
+the index on (member_id, mailing_list_id) finds a member's lists when they
+are deleted. Each list's size is kept in its own counter, adjusted in the
+same transaction as the memberships, so showing it never counts rows.
+"""
+
+import re
+from collections import Counter
+from datetime import datetime, timezone
+
+from .counters import adjust_counter, read_counter
+from .dialects import insert, begin_write
+from .extensions import db
+from .models import MailingList, ListMembership, Member
+from .pagination import paginate
+
+# Keyset for paging through a list's members, matching ix_list_memberships_list_joined_at_member
+LIST_ORDER = (ListMembership.joined_at, ListMembership.member_id)
+
+
+def slugify(name):
+    """Turn a list name into the lowercase, hyphenated form used in URLs."""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def list_counter(list_id):
+    return f'list_members:{list_id}'
+
+
+def create_list(name):
+    """Add a new mailing list, returning it, or None if a list with the same slug already exists."""
+    name = name.strip()
+    slug = slugify(name)
+    if not slug or db.session.scalar(db.select(MailingList.id).where(MailingList.slug == slug)) is not None:
+        return None
+
+    mailing_list = MailingList(name=name, slug=slug)
+    db.session.add(mailing_list)
+    db.session.commit()
+    return mailing_list
+
+
+def get_list(slug):
+    return db.session.scalar(db.select(MailingList).where(MailingList.slug == slug))
+
+
+def list_count_query(list_id):
+    return db.select(db.func.count()).select_from(ListMembership).where(ListMembership.mailing_list_id == list_id)
+
+
+def list_member_count(mailing_list):
+    """Return the number of members on a list."""
+    return read_counter(list_counter(mailing_list.id), list_count_query(mailing_list.id))
+
+
+def is_on_list(mailing_list, member_id):
+    return db.session.scalar(db.select(ListMembership.member_id)
+                             .where(ListMembership.mailing_list_id == mailing_list.id,
+                                    ListMembership.member_id == member_id)) is not None
+
+
+def join_list(mailing_list, member_id):
+    """Add a member to a list, returning False if they were already on it."""
+    memberships = ListMembership.__table__
+    connection = db.session.connection()
+    begin_write(connection)
+    statement = (insert(connection, memberships)
+                 .values(mailing_list_id=mailing_list.id, member_id=member_id, joined_at=datetime.now(timezone.utc))
+                 .on_conflict_do_nothing(index_elements=[memberships.c.mailing_list_id, memberships.c.member_id])
+                 .returning(memberships.c.member_id))
+    joined = connection.execute(statement).first() is not None
+    if joined:
+        adjust_counter(connection, list_counter(mailing_list.id), 1)
+    db.session.commit()
+    return joined
+
+
+def leave_list(mailing_list, member_ids):
+    """Take members off a list (but not off the main mailing list), returning how many were removed."""
+    memberships = ListMembership.__table__
+    connection = db.session.connection()
+    begin_write(connection)
+    removed = connection.execute(db.delete(memberships)
+                                 .where(memberships.c.mailing_list_id == mailing_list.id,
+                                        memberships.c.member_id.in_(list(member_ids)))
+                                 .returning(memberships.c.member_id)).all()
+    adjust_counter(connection, list_counter(mailing_list.id), -len(removed))
+    db.session.commit()
+    return len(removed)
+
+
+def remove_memberships(connection, member_ids):
+    """Take members who are about to be deleted off every list, adjusting each list's count."""
+    if not member_ids:
+        return
+    memberships = ListMembership.__table__
+    removed = Counter(connection.execute(db.delete(memberships)
+                                         .where(memberships.c.member_id.in_(list(member_ids)))
+                                         .returning(memberships.c.mailing_list_id)).scalars())
+    for list_id, count in sorted(removed.items()):
+        adjust_counter(connection, list_counter(list_id), -count)
+
+
+def paginate_list(mailing_list, per_page, page=1, after=None, before=None, descending=False):
+    """Fetch a page of a list's members, in the order they joined, as rows with the member's details and joined_at."""
+    statement = (db.select(Member.id, Member.name, Member.email, Member.date_added,
+                           ListMembership.joined_at, ListMembership.member_id)
+                 .select_from(ListMembership)
+                 .join(Member, Member.id == ListMembership.member_id)
+                 .where(ListMembership.mailing_list_id == mailing_list.id))
+    return paginate(statement, LIST_ORDER, per_page, page=page, after=after, before=before,
+                    total=list_member_count(mailing_list), scalars=False, descending=descending)
@@ -0,0 +1,130 @@
+"""
+Sending email over a small pool of reused SMTP connections.
+
+Opening an SMTP connection (TCP, EHLO, STARTTLS, AUTH) costs several round
+trips, which is usually more than sending the message itself, so connections
+are kept open between messages and handed out to one sender at a time.
+"""
+
+import queue
+import smtplib
+import threading
+from contextlib import contextmanager
+
+
+class SMTPPool:
+    """
+    A thread-safe pool of open SMTP connections.
+
+    Attributes
+    ----------
+    host : str
+        the SMTP server to connect to
+    port : int
+        the port of the SMTP server
+    username : str
+        user to log in as, or None to send without authenticating
+    password : str
+        password to log in with
+    use_tls : bool
+        upgrade connections with STARTTLS
+    timeout : float
+        socket timeout in seconds
+    size : int
+        maximum number of idle connections kept open
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, timeout=10, size=1):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, size=None):
+        """Create a pool from the MAIL_* settings of the app's config."""
+        return cls(config['MAIL_SERVER'], config['MAIL_PORT'],
+                   username=config.get('MAIL_USERNAME'),
+                   password=config.get('MAIL_PASSWORD'),
+                   use_tls=config.get('MAIL_USE_TLS', False),
+                   timeout=config.get('MAIL_TIMEOUT', 10),
+                   size=size or config.get('MAIL_POOL_SIZE', 1))
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return smtp
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, which is returned to the pool unless it failed."""
+        try:
+            smtp = self._idle.get_nowait()
+        except queue.Empty:
+            smtp = self._connect()
+
+        try:
+            yield smtp
+        except (smtplib.SMTPServerDisconnected, OSError):
+            smtp.close()
+            raise
+        except BaseException:
+            self._release(smtp)
+            raise
+        else:
+            self._release(smtp)
+
+    def _release(self, smtp):
+        if self._idle.qsize() < self.size:
+            self._idle.put(smtp)
+        else:
+            quit_quietly(smtp)
+
+    def send(self, message):
+        """Send an email.message.EmailMessage, reconnecting once if a reused connection has gone stale."""
+        reused = not self._idle.empty()
+        try:
+            with self.connection() as smtp:
+                smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            with self.connection() as smtp:
+                smtp.send_message(message)
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                quit_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def quit_quietly(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+def is_permanent_failure(error):
+    """Whether an SMTP error means retrying the same message will never succeed (a 5xx reply)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
@@ -0,0 +1,173 @@
+"""
+Finding members who have probably signed up more than once.
+
+Comparing every member with every other member is O(n^2), so candidate pairs
+are found by blocking and sorted-neighbourhood passes instead:
+
+* members whose email addresses are the same once gmail dots, plus-tags and
+  common domain typos are removed are compared with each other;
+* members with the same (cleaned) local part at different domains are
+  compared, skipping local parts like 'info' shared by too many people;
+* members are sorted by their cleaned email address and, separately, by the
+  sorted words of their name, and each is compared with the few members
+  either side of it.
+
+Each pass is a sort plus a linear scan, so the whole search is O(n log n).
+"""
+
+import unicodedata
+from collections import namedtuple
+from itertools import groupby
+
+from yord_website.extensions import db
+from yord_website.members import apply_member_batch
+from yord_website.models import Member
+
+# Domains which ignore dots in the local part
+DOTLESS_DOMAINS = {'gmail.com'}
+
+# Common misspellings and aliases of large email providers
+DOMAIN_ALIASES = {
+    'googlemail.com': 'gmail.com',
+    'gmial.com': 'gmail.com',
+    'gmai.com': 'gmail.com',
+    'gamil.com': 'gmail.com',
+    'gnail.com': 'gmail.com',
+    'gmail.co': 'gmail.com',
+    'gmail.con': 'gmail.com',
+    'hotmial.com': 'hotmail.com',
+    'hotmail.co': 'hotmail.com',
+    'hotmai.com': 'hotmail.com',
+    'outlok.com': 'outlook.com',
+    'yaho.com': 'yahoo.com',
+    'yahoo.co': 'yahoo.com',
+    'yahooo.com': 'yahoo.com',
+    'iclod.com': 'icloud.com',
+}
+
+# Local parts shared by more members than this ('info', 'admin', ...) aren't used for blocking
+MAX_BLOCK_SIZE = 20
+
+Record = namedtuple('Record', 'id name email address local name_key')
+Candidate = namedtuple('Candidate', 'score keep duplicate reason')
+
+
+def clean_address(email):
+    """Return (address, local part) with plus-tags, gmail dots and domain typos removed."""
+    local, _, domain = email.strip().lower().rpartition('@')
+    domain = DOMAIN_ALIASES.get(domain, domain)
+    local = local.split('+', 1)[0]
+    if domain in DOTLESS_DOMAINS:
+        local = local.replace('.', '')
+    return f'{local}@{domain}', local
+
+
+def name_key(name):
+    """Return the words of a name, without accents or punctuation, in alphabetical order."""
+    decomposed = unicodedata.normalize('NFKD', name.lower())
+    letters = ''.join(character if character.isalnum() else ' ' for character in decomposed
+                      if not unicodedata.combining(character))
+    return ' '.join(sorted(letters.split()))
+
+
+def load_records(batch_size=10000):
+    """Read every member, with their cleaned address and name key, in ID order."""
+    records = []
+    rows = db.session.execute(db.select(Member.id, Member.name, Member.email).order_by(Member.id)
+                              .execution_options(yield_per=batch_size))
+    for member_id, name, email in rows:
+        address, local = clean_address(email)
+        records.append(Record(member_id, name, email, address, local, name_key(name)))
+    return records
+
+
+def bigrams(text):
+    return {text[position:position + 2] for position in range(len(text) - 1)}
+
+
+def similarity(first, second):
+    """The Dice coefficient of two strings' letter pairs: 1 for the same string, 0 for nothing in common.
+
+    Unlike edit distance this is a couple of set operations, which matters
+    when millions of pairs are compared.
+    """
+    if first == second:
+        return 1.0
+    first, second = bigrams(first), bigrams(second)
+    if not first or not second:
+        return 0.0
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+def score_pair(first, second):
+    """Return (score between 0 and 1, reason) for how likely two members are to be the same person."""
+    if first.address == second.address:
+        return 1.0, 'same address ignoring dots, plus-tags and domain typos'
+
+    name = similarity(first.name_key, second.name_key)
+    if first.local == second.local:
+        email, reason = 0.9, 'same local part at a different domain'
+    else:
+        email, reason = similarity(first.address, second.address), 'similar email address'
+    if name >= 0.9 and name > email:
+        reason = 'similar name' if name < 1 else 'same name'
+    return round(0.6 * email + 0.4 * name, 3), reason
+
+
+def candidate_pairs(records, window=5):
+    """Yield each pair of records (as indexes into records) found by the blocking and sorted-neighbourhood passes."""
+    by_address = sorted(range(len(records)), key=lambda index: records[index].address)
+    for _, group in groupby(by_address, key=lambda index: records[index].address):
+        group = list(group)
+        for position, first in enumerate(group):
+            for second in group[position + 1:]:
+                yield first, second
+
+    by_local = sorted(range(len(records)), key=lambda index: records[index].local)
+    for _, group in groupby(by_local, key=lambda index: records[index].local):
+        group = list(group)
+        if 1 < len(group) <= MAX_BLOCK_SIZE:
+            for position, first in enumerate(group):
+                for second in group[position + 1:]:
+                    yield first, second
+
+    for order in (by_address, sorted(range(len(records)), key=lambda index: records[index].name_key)):
+        for position, first in enumerate(order):
+            for second in order[position + 1:position + window]:
+                yield first, second
+
+
+def find_duplicates(threshold=0.85, window=5, limit=None, records=None):
+    """
+    Return candidate duplicates scoring at least threshold, best first.
+
+    In each Candidate the member who signed up first is 'keep' and the later
+    one 'duplicate', ready to pass to merge_members.
+    """
+    records = load_records() if records is None else records
+    found = set()
+    candidates = []
+
+    for first, second in candidate_pairs(records, window):
+        pair = (first, second) if first < second else (second, first)
+        keep, duplicate = records[pair[0]], records[pair[1]]
+        score, reason = score_pair(keep, duplicate)
+        # Pairs found by more than one pass are scored again rather than remembering every pair compared
+        if score >= threshold and pair not in found:
+            found.add(pair)
+            candidates.append(Candidate(score, keep, duplicate, reason))
+
+    candidates.sort(key=lambda candidate: (-candidate.score, candidate.keep.id, candidate.duplicate.id))
+    return candidates[:limit] if limit else candidates
+
+
+def merge_members(keep_id, duplicate_ids, name=None, email=None):
+    """Merge duplicates into one member by deleting them and optionally updating the member being kept.
+
+    This goes through apply_member_batch, so it happens in one transaction and
+    the kept member can take over a duplicate's email address.
+    """
+    updates = []
+    if name is not None or email is not None:
+        updates.append({'id': keep_id, 'name': name, 'email': email})
+    return apply_member_batch(delete_ids=[member_id for member_id in duplicate_ids if member_id != keep_id], updates=updates)
@@ -0,0 +1,107 @@
+"""
+Streaming export of the mailing list.
+
+Members are read with a server-side cursor (yield_per) and written out a chunk
+at a time, so memory use stays the same however many members there are.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+
+from yord_website.extensions import db
+from yord_website.models import Member
+
+EXPORT_COLUMNS = ('id', 'name', 'email', 'date_added')
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows are buffered into chunks of roughly this many bytes before being yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_date(value):
+    """Parse an ISO 8601 date or date and time, treating it as UTC if no timezone is given."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def member_rows(since=None, until=None, batch_size=1000):
+    """Yield (id, name, email, date_added) rows for the members added in [since, until)."""
+    statement = db.select(Member.id, Member.name, Member.email, Member.date_added).order_by(Member.date_added, Member.id)
+    if since is not None:
+        statement = statement.where(Member.date_added >= since)
+    if until is not None:
+        statement = statement.where(Member.date_added < until)
+
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+def csv_chunks(rows):
+    """Yield the rows as CSV text, a chunk at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for row in rows:
+        writer.writerow((row.id, row.name, row.email, row.date_added.isoformat()))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    """Yield the rows as newline-delimited JSON, a chunk at a time."""
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = json.dumps({'id': row.id, 'name': row.name, 'email': row.email, 'date_added': row.date_added.isoformat()})
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+            size = 0
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into gzip format as it is written."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_members(export_format='csv', since=None, until=None, compress=False, batch_size=1000):
+    """Yield the mailing list in the given format as bytes, optionally gzip compressed."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    rows = member_rows(since, until, batch_size)
+    text_chunks = csv_chunks(rows) if export_format == 'csv' else ndjson_chunks(rows)
+    chunks = (chunk.encode('utf-8') for chunk in text_chunks)
+
+    if compress:
+        return gzip_chunks(chunks)
+    return chunks
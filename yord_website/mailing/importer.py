@@ -0,0 +1,161 @@
+"""
+Bulk import of members from CSV files, e.g. sign-up sheets from events.
+
+The file is parsed as a stream, each row is validated with the same rules as
+the sign-up form and valid rows are written in batches with
+INSERT ... ON CONFLICT on the case-insensitive email index, one short
+transaction per batch. On PostgreSQL each batch is loaded with COPY into a
+temporary table first.
+"""
+
+import csv
+import io
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+
+from yord_website.dialects import insert, is_postgresql, begin_write
+from yord_website.events import members_inserted, members_updated
+from yord_website.extensions import db
+from yord_website.models import Member, RegistrationForm, normalize_email, email_domain
+
+# Only the first few rejected rows are kept for the report
+MAX_REPORTED_REJECTIONS = 100
+
+
+class ImportReport:
+    """
+    The outcome of a bulk import.
+
+    Attributes
+    ----------
+    inserted : int
+        number of new members added to the mailing list
+    updated : int
+        number of existing members whose name was updated
+    rejected : int
+        number of rows which failed validation
+    rejections : list
+        (line number, errors) for the first MAX_REPORTED_REJECTIONS rejected rows
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.rejections = []
+
+    def reject(self, line_number, errors):
+        self.rejected += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append((line_number, errors))
+
+    def __repr__(self):
+        return f'<ImportReport inserted={self.inserted} updated={self.updated} rejected={self.rejected}>'
+
+
+def validate_row(form, row):
+    """Validate a row with the sign-up form's rules, returning (name, email, errors).
+
+    The form is created once per import and re-processed for each row, which
+    is considerably cheaper than building a new form every time.
+    """
+    form.process(MultiDict(row))
+    if form.validate():
+        return form.name.data.strip(), normalize_email(form.email.data), None
+    return None, None, [error for errors in form.errors.values() for error in errors]
+
+
+def read_rows(stream):
+    """Yield (line number, row) for each row of a CSV stream with 'name' and 'email' columns."""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+
+    for row in reader:
+        yield reader.line_num, {'name': row.get('name') or '', 'email': row.get('email') or ''}
+
+
+def import_members(stream, batch_size=1000):
+    """Import the members in a CSV text stream, returning an ImportReport."""
+    report = ImportReport()
+    form = RegistrationForm(formdata=None, meta={'csrf': False})
+    batch = {}
+
+    for line_number, row in read_rows(stream):
+        name, email, errors = validate_row(form, row)
+        if errors:
+            report.reject(line_number, errors)
+            continue
+
+        # A later row for the same email address replaces an earlier one
+        batch[email] = name
+        if len(batch) >= batch_size:
+            write_batch(batch, report)
+            batch = {}
+
+    if batch:
+        write_batch(batch, report)
+
+    return report
+
+
+def write_batch(batch, report):
+    """Upsert a batch of {email: name} in one transaction and add the outcome to the report."""
+    members = Member.__table__
+    date_added = datetime.now(timezone.utc)
+    rows = [{'name': name, 'email': email, 'email_domain': email_domain(email), 'date_added': date_added}
+            for email, name in batch.items()]
+
+    with db.engine.begin() as connection:
+        begin_write(connection)
+        if is_postgresql(connection):
+            outcomes = copy_batch(connection, rows)
+        else:
+            # Read under the write lock BEGIN IMMEDIATE has taken, so no sign-up can come in before the upsert
+            existing = set(connection.scalars(db.select(db.func.lower(members.c.email))
+                                              .where(db.func.lower(members.c.email).in_(list(batch)))))
+            statement = insert(connection, members)
+            statement = statement.on_conflict_do_update(index_elements=[db.func.lower(members.c.email)],
+                                                        set_={'name': statement.excluded.name})
+            returned = connection.execute(statement.returning(db.func.lower(members.c.email), members.c.id), rows).all()
+            outcomes = {email: (member_id, email not in existing) for email, member_id in returned}
+
+        for row in rows:
+            row['id'], row['inserted'] = outcomes[row['email']]
+        inserted = [row for row in rows if row['inserted']]
+        updated = [row for row in rows if not row['inserted']]
+        members_inserted(connection, inserted)
+        members_updated(connection, updated)
+
+    report.inserted += len(inserted)
+    report.updated += len(updated)
+
+
+def copy_batch(connection, rows):
+    """Load a batch with COPY into a temporary table, then upsert it into members in one statement.
+
+    Returns {email: (id, whether the row was inserted)} for the rows in the batch. The upsert itself
+    says which rows it inserted, as xmax is 0 for those, so a concurrent sign-up can't be miscounted.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((row['name'], row['email'], row['email_domain'], row['date_added'].isoformat()))
+    buffer.seek(0)
+
+    connection.execute(text('CREATE TEMPORARY TABLE IF NOT EXISTS member_import '
+                            '(name text, email text, email_domain text, date_added timestamptz) ON COMMIT DELETE ROWS'))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert('COPY member_import (name, email, email_domain, date_added) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+    upserted = connection.execute(text('INSERT INTO members (name, email, email_domain, date_added) '
+                                       'SELECT name, email, email_domain, date_added FROM member_import '
+                                       'ON CONFLICT (lower(email)) DO UPDATE SET name = EXCLUDED.name '
+                                       'RETURNING lower(email), id, xmax = 0'))
+    return {email: (member_id, inserted) for email, member_id, inserted in upserted}
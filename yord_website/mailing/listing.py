@@ -0,0 +1,138 @@
+"""
+Searching, filtering and sorting the mailing list.
+
+Every sort order is a unique key backed by a composite index (see the Member
+model), optionally prefixed by email_domain so the domain filter can use the
+same index, and pages are fetched with keyset pagination rather than OFFSET.
+"""
+
+from flask import current_app
+from yord_website.counters import member_count
+from yord_website.extensions import db
+from yord_website.mailing.export import parse_date
+from yord_website.models import Member
+from yord_website.pagination import paginate
+from yord_website.search import member_search_filter
+
+SORT_KEYS = {
+    'date': (Member.date_added, Member.id),
+    'name': (Member.name, Member.id),
+    'email': (Member.email, Member.id),
+    'id': (Member.id,),
+}
+DEFAULT_SORT = 'date'
+SORT_ORDERS = ('asc', 'desc')
+
+
+def format_date(value):
+    """Format a date for a query string, leaving out the time if it is midnight."""
+    if value is None:
+        return ''
+    if value.time() == value.min.time():
+        return value.date().isoformat()
+    return value.isoformat()
+
+
+class MemberListing:
+    """
+    The search, filters and sort order applied to the mailing list.
+
+    Attributes
+    ----------
+    query : str
+        search for members whose name or email address contains words starting with these terms
+    domain : str
+        only include members with email addresses at this domain
+    since : datetime
+        only include members added at or after this time
+    until : datetime
+        only include members added before this time
+    sort : str
+        the key to sort by, one of SORT_KEYS
+    order : str
+        'asc' or 'desc'
+    """
+
+    def __init__(self, query='', domain='', since=None, until=None, sort=DEFAULT_SORT, order='asc'):
+        if sort not in SORT_KEYS:
+            raise ValueError(f'Unknown sort key: {sort}')
+        if order not in SORT_ORDERS:
+            raise ValueError(f'Unknown sort order: {order}')
+
+        self.query = query.strip()
+        self.domain = domain.strip().lower().lstrip('@')
+        self.since = since
+        self.until = until
+        self.sort = sort
+        self.order = order
+
+    @classmethod
+    def from_args(cls, args):
+        """Create a listing from query string arguments, raising ValueError if any are invalid."""
+        return cls(query=args.get('q', ''),
+                   domain=args.get('domain', ''),
+                   since=parse_date(args.get('since')),
+                   until=parse_date(args.get('until')),
+                   sort=args.get('sort', DEFAULT_SORT),
+                   order=args.get('order', 'asc'))
+
+    @property
+    def args(self):
+        """The query string arguments needed to recreate this listing, omitting defaults."""
+        args = {
+            'q': self.query,
+            'domain': self.domain,
+            'since': format_date(self.since),
+            'until': format_date(self.until),
+            'sort': self.sort if self.sort != DEFAULT_SORT else '',
+            'order': self.order if self.order != 'asc' else '',
+        }
+        return {name: value for name, value in args.items() if value}
+
+    def filters(self):
+        """Return the WHERE clauses for the search and filters."""
+        filters = []
+        search_filter = member_search_filter(db.engine, self.query)
+        if search_filter is not None:
+            filters.append(search_filter)
+        if self.domain:
+            filters.append(Member.email_domain == self.domain)
+        if self.since is not None:
+            filters.append(Member.date_added >= self.since)
+        if self.until is not None:
+            filters.append(Member.date_added < self.until)
+        return filters
+
+    def total(self):
+        """
+        Return the number of matching members and whether that number is exact.
+
+        With nothing filtered this is the cached member count. Otherwise at most
+        MEMBER_COUNT_LIMIT + 1 matches are counted, so a broad search costs no
+        more than that however many members it matches; past the limit the
+        total is returned as MEMBER_COUNT_LIMIT and is only a lower bound.
+        """
+        filters = self.filters()
+        if not filters:
+            return member_count(), True
+        limit = current_app.config['MEMBER_COUNT_LIMIT']
+        matches = db.select(Member.id).where(*filters).limit(limit + 1).subquery()
+        count = db.session.scalar(db.select(db.func.count()).select_from(matches))
+        return min(count, limit), count <= limit
+
+    def paginate(self, per_page, page=1, after=None, before=None, columns=None):
+        """Fetch a page of matching members, as Member objects or as rows of the given columns."""
+        if columns is None:
+            statement = db.select(Member)
+        else:
+            statement = db.select(*columns)
+
+        total, total_exact = self.total()
+        return paginate(statement.where(*self.filters()), SORT_KEYS[self.sort], per_page,
+                        page=page,
+                        after=after,
+                        before=before,
+                        total=total,
+                        total_exact=total_exact,
+                        scalars=columns is None,
+                        descending=self.order == 'desc')
@@ -1,7 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, current_app
+import hashlib
+import io
+import json
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, abort, jsonify, Response, stream_with_context
 from flask_login import login_required
+from sqlalchemy.exc import SQLAlchemyError
+from yord_website.changes import changes_since
+from yord_website.counters import members_version
 from yord_website.extensions import db
-from yord_website.models import Member, EditMemberDetailsForm
+from yord_website.lists import create_list, get_list, is_on_list, leave_list, list_member_count, paginate_list
+from yord_website.members import apply_member_batch
+from yord_website.rollups import signup_series, PERIODS
+from yord_website.models import Member, MailingList, EditMemberDetailsForm, ImportMembersForm, SelectMembersForm, MailingListForm
+from yord_website.pagination import InvalidCursor
+from yord_website.mailing.listing import MemberListing
+from yord_website.mailing.export import export_members, parse_date, EXPORT_FORMATS
+from yord_website.mailing.importer import import_members
 
 mailing_bp = Blueprint(
     'mailing', __name__,
@@ -13,17 +26,112 @@ mailing_bp = Blueprint(
 @mailing_bp.route('/members', methods=['GET', 'POST'])
 @login_required
 def view_members():
-    page = request.args.get('page', 1, type=int)
-    members_query = db.session.scalars(db.select(Member).order_by(Member.date_added)).all()
+    return members_page()
 
+def members_page(**alerts):
+    """Render the member list for the request's search, filter, sort and page arguments, with any alerts."""
+    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['MEMBERS_PER_PAGE']
-    start = (page - 1) * per_page
-    end = start + per_page
-    total_pages = (len(members_query) + per_page - 1) // per_page
-    
-    members = members_query[start:end]
-    
-    return render_template('mailing/members.html', members=members, total_pages=total_pages, page=page)
+
+    try:
+        listing = MemberListing.from_args(request.args)
+    except ValueError:
+        abort(400)
+
+    # Query string arguments which every link on the page must keep
+    list_args = listing.args
+
+    try:
+        pagination = listing.paginate(per_page, page=page,
+                                      after=request.args.get('after'),
+                                      before=request.args.get('before'))
+    except InvalidCursor:
+        return redirect(url_for('mailing.view_members', page=page, **list_args))
+
+    return render_template('mailing/members.html', members=pagination.items, pagination=pagination,
+                           total_pages=pagination.pages, page=pagination.page, listing=listing, list_args=list_args,
+                           select_form=SelectMembersForm(), **alerts)
+
+@mailing_bp.route('/api/members', methods=['GET'])
+@login_required
+def api_members():
+    """The mailing list as JSON, a page at a time.
+
+    Takes the same search, filter and sort arguments as the member list, plus
+    per_page and the after/before cursors returned with each page. Responses
+    carry a weak ETag from the members version counter and the page asked
+    for, so a conditional request for an unchanged page is answered with 304
+    from a single counter read.
+    """
+    try:
+        listing = MemberListing.from_args(request.args)
+    except ValueError:
+        abort(400)
+
+    max_per_page = current_app.config['MEMBERS_API_PER_PAGE']
+    per_page = min(max(request.args.get('per_page', max_per_page, type=int), 1), max_per_page)
+    after = request.args.get('after')
+    before = request.args.get('before')
+
+    page_args = json.dumps([listing.args, per_page, after, before], sort_keys=True)
+    etag = f'members-{members_version()}-{hashlib.sha256(page_args.encode("utf-8")).hexdigest()[:16]}'
+    response = Response(mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if request.if_none_match.contains_weak(etag):
+        response.status_code = 304
+        return response
+
+    try:
+        pagination = listing.paginate(per_page, after=after, before=before,
+                                      columns=(Member.id, Member.name, Member.email, Member.date_added))
+    except InvalidCursor:
+        abort(400)
+
+    response.set_data(json.dumps({
+        'members': [{'id': row.id, 'name': row.name, 'email': row.email, 'date_added': row.date_added.isoformat()}
+                    for row in pagination.items],
+        'total': pagination.total,
+        'total_exact': pagination.total_exact,
+        'prev': pagination.prev_cursor,
+        'next': pagination.next_cursor,
+    }))
+    return response
+
+@mailing_bp.route('/api/changes', methods=['GET'])
+@login_required
+def api_changes():
+    """The inserts, updates and deletes made to the mailing list after the cursor given as since.
+
+    Each response includes the cursor to pass as since next time, so a
+    consumer can stay in sync by fetching only what has changed.
+    """
+    since = request.args.get('since', 0, type=int)
+    max_per_page = current_app.config['MEMBERS_API_PER_PAGE']
+    limit = min(max(request.args.get('limit', max_per_page, type=int), 1), max_per_page)
+
+    changes, cursor = changes_since(since, limit + 1)
+    has_more = len(changes) > limit
+    if has_more:
+        changes = changes[:limit]
+        cursor = changes[-1]['seq']
+    return jsonify(changes=changes, cursor=cursor, has_more=has_more)
+
+@mailing_bp.route('/dashboard', methods=['GET'])
+@login_required
+def dashboard():
+    """Chart of sign-ups per day or week, read from the daily rollups rather than the members table."""
+    period = request.args.get('period', 'week')
+    days = request.args.get('days', 365, type=int)
+    if period not in PERIODS or not 1 <= days <= 3660:
+        abort(400)
+
+    series = signup_series(days, period)
+    peak = max((signups for _, signups, _ in series), default=0)
+    return render_template('mailing/dashboard.html', series=series, peak=peak, period=period, days=days,
+                           total_signups=sum(signups for _, signups, _ in series),
+                           total_removals=sum(removals for _, _, removals in series))
 
 @mailing_bp.route('/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -33,7 +141,12 @@ def edit_member(id):
     if member is None:
         return redirect(url_for('mailing.view_members'))
 
-    form = EditMemberDetailsForm(obj = db.session.get(Member, id))
+    return edit_member_page(member, url_for('mailing.view_members'))
+
+
+def edit_member_page(member, done_url):
+    """Show the edit form for a member, redirecting to done_url once their new details are saved."""
+    form = EditMemberDetailsForm(obj = member)
 
     if request.method == 'POST':
         if form.validate_on_submit():
@@ -42,7 +155,7 @@ def edit_member(id):
 
             try:
                 db.session.commit()
-                return redirect(url_for('mailing.view_members'))
+                return redirect(done_url)
             except:
                 error_updating_member = True
                 return render_template('mailing/edit.html', member=member, form=form, error_updating_member=error_updating_member)
@@ -64,5 +177,167 @@ def delete(id):
         db.session.commit()
         return redirect(url_for('mailing.view_members'))
     except:
-        error_deleting_member = True
-        return render_template('mailing/members.html', error_deleting_member=error_deleting_member)
\ No newline at end of file
+        db.session.rollback()
+        return members_page(error_deleting_member=True)
+
+
+@mailing_bp.route('/lists', methods=['GET', 'POST'])
+@login_required
+def view_lists():
+    """The mailing lists, with the number of members on each, and a form to add a new list."""
+    form = MailingListForm()
+    list_exists_alert = False
+
+    if form.validate_on_submit():
+        if create_list(form.name.data) is not None:
+            return redirect(url_for('mailing.view_lists'))
+        list_exists_alert = True
+
+    mailing_lists = db.session.scalars(db.select(MailingList).order_by(MailingList.name)).all()
+    counts = {mailing_list.id: list_member_count(mailing_list) for mailing_list in mailing_lists}
+    return render_template('mailing/lists.html', mailing_lists=mailing_lists, counts=counts, form=form,
+                           list_exists_alert=list_exists_alert)
+
+@mailing_bp.route('/lists/<slug>/members', methods=['GET'])
+@login_required
+def view_list_members(slug):
+    """The members of one mailing list, in the order they joined.
+
+    Pages are read from the list's own index and its size from its counter,
+    so a page costs the same however many members the list or the main
+    mailing list have.
+    """
+    mailing_list = get_list(slug)
+    if mailing_list is None:
+        abort(404)
+
+    page = request.args.get('page', 1, type=int)
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        abort(400)
+    list_args = {'order': order} if order != 'asc' else {}
+
+    try:
+        pagination = paginate_list(mailing_list, current_app.config['MEMBERS_PER_PAGE'], page=page,
+                                   after=request.args.get('after'),
+                                   before=request.args.get('before'),
+                                   descending=order == 'desc')
+    except InvalidCursor:
+        return redirect(url_for('mailing.view_list_members', slug=slug, page=page, **list_args))
+
+    return render_template('mailing/list-members.html', mailing_list=mailing_list, members=pagination.items,
+                           pagination=pagination, page=pagination.page, order=order, list_args=list_args)
+
+@mailing_bp.route('/lists/<slug>/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_list_member(slug, id):
+    mailing_list = get_list(slug)
+    if mailing_list is None:
+        abort(404)
+
+    member = db.session.get(Member, id)
+    if member is None or not is_on_list(mailing_list, id):
+        return redirect(url_for('mailing.view_list_members', slug=slug))
+
+    return edit_member_page(member, url_for('mailing.view_list_members', slug=slug))
+
+@mailing_bp.route('/lists/<slug>/remove/<int:id>', methods=['GET'])
+@login_required
+def remove_from_list(slug, id):
+    """Take a member off one mailing list, leaving them on the main mailing list and any others."""
+    mailing_list = get_list(slug)
+    if mailing_list is None:
+        abort(404)
+
+    try:
+        leave_list(mailing_list, [id])
+    except SQLAlchemyError:
+        db.session.rollback()
+    return redirect(url_for('mailing.view_list_members', slug=slug))
+
+
+@mailing_bp.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """Delete and update many members in one transaction.
+
+    Accepts either JSON, {"delete": [ids], "update": [{"id": id, "name": ..., "email": ...}]},
+    which is answered with the outcome as JSON including the errors for each
+    rejected row, or the member list's form of selected 'id' checkboxes to delete.
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            abort(400)
+        delete_ids = payload.get('delete', [])
+        updates = payload.get('update', [])
+        if (not isinstance(delete_ids, list) or not all(isinstance(member_id, int) and not isinstance(member_id, bool) for member_id in delete_ids)
+                or not isinstance(updates, list) or not all(isinstance(update, dict) for update in updates)):
+            abort(400)
+    else:
+        if not SelectMembersForm().validate_on_submit():
+            abort(400)
+        delete_ids = request.form.getlist('id', type=int)
+        updates = []
+
+    if len(delete_ids) + len(updates) > current_app.config['MEMBER_BATCH_LIMIT']:
+        abort(413)
+
+    try:
+        result = apply_member_batch(delete_ids, updates)
+    except SQLAlchemyError:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify(error='The changes could not be saved. Please try again.'), 500
+        result = None
+
+    if request.is_json:
+        return jsonify(result.to_dict())
+    if result is None or result.errors:
+        return members_page(error_deleting_member=True)
+    return redirect(url_for('mailing.view_members'))
+
+
+@mailing_bp.route('/export', methods=['GET'])
+@login_required
+def export():
+    """Download the mailing list as CSV or NDJSON, streamed a chunk at a time.
+
+    Optional query parameters: format (csv or ndjson), since and until (ISO
+    dates bounding date_added) and gzip=1 to compress the download.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+    except ValueError:
+        abort(400)
+
+    compress = request.args.get('gzip', 0, type=int) == 1
+    filename = f'members.{export_format}' + ('.gz' if compress else '')
+    chunks = export_members(export_format, since, until, compress, current_app.config['EXPORT_BATCH_SIZE'])
+
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@mailing_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_members_upload():
+    """Add or update members from an uploaded CSV file with 'name' and 'email' columns."""
+    form = ImportMembersForm()
+
+    if form.validate_on_submit():
+        stream = io.TextIOWrapper(form.file.data.stream, encoding='utf-8-sig', newline='')
+        try:
+            report = import_members(stream, current_app.config['IMPORT_BATCH_SIZE'])
+        except UnicodeDecodeError:
+            error_importing_members = True
+            return render_template('mailing/import.html', form=form, error_importing_members=error_importing_members)
+        return render_template('mailing/import.html', form=form, report=report)
+
+    return render_template('mailing/import.html', form=form)
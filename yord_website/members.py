@@ -0,0 +1,237 @@
+"""
+Operations on the members of the mailing list which need more than the ORM's one-row-at-a-time writes.
+"""
+
+from datetime import datetime, timezone
+
+from werkzeug.datastructures import MultiDict
+
+from .dialects import insert, begin_write
+from .email_filter import possibly_registered
+from .events import members_inserted, members_updated, members_deleting, members_deleted
+from .extensions import db
+from .lists import join_list
+from .models import Member, EditMemberDetailsForm, normalize_email, email_domain
+
+EDITABLE_FIELDS = ('name', 'email')
+
+
+class BatchResult:
+    """
+    The outcome of applying a batch of deletes and updates to members.
+
+    Attributes
+    ----------
+    deleted : int
+        number of members deleted
+    updated : int
+        number of members updated
+    errors : list
+        {'id': member id, 'errors': [messages]} for each row which was not applied
+    """
+
+    def __init__(self):
+        self.deleted = 0
+        self.updated = 0
+        self.errors = []
+
+    def error(self, member_id, *messages):
+        self.errors.append({'id': member_id, 'errors': list(messages)})
+
+    def to_dict(self):
+        return {'deleted': self.deleted, 'updated': self.updated, 'errors': self.errors}
+
+    def __repr__(self):
+        return f'<BatchResult deleted={self.deleted} updated={self.updated} errors={len(self.errors)}>'
+
+
+def register_member(name, email):
+    """
+    Add a new member to the mailing list.
+
+    The duplicate check and the insert are a single
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statement against the
+    case-insensitive unique index on members.email, so concurrent sign-ups
+    with the same address cannot both succeed.
+
+    Addresses which the shared email filter says might already be
+    registered are first looked up with a read, so repeat sign-ups are
+    turned away without waiting for the write lock.
+
+    Someone who unsubscribed and signs up again is subscribed again, in the
+    same write transaction, rather than being told they are already
+    registered and later purged.
+
+    Returns the new or resubscribed member's id, or None if the email address is already registered.
+    """
+    members = Member.__table__
+    email = normalize_email(email)
+
+    if possibly_registered(email):
+        existing = db.session.execute(db.select(members.c.id, members.c.unsubscribed_at)
+                                      .where(db.func.lower(members.c.email) == email)).first()
+        db.session.commit()
+        if existing is not None and existing.unsubscribed_at is None:
+            return None
+    row = {'name': name.strip(), 'email': email, 'email_domain': email_domain(email), 'date_added': datetime.now(timezone.utc)}
+
+    connection = db.session.connection()
+    begin_write(connection)
+    statement = (insert(connection, members)
+                 .values(**row)
+                 .on_conflict_do_nothing(index_elements=[db.func.lower(members.c.email)])
+                 .returning(members.c.id))
+    member_id = db.session.execute(statement).scalar()
+
+    if member_id is not None:
+        members_inserted(connection, [dict(row, id=member_id)])
+    else:
+        resubscribed = connection.execute(db.update(members)
+                                          .where(db.func.lower(members.c.email) == email,
+                                                 members.c.unsubscribed_at.is_not(None))
+                                          .values(unsubscribed_at=None)
+                                          .returning(members.c.id, members.c.email, members.c.date_added)).first()
+        if resubscribed is not None:
+            member_id = resubscribed.id
+            members_updated(connection, [resubscribed._asdict()])
+    db.session.commit()
+    return member_id
+
+
+def subscribe_member(mailing_list, name, email):
+    """
+    Sign someone up to one of the mailing lists, adding them to the main mailing list too if they are new.
+
+    Returns (member id, whether they joined), where joined is False if they were already on the list.
+    """
+    member_id = register_member(name, email)
+    if member_id is None:
+        member_id = db.session.scalar(db.select(Member.id).where(db.func.lower(Member.email) == normalize_email(email)))
+    return member_id, join_list(mailing_list, member_id)
+
+
+def validate_update(form, update):
+    """Validate the fields of an update with the edit form's rules, returning (values, errors)."""
+    fields = {field: update[field] for field in EDITABLE_FIELDS if update.get(field) is not None}
+    if not fields:
+        return None, ['Nothing to update.']
+
+    errors = [f'The {field} must be text.' for field, value in fields.items() if not isinstance(value, str)]
+    if errors:
+        return None, errors
+
+    form.process(MultiDict(fields))
+    form.validate()
+    errors = [error for field in fields for error in form.errors.get(field, [])]
+    if errors:
+        return None, errors
+
+    values = {}
+    if 'name' in fields:
+        values['name'] = fields['name'].strip()
+    if 'email' in fields:
+        values['email'] = normalize_email(fields['email'])
+        values['email_domain'] = email_domain(values['email'])
+    return values, None
+
+
+def apply_member_batch(delete_ids=(), updates=()):
+    """
+    Delete and update many members in a single transaction.
+
+    Deletes are one DELETE ... WHERE id IN (...) and updates are sent with
+    executemany, one statement per combination of fields being changed.
+    Rows which fail validation, refer to a member that doesn't exist or
+    would duplicate another member's email address are reported in the
+    result's errors and the rest of the batch is still applied.
+
+    Parameters
+    ----------
+    delete_ids : iterable
+        ids of the members to delete
+    updates : iterable
+        dicts with the 'id' of a member and the new 'name' and/or 'email'
+    """
+    result = BatchResult()
+    members = Member.__table__
+    form = EditMemberDetailsForm(formdata=None, meta={'csrf': False})
+
+    delete_ids = set(delete_ids)
+    changes = {}
+    for update in updates:
+        member_id = update.get('id')
+        if not isinstance(member_id, int) or isinstance(member_id, bool):
+            result.error(member_id, 'A member ID is required.')
+            continue
+        if member_id in changes or member_id in delete_ids:
+            result.error(member_id, 'This member appears more than once in the batch.')
+            continue
+
+        values, errors = validate_update(form, update)
+        if errors:
+            result.error(member_id, *errors)
+        else:
+            changes[member_id] = values
+
+    connection = db.session.connection()
+    begin_write(connection)
+
+    ids = delete_ids | set(changes)
+    existing = {}
+    if ids:
+        rows = connection.execute(db.select(members.c.id, members.c.email, members.c.date_added).where(members.c.id.in_(ids)))
+        existing = {row.id: row for row in rows}
+
+    for member_id in sorted(ids - set(existing)):
+        result.error(member_id, 'Member not found.')
+        delete_ids.discard(member_id)
+        changes.pop(member_id, None)
+
+    reject_duplicate_emails(connection, changes, delete_ids, result)
+
+    if delete_ids:
+        members_deleting(connection, delete_ids)
+        connection.execute(db.delete(members).where(members.c.id.in_(delete_ids)))
+        members_deleted(connection, [existing[member_id]._asdict() for member_id in delete_ids])
+        result.deleted = len(delete_ids)
+
+    groups = {}
+    updated_rows = []
+    for member_id, values in changes.items():
+        updated_rows.append(dict(existing[member_id]._asdict(), **values))
+        groups.setdefault(tuple(sorted(values)), []).append(dict({f'new_{field}': value for field, value in values.items()}, member_id=member_id))
+    for fields, rows in groups.items():
+        statement = (db.update(members)
+                     .where(members.c.id == db.bindparam('member_id'))
+                     .values({field: db.bindparam(f'new_{field}') for field in fields}))
+        connection.execute(statement, rows)
+        result.updated += len(rows)
+    members_updated(connection, updated_rows)
+
+    db.session.commit()
+    return result
+
+
+def reject_duplicate_emails(connection, changes, delete_ids, result):
+    """Remove updates which would give a member an email address that is, or will be, someone else's."""
+    members = Member.__table__
+    new_emails = {}
+    for member_id, values in list(changes.items()):
+        if 'email' not in values:
+            continue
+        if values['email'] in new_emails:
+            result.error(member_id, 'This email address appears more than once in the batch.')
+            del changes[member_id]
+        else:
+            new_emails[values['email']] = member_id
+
+    if not new_emails:
+        return
+
+    owners = connection.execute(db.select(members.c.id, db.func.lower(members.c.email))
+                                .where(db.func.lower(members.c.email).in_(list(new_emails))))
+    for owner_id, email in owners:
+        member_id = new_emails[email]
+        if owner_id != member_id and owner_id not in delete_ids:
+            result.error(member_id, 'This email address is already registered.')
+            del changes[member_id]
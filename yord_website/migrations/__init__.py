@@ -0,0 +1,310 @@
+"""
+Versioned changes to the schema of a database which already has data in it, applied with 'flask migrate'.
+
+'flask bootstrap-db' creates any missing tables from the models, but can't
+change a table which already exists. Changes to existing tables are made by
+the migration modules in this package instead: vNNNN_<name>.py, applied in
+order of NNNN, each with a docstring describing it and an upgrade(migrator)
+function. The schema_version table records which have been applied.
+
+Migrations are written with the Migrator's operations, which are safe to run
+while the site is up and to run again after an interruption:
+
+- add_column only adds nullable columns, which doesn't rewrite the table,
+  and on PostgreSQL gives up rather than queueing behind long transactions.
+- create_index builds indexes with CREATE INDEX CONCURRENTLY on PostgreSQL,
+  so writes to the table carry on while it is built.
+- drop_unique_constraint is a quick ALTER TABLE on PostgreSQL. SQLite can't
+  drop constraints, so there the table is copied, holding the write lock.
+- backfill fills in columns a batch of rows at a time, each batch in its own
+  short transaction, pausing in between so other writers get the lock, and
+  saves its position so an interrupted backfill carries on where it stopped.
+"""
+
+import importlib
+import pkgutil
+import re
+import time
+from collections import namedtuple
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from ..dialects import insert, is_postgresql, begin_write
+from ..extensions import db
+from ..models import Counter, SchemaVersion
+
+# The schema of databases set up before migrations were versioned
+BASELINE_VERSION = 1
+
+Migration = namedtuple('Migration', 'version description upgrade')
+
+
+class MigrationError(Exception):
+    """Raised when the database can't be migrated, e.g. because it hasn't been bootstrapped."""
+
+
+def load_migrations():
+    """Return the migrations in this package, in the order they are applied."""
+    migrations = {}
+    for module_info in pkgutil.iter_modules(__path__):
+        match = re.fullmatch(r'v(\d+)_\w+', module_info.name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version <= BASELINE_VERSION or version in migrations:
+            raise MigrationError(f'Migration {module_info.name} has a duplicate or reserved version')
+        module = importlib.import_module(f'{__name__}.{module_info.name}')
+        description = (module.__doc__ or module_info.name).strip().splitlines()[0]
+        migrations[version] = Migration(version, description, module.upgrade)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def latest_version():
+    """Return the schema version of the current models, i.e. of the last migration."""
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else BASELINE_VERSION
+
+
+def current_schema_version():
+    """Return the database's recorded schema version, or None if it hasn't been bootstrapped."""
+    try:
+        version = db.session.scalar(db.select(db.func.max(SchemaVersion.version)))
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return version
+
+
+class Migrator:
+    """
+    Applies pending migrations, and provides the online-safe operations they are written with.
+
+    Attributes
+    ----------
+    batch_size : int
+        number of rows updated in each backfill transaction
+    pause : float
+        seconds to wait between backfill batches
+    lock_timeout : float
+        seconds DDL on PostgreSQL waits for its table lock before giving up
+    progress_callback : callable
+        called with a message as each migration starts and after each backfill batch
+    """
+
+    def __init__(self, batch_size=1000, pause=0.1, lock_timeout=5, progress_callback=None):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.progress_callback = progress_callback
+        # The migration being applied, whose backfills' positions are saved under its version
+        self.version = None
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        options = dict(batch_size=config['MIGRATION_BATCH_SIZE'],
+                       pause=config['MIGRATION_PAUSE'],
+                       lock_timeout=config['MIGRATION_LOCK_TIMEOUT'])
+        options.update((name, value) for name, value in kwargs.items() if value is not None)
+        return cls(**options)
+
+    def report(self, message):
+        if self.progress_callback is not None:
+            self.progress_callback(message)
+
+    def pending(self, target=None):
+        """Return the migrations not yet applied, up to the target version (the latest by default)."""
+        current = current_schema_version()
+        if current is None:
+            raise MigrationError("The database hasn't been set up; run 'flask bootstrap-db' first.")
+        if target is not None and target < current:
+            raise MigrationError(f'The database is already at schema version {current}; migrations cannot be undone.')
+        return [migration for migration in load_migrations()
+                if migration.version > current and (target is None or migration.version <= target)]
+
+    def run(self, target=None):
+        """Apply the pending migrations in order, recording each one as it finishes, and return them."""
+        # Nothing is left waiting on the session's connection while DDL runs on others
+        db.session.commit()
+        applied = []
+        for migration in self.pending(target):
+            self.version = migration.version
+            self.report(f'Applying migration {migration.version}: {migration.description}')
+            migration.upgrade(self)
+            db.session.add(SchemaVersion(version=migration.version, description=migration.description))
+            db.session.commit()
+            applied.append(migration)
+        self.version = None
+        return applied
+
+    def has_column(self, table, name):
+        return name in {column['name'] for column in sa.inspect(db.engine).get_columns(table.name)}
+
+    def add_column(self, column):
+        """Add one of the models' columns to its table if it is missing, returning True if it was added."""
+        table = column.table
+        if self.has_column(table, column.name):
+            return False
+        if not column.nullable and column.server_default is None:
+            raise MigrationError(f'{table.name}.{column.name} must be nullable or have a server default to be added online')
+
+        with db.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            if is_postgresql(connection):
+                # Adding a column takes a brief exclusive lock; don't queue every query behind it for long
+                connection.exec_driver_sql(f"SET LOCAL lock_timeout = '{int(self.lock_timeout * 1000)}ms'")
+            specification = connection.dialect.ddl_compiler(connection.dialect, None).get_column_specification(column)
+            connection.exec_driver_sql(f'ALTER TABLE {quote(table.name)} ADD COLUMN {specification}')
+        return True
+
+    def create_index(self, index):
+        """Create one of the models' indexes if it is missing, returning True if it was created."""
+        with db.engine.connect() as connection:
+            ddl = str(CreateIndex(index).compile(dialect=connection.dialect))
+        return self.create_index_sql(index.name, ddl)
+
+    def create_index_sql(self, name, ddl):
+        """
+        Run CREATE INDEX DDL if the named index is missing, returning True if it was created.
+
+        On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY, which
+        doesn't block writes but can't run in a transaction. If a concurrent
+        build failed part way through, it left an invalid index behind, which
+        is dropped and built again. On SQLite the build holds the write lock.
+        A unique index which existing rows break raises MigrationError.
+        """
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            if is_postgresql(connection):
+                valid = connection.scalar(sa.text('SELECT i.indisvalid FROM pg_index i '
+                                                  'JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name'),
+                                          {'name': name})
+                if valid:
+                    return False
+                if valid is not None:
+                    connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {quote(name)}')
+                ddl = ddl.replace('INDEX ', 'INDEX CONCURRENTLY ', 1)
+            elif connection.scalar(sa.text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+                                   {'name': name}):
+                return False
+            try:
+                connection.exec_driver_sql(ddl)
+            except IntegrityError as error:
+                raise MigrationError(f'Could not create the unique index {name}, as existing rows break it: {error.orig}')
+        return True
+
+    def unique_constraints(self, table, columns):
+        """Return the names of the table's unique constraints on exactly these columns."""
+        with db.engine.connect() as connection:
+            if is_postgresql(connection):
+                return [constraint['name'] for constraint in sa.inspect(connection).get_unique_constraints(table.name)
+                        if constraint['column_names'] == list(columns)]
+            # SQLAlchemy's SQLite reflection can't handle expression indexes, so the constraints' indexes are read directly
+            quote = connection.dialect.identifier_preparer.quote
+            names = []
+            for index in connection.exec_driver_sql(f'PRAGMA index_list({quote(table.name)})').mappings():
+                if index['origin'] == 'u':
+                    info = connection.exec_driver_sql(f'PRAGMA index_info({quote(index["name"])})').mappings()
+                    if [column['name'] for column in info] == list(columns):
+                        names.append(index['name'])
+            return names
+
+    def drop_unique_constraint(self, table, columns):
+        """
+        Drop the unique constraint on the columns of one of the models' tables, returning True if there was one.
+
+        On PostgreSQL this is a quick ALTER TABLE. SQLite can't drop
+        constraints, so the table is rebuilt from the model in one
+        transaction: copied into a new table without the constraint, which
+        replaces it, and its indexes and triggers are created again.
+        """
+        constraints = self.unique_constraints(table, columns)
+        if not constraints:
+            return False
+
+        with db.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            if is_postgresql(connection):
+                connection.exec_driver_sql(f"SET LOCAL lock_timeout = '{int(self.lock_timeout * 1000)}ms'")
+                for name in constraints:
+                    connection.exec_driver_sql(f'ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(name)}')
+            else:
+                begin_write(connection)
+                triggers = connection.scalars(sa.text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :name"),
+                                              {'name': table.name}).all()
+                existing = {column['name'] for column in sa.inspect(connection).get_columns(table.name)}
+                copied = ', '.join(quote(column.name) for column in table.columns if column.name in existing)
+
+                rebuilt = table.to_metadata(sa.MetaData(), name=f'_{table.name}_rebuilt')
+                connection.execute(CreateTable(rebuilt))
+                connection.exec_driver_sql(f'INSERT INTO {quote(rebuilt.name)} ({copied}) SELECT {copied} FROM {quote(table.name)}')
+                connection.exec_driver_sql(f'DROP TABLE {quote(table.name)}')
+                connection.exec_driver_sql(f'ALTER TABLE {quote(rebuilt.name)} RENAME TO {quote(table.name)}')
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index))
+                for trigger in triggers:
+                    connection.exec_driver_sql(trigger)
+        return True
+
+    def backfill(self, name, table, columns, condition, compute):
+        """
+        Fill in new columns a batch of rows at a time, in order of id, returning the number of rows updated.
+
+        Rows are found without the write lock, then updated in a short
+        transaction which also saves the last id done, so running the
+        migration again after an interruption carries on from there.
+
+        Parameters
+        ----------
+        name : str
+            name of the backfill, unique within its migration
+        table : Table
+            the table being backfilled, which must have an integer id primary key
+        columns : list
+            the columns compute reads
+        condition : expression
+            matches rows which still need filling in, e.g. column IS NULL; it is
+            checked again when updating, so rows changed meanwhile are left alone
+        compute : callable
+            takes a row and returns a dictionary of new values for it
+        """
+        position = f'migration:{self.version}:{name}'
+        after_id = db.session.scalar(db.select(Counter.value).where(Counter.name == position)) or 0
+        updated = 0
+
+        while True:
+            rows = db.session.execute(db.select(table.c.id, *columns)
+                                      .where(table.c.id > after_id, condition)
+                                      .order_by(table.c.id)
+                                      .limit(self.batch_size)).all()
+            db.session.commit()
+            if not rows:
+                break
+
+            values = []
+            for row in rows:
+                values.append({'row_id': row.id, **{f'new_{key}': value for key, value in compute(row).items()}})
+            update = (db.update(table)
+                      .where(table.c.id == db.bindparam('row_id'), condition)
+                      .values({key[len('new_'):]: db.bindparam(key) for key in values[0] if key != 'row_id'}))
+
+            connection = db.session.connection()
+            begin_write(connection)
+            connection.execute(update, values)
+            after_id = rows[-1].id
+            connection.execute(insert(connection, Counter.__table__)
+                               .values(name=position, value=after_id)
+                               .on_conflict_do_update(index_elements=['name'], set_={'value': after_id}))
+            db.session.commit()
+
+            updated += len(rows)
+            self.report(f'{name}: {updated} rows, up to id {after_id}')
+            if self.pause:
+                time.sleep(self.pause)
+
+        db.session.execute(db.delete(Counter).where(Counter.name == position))
+        db.session.commit()
+        return updated
@@ -0,0 +1,62 @@
+"""
+Add the member columns and indexes added since the first release, normalise emails and fill in email domains.
+
+Databases set up before migrations were versioned have a members table with
+only id, name, email and date_added, with email addresses stored as they were
+typed. They are normalised before the case-insensitive unique index is built,
+which can't be done while two members' addresses differ only in case; those
+are reported, to be merged with 'flask merge-members' before migrating again.
+The email domain is filled in for existing members, so filtering the mailing
+list by domain finds them.
+"""
+
+from ..extensions import db
+from . import MigrationError
+from ..models import Member, email_domain, normalize_email
+
+INDEXES = ('uq_members_email_lower', 'ix_members_date_added_id', 'ix_members_name_id', 'ix_members_email_id',
+           'ix_members_domain_date_added_id', 'ix_members_domain_name_id', 'ix_members_domain_email_id',
+           'ix_members_domain_id', 'ix_members_unsubscribed_at_id')
+
+# The most groups of clashing addresses listed in the error
+MAX_REPORTED = 20
+
+
+def check_case_duplicates(members):
+    """Raise MigrationError listing the members whose addresses would clash once normalised."""
+    normalised = db.func.lower(db.func.trim(members.c.email))
+    clashes = (db.select(normalised.label('email'))
+               .group_by(normalised)
+               .having(db.func.count() > 1)
+               .order_by(normalised))
+    total = db.session.scalar(db.select(db.func.count()).select_from(clashes.subquery()))
+    if not total:
+        db.session.commit()
+        return
+
+    lines = []
+    for email in db.session.scalars(clashes.limit(MAX_REPORTED)):
+        ids = db.session.scalars(db.select(members.c.id).where(normalised == email).order_by(members.c.id)).all()
+        lines.append(f'  {email}: members {", ".join(str(member_id) for member_id in ids)}')
+    db.session.commit()
+    if total > MAX_REPORTED:
+        lines.append(f'  and {total - MAX_REPORTED} more')
+    raise MigrationError(f'{total} email addresses belong to more than one member once case is ignored. Merge them with '
+                         "'flask merge-members KEEP_ID DUPLICATE_ID...' and run 'flask migrate' again:\n" + '\n'.join(lines))
+
+
+def upgrade(migrator):
+    members = Member.__table__
+    for name in ('email_domain', 'unsubscribed_at', 'bounced_at'):
+        migrator.add_column(members.c[name])
+
+    check_case_duplicates(members)
+    migrator.backfill('email', members, [members.c.email],
+                      members.c.email != db.func.lower(db.func.trim(members.c.email)),
+                      lambda row: {'email': normalize_email(row.email)})
+    migrator.backfill('email_domain', members, [members.c.email], members.c.email_domain.is_(None),
+                      lambda row: {'email_domain': email_domain(normalize_email(row.email))})
+
+    indexes = {index.name: index for index in members.indexes}
+    for name in INDEXES:
+        migrator.create_index(indexes[name])
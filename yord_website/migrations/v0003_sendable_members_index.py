@@ -0,0 +1,10 @@
+"""
+Index the members campaigns are sent to, so sending skips unsubscribed and bounced members without reading them.
+"""
+
+from ..models import Member
+
+
+def upgrade(migrator):
+    indexes = {index.name: index for index in Member.__table__.indexes}
+    migrator.create_index(indexes['ix_members_sendable_id'])
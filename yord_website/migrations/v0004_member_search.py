@@ -0,0 +1,28 @@
+"""
+Drop the case-sensitive unique constraint on member emails, add member search and rebuild the sign-up rollups.
+
+The first release's members table had a unique constraint on email as typed,
+which the case-insensitive index has replaced. The search index is only
+created along with the members table, so databases set up before it have to
+have it created here, concurrently on PostgreSQL, and filled from the
+existing members. The daily sign-up totals are recalculated to include them.
+"""
+
+from ..dialects import is_postgresql
+from ..extensions import db
+from ..models import Member
+from ..rollups import rebuild_rollups
+from ..search import POSTGRESQL_SEARCH_DDL, rebuild_search_index
+
+
+def upgrade(migrator):
+    migrator.drop_unique_constraint(Member.__table__, ['email'])
+
+    if is_postgresql(db.engine):
+        migrator.create_index_sql('ix_members_search', POSTGRESQL_SEARCH_DDL[0])
+    elif db.session.scalar(db.text("SELECT 1 FROM sqlite_master WHERE name = 'members_fts'")) is None:
+        # Creates the FTS table and its triggers, then fills it in one statement
+        rebuild_search_index()
+    db.session.commit()
+
+    rebuild_rollups()
@@ -1,8 +1,12 @@
+import hashlib
+
 from .extensions import db
+from sqlalchemy.orm import validates
 from datetime import datetime, timezone
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField
-from wtforms.validators import Email, Length, DataRequired
+from wtforms.validators import Email, Length, DataRequired, Regexp
 from flask_bcrypt import Bcrypt
 
 bcrypt = Bcrypt()
@@ -36,8 +40,8 @@ class User(db.Model):
         return True
 
     def get_id(self):
-        """Return the user's email address to satisfy Flask-Login's requirements."""
-        return self.id
+        """Return the user's id and credential stamp, which Flask-Login keeps in the session."""
+        return session_id(self.id, credential_stamp(self.password_hash))
 
     def is_authenticated(self):
         """Return True if the user is authenticated."""
@@ -54,6 +58,16 @@ class User(db.Model):
     def check_password(self, password):
         """Verifies that the password provided by the user matches the hash."""
         return bcrypt.check_password_hash(self.password_hash, password)
+
+
+def credential_stamp(password_hash):
+    """Return a short digest of a password hash, which changes whenever the password does or it is rehashed at a new cost."""
+    return hashlib.sha256((password_hash or '').encode('utf-8')).hexdigest()[:16]
+
+
+def session_id(user_id, stamp):
+    """Return the id Flask-Login stores for a user, so sessions end when the password changes."""
+    return f'{user_id}:{stamp}'
     
 
 class Member(db.Model):
@@ -68,14 +82,39 @@ class Member(db.Model):
         email address of the member
     date_added : date
         date that the member was added to the mailing list
+    email_domain : str
+        domain part of the email address, used to filter the mailing list
+    unsubscribed_at : datetime
+        when the member unsubscribed, or None; they are purged once the retention period has passed
+    bounced_at : datetime
+        when email to the member first bounced permanently, or None; campaigns aren't sent to them
     """
 
     __tablename__ = 'members'
+    __table_args__ = (
+        # Sort keys for keyset pagination of the mailing list, on their own and within an email domain
+        db.Index('ix_members_date_added_id', 'date_added', 'id'),
+        db.Index('ix_members_name_id', 'name', 'id'),
+        db.Index('ix_members_email_id', 'email', 'id'),
+        db.Index('ix_members_domain_date_added_id', 'email_domain', 'date_added', 'id'),
+        db.Index('ix_members_domain_name_id', 'email_domain', 'name', 'id'),
+        db.Index('ix_members_domain_email_id', 'email_domain', 'email', 'id'),
+        db.Index('ix_members_domain_id', 'email_domain', 'id'),
+        # Finding unsubscribed members due to be purged
+        db.Index('ix_members_unsubscribed_at_id', 'unsubscribed_at', 'id'),
+        # Finding the members a campaign is sent to, in id order
+        db.Index('ix_members_sendable_id', 'id',
+                 sqlite_where=db.text('unsubscribed_at IS NULL AND bounced_at IS NULL'),
+                 postgresql_where=db.text('unsubscribed_at IS NULL AND bounced_at IS NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(320), nullable=False)
-    email = db.Column(db.String(320), nullable=False, unique=True)
-    date_added = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
+    email = db.Column(db.String(320), nullable=False)
+    date_added = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    email_domain = db.Column(db.String(255))
+    unsubscribed_at = db.Column(db.DateTime(timezone=True))
+    bounced_at = db.Column(db.DateTime(timezone=True))
 
     def __init__(self, name, email):
         "Create a new Member object using their name, email address and the date they were added"
@@ -85,8 +124,357 @@ class Member(db.Model):
 
     def __repr__(self):
         return f'Member {self.id}'
+
+    @validates('email')
+    def normalize_email(self, key, email):
+        """Store email addresses in their normalised form, along with their domain."""
+        email = normalize_email(email)
+        self.email_domain = email_domain(email)
+        return email
+
+
+# Email addresses are unique regardless of case
+db.Index('uq_members_email_lower', db.func.lower(Member.email), unique=True)
+
+
+def normalize_email(email):
+    """Normalise an email address so that addresses differing only in case or surrounding whitespace match."""
+    return email.strip().lower()
+
+
+def email_domain(email):
+    """Return the domain part of a normalised email address."""
+    return email.rpartition('@')[2]
     
 
+class SchemaVersion(db.Model):
+    """
+    This class is for recording which versions of the database schema have been set up, by 'flask bootstrap-db' and 'flask migrate'.
+
+    Attributes
+    ----------
+    version : int
+        the schema version
+    description : str
+        what the version added
+    applied_at : datetime
+        when the version was applied
+    """
+
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+
+class MailingList(db.Model):
+    """
+    This class is for the separate mailing lists people can join, e.g. for events or parents.
+
+    Attributes
+    ----------
+    name : str
+        name of the list shown to people signing up
+    slug : str
+        unique name of the list used in URLs
+    created_at : datetime
+        when the list was created
+    """
+
+    __tablename__ = 'mailing_lists'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<MailingList {self.slug}>'
+
+
+class ListMembership(db.Model):
+    """
+    This class is for recording which members are on which mailing lists.
+
+    Attributes
+    ----------
+    mailing_list_id : int
+        the list
+    member_id : int
+        the member on it
+    joined_at : datetime
+        when the member joined the list
+    """
+
+    __tablename__ = 'list_memberships'
+    __table_args__ = (
+        # Keyset pagination of a list's members by when they joined, and finding the lists a member is on
+        db.Index('ix_list_memberships_list_joined_at_member', 'mailing_list_id', 'joined_at', 'member_id'),
+        db.Index('ix_list_memberships_member_list', 'member_id', 'mailing_list_id'),
+    )
+
+    mailing_list_id = db.Column(db.Integer, db.ForeignKey('mailing_lists.id', ondelete='CASCADE'), primary_key=True)
+    # Not ON DELETE CASCADE: memberships are removed by the member hooks, which also keep each list's count
+    member_id = db.Column(db.Integer, db.ForeignKey('members.id'), primary_key=True)
+    joined_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<ListMembership {self.mailing_list_id}:{self.member_id}>'
+
+
+class Counter(db.Model):
+    """
+    This class is for storing running totals, so they can be read without counting the rows in a table.
+
+    Attributes
+    ----------
+    name : str
+        the name of the counter, e.g. 'members'
+    value : int
+        the current value of the counter
+    """
+
+    __tablename__ = 'counters'
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Counter {self.name}={self.value}>'
+
+
+class MemberChange(db.Model):
+    """
+    This class is for the append-only log of changes to the mailing list, read by other systems to stay in sync.
+
+    Attributes
+    ----------
+    id : int
+        position of the change in the log, increasing in the order the changes were committed
+    member_id : int
+        ID of the member that was changed
+    operation : str
+        'insert', 'update' or 'delete'
+    email : str
+        email address of the member after the change, or before it for a delete
+    changed_at : datetime
+        when the change was made
+    """
+
+    __tablename__ = 'member_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    member_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(6), nullable=False)
+    email = db.Column(db.String(320), nullable=False)
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<MemberChange {self.id} {self.operation} {self.member_id}>'
+
+
+class OutboxMessage(db.Model):
+    """
+    This class is for emails waiting to be sent by the outbox worker, so requests never wait on SMTP.
+
+    Attributes
+    ----------
+    name : str
+        name of the person who sent the query
+    email : str
+        email address to reply to
+    body : str
+        the query itself
+    status : str
+        'pending', 'sending' (claimed by a worker), 'sent' or 'failed'
+    attempts : int
+        number of times delivery has been tried
+    next_attempt_at : datetime
+        when delivery should next be tried
+    created_at : datetime
+        when the message was submitted
+    sent_at : datetime
+        when the message was delivered
+    last_error : str
+        the error from the most recent failed attempt
+    """
+
+    __tablename__ = 'outbox_messages'
+    __table_args__ = (
+        # The worker polls for pending messages which are due, oldest first
+        db.Index('ix_outbox_messages_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(320), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(7), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    sent_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+
+    def __init__(self, name, email, body):
+        "Create a new message which is due to be sent straight away"
+        self.name = name
+        self.email = email
+        self.body = body
+        self.status = 'pending'
+        self.attempts = 0
+        self.created_at = self.next_attempt_at = datetime.now(timezone.utc)
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.status}>'
+
+
+class Campaign(db.Model):
+    """
+    This class is for newsletters emailed to everyone on the mailing list.
+
+    Attributes
+    ----------
+    subject : str
+        subject line of the email
+    template : str
+        Jinja template for the body of the email, rendered with each member's name and email
+    status : str
+        'draft', 'sending' or 'sent'
+    last_member_id : int
+        the highest member ID which has been handed to the sender, for resuming an interrupted run
+    sent_count : int
+        number of emails sent
+    failed_count : int
+        number of emails which could not be sent
+    created_at : datetime
+        when the campaign was created
+    finished_at : datetime
+        when the last email was sent
+    """
+
+    __tablename__ = 'campaigns'
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    template = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(7), nullable=False, default='draft')
+    last_member_id = db.Column(db.Integer, nullable=False, default=0)
+    sent_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    def __repr__(self):
+        return f'<Campaign {self.id} {self.status}>'
+
+
+class CampaignDelivery(db.Model):
+    """
+    This class is for recording the delivery of a campaign to each member, so no one is emailed twice.
+
+    Attributes
+    ----------
+    campaign_id : int
+        the campaign being sent
+    member_id : int
+        the member being emailed
+    status : str
+        'sending' until the outcome is known, then 'sent' or 'failed'; 'unknown' if a run was interrupted mid-send
+    error : str
+        why the email could not be sent
+    """
+
+    __tablename__ = 'campaign_deliveries'
+
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id', ondelete='CASCADE'), primary_key=True)
+    member_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(7), nullable=False)
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<CampaignDelivery {self.campaign_id}:{self.member_id} {self.status}>'
+
+
+class Job(db.Model):
+    """
+    This class is for slow work queued to run outside of requests, by 'flask worker'.
+
+    Attributes
+    ----------
+    name : str
+        name of the registered task to run
+    payload : str
+        JSON object of keyword arguments for the task
+    status : str
+        'queued', 'running', 'done' or 'failed'
+    attempts : int
+        number of times the job has been claimed by a worker
+    max_attempts : int
+        number of attempts after which a failing job is given up on
+    run_at : datetime
+        when a queued job is due; for a running job, when its claim expires and another worker may take it over
+    enqueued_at : datetime
+        when the job was first queued
+    started_at : datetime
+        when the job was last claimed
+    finished_at : datetime
+        when the job finished or was given up on
+    last_error : str
+        the error from the most recent failed attempt
+    """
+
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the job which has been ready for longest, queued or with an expired claim
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(7), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    enqueued_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+
+class SignupRollup(db.Model):
+    """
+    This class is for daily totals of sign-ups and removals, so charts never have to group the members table.
+
+    Attributes
+    ----------
+    day : date
+        the (UTC) day the totals are for
+    signups : int
+        number of members who joined on this day and are still on the mailing list
+    removals : int
+        number of members removed from the mailing list on this day
+    """
+
+    __tablename__ = 'signup_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    signups = db.Column(db.Integer, nullable=False, default=0)
+    removals = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SignupRollup {self.day} +{self.signups} -{self.removals}>'
+
+
 class LoginForm(FlaskForm):
     """
     This class is for creating the form used in the log in process.
@@ -111,10 +499,28 @@ class EditMemberDetailsForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(min=1, max=100, message="Name must be between %(min)d and %(max)d characters.")], render_kw={'class': 'edit-input'})
     email = StringField('Email', validators=[DataRequired(), Email(message="Please enter a valid email address."), Length(min=3, max=255, message="Email address must be between %(min)d and %(max)d characters.")], render_kw={'class': 'edit-input'})
 
+class ImportMembersForm(FlaskForm):
+    """
+    This class is for creating the form used to upload a CSV file of members to add to the mailing list.
+    """
+    file = FileField('CSV file', validators=[FileRequired(), FileAllowed(['csv'], message="Please upload a CSV file.")], render_kw={'class': 'import-input', 'accept': '.csv'})
+
+class SelectMembersForm(FlaskForm):
+    """
+    This class is for creating the form used to select members on the mailing list page and delete them together.
+    """
+    submit = SubmitField('Delete selected', render_kw={'class': 'submit batch-submit'})
+
+class MailingListForm(FlaskForm):
+    """
+    This class is for creating the form used to add a new mailing list.
+    """
+    name = StringField('Name', validators=[DataRequired(), Length(min=1, max=100, message="Name must be between %(min)d and %(max)d characters.")], render_kw={'placeholder': 'List name', 'class': 'filter-input'})
+
 class ContactForm(FlaskForm):
     """
     This class is for creating the contact form, used to send queries.
     """
-    name = StringField('Name', validators=[DataRequired(), Length(min=1, max=100, message="Name must be between %(min)d and %(max)d characters.")], render_kw={'placeholder': 'Name', 'class': 'contact-input'})
+    name = StringField('Name', validators=[DataRequired(), Length(min=1, max=100, message="Name must be between %(min)d and %(max)d characters."), Regexp(r'^[^\r\n]*\Z', message="Name must be on one line.")], render_kw={'placeholder': 'Name', 'class': 'contact-input'})
     email = StringField('Email', validators=[DataRequired(), Email(message="Please enter a valid email address.")], render_kw={'placeholder': 'Email address', 'class': 'contact-input'})
     query = TextAreaField('Query', validators=[DataRequired(), Length(min=5, max=300, message="Name must be between %(min)d and %(max)d characters.")], render_kw={'placeholder': 'Message', 'class': 'contact-input contact-query'})
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+The outbox: emails are written to the outbox_messages table in the request
+that creates them and delivered later by the outbox worker.
+
+A request only ever does one INSERT, so it is never slowed down or broken by
+the mail server, and messages which can't be delivered yet are retried with
+exponential backoff. Each message also queues a 'deliver_outbox' job, so
+'flask worker' sends it promptly; 'flask outbox-worker' polls on its own.
+
+Workers claim messages with a single UPDATE ... RETURNING before sending
+them, marking them 'sending' for OUTBOX_CLAIM_TIMEOUT seconds, so two
+workers never send the same message. A claim which runs out, because its
+worker died, lets another worker try the message again.
+"""
+
+import logging
+import smtplib
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+from .dialects import is_postgresql, begin_write
+from .extensions import db
+from .mail import is_permanent_failure
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Retries are never put off for longer than this, however many attempts have failed
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+def enqueue_contact_message(name, email, body):
+    """Add a contact form query to the outbox, with a job to deliver it, returning the new message."""
+    from .jobs import enqueue
+
+    message = OutboxMessage(name.strip(), email.strip(), body)
+    db.session.add(message)
+    enqueue('deliver_outbox', commit=False)
+    db.session.commit()
+    return message
+
+
+def build_email(message, sender, recipient):
+    """Build the email for a contact form query, with replies going to the person who sent it."""
+    email = EmailMessage()
+    # Line breaks in a header would start another header
+    email['Subject'] = f'Website query from {" ".join(message.name.split())}'
+    email['From'] = sender
+    email['To'] = recipient
+    email['Reply-To'] = message.email
+    email.set_content(f'{message.name} <{message.email}> wrote:\n\n{message.body}\n')
+    return email
+
+
+def retry_delay(attempts, backoff):
+    """Return how long to wait before the next attempt, doubling after each failure."""
+    seconds = backoff * 2 ** min(attempts - 1, 20)
+    return min(timedelta(seconds=seconds), MAX_RETRY_DELAY)
+
+
+def claim_messages(now, limit, claim_timeout):
+    """Claim up to limit messages which are due to be sent, returning their rows in the order they were submitted.
+
+    Messages still marked 'sending' by a worker whose claim has run out are
+    claimed again. Each claim counts as an attempt.
+    """
+    outbox = OutboxMessage.__table__
+    connection = db.session.connection()
+    begin_write(connection)
+
+    due = (db.select(outbox.c.id)
+           .where(outbox.c.status.in_(('pending', 'sending')), outbox.c.next_attempt_at <= now)
+           .order_by(outbox.c.next_attempt_at, outbox.c.id)
+           .limit(limit))
+    if is_postgresql(connection):
+        due = due.with_for_update(skip_locked=True)
+
+    claimed = connection.execute(
+        db.update(outbox)
+        .where(outbox.c.id.in_(due.scalar_subquery()))
+        .values(status='sending',
+                attempts=outbox.c.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=claim_timeout))
+        .returning(outbox.c.id, outbox.c.name, outbox.c.email, outbox.c.body, outbox.c.attempts)
+    ).all()
+    db.session.commit()
+    return sorted(claimed, key=lambda message: message.id)
+
+
+def finish_message(message, values):
+    """Record the outcome of sending a claimed message, unless another worker has since claimed it."""
+    outbox = OutboxMessage.__table__
+    db.session.execute(db.update(outbox)
+                       .where(outbox.c.id == message.id, outbox.c.status == 'sending',
+                              outbox.c.attempts == message.attempts)
+                       .values(**values))
+    db.session.commit()
+
+
+def deliver_pending(pool, config, now=None):
+    """
+    Claim and try to send every pending message which is due, returning (sent, failed).
+
+    Each message's outcome is committed as soon as it is known, so a crash
+    part way through never causes a message which was sent to be sent again
+    by this worker; only one whose claim runs out is tried again.
+    """
+    now = now or datetime.now(timezone.utc)
+    sent = failed = 0
+
+    for message in claim_messages(now, config['OUTBOX_BATCH_SIZE'], config['OUTBOX_CLAIM_TIMEOUT']):
+        try:
+            email = build_email(message, config['MAIL_DEFAULT_SENDER'], config['MAIL_CONTACT_RECIPIENT'])
+        except Exception as error:
+            # The message itself is bad, so trying again won't help
+            failed += 1
+            logger.exception('Giving up on outbox message %s, which could not be built', message.id)
+            finish_message(message, {'status': 'failed', 'last_error': f'{type(error).__name__}: {error}'[:1000]})
+            continue
+
+        try:
+            pool.send(email)
+        except (smtplib.SMTPException, OSError) as error:
+            failed += 1
+            values = {'last_error': str(error)[:1000]}
+            if is_permanent_failure(error) or message.attempts >= config['MAIL_MAX_ATTEMPTS']:
+                values['status'] = 'failed'
+                logger.error('Giving up on outbox message %s: %s', message.id, error)
+            else:
+                values.update(status='pending', next_attempt_at=now + retry_delay(message.attempts, config['MAIL_RETRY_BACKOFF']))
+                logger.warning('Outbox message %s failed, retrying at %s: %s', message.id, values['next_attempt_at'], error)
+        else:
+            sent += 1
+            values = {'status': 'sent', 'sent_at': datetime.now(timezone.utc), 'last_error': None}
+        finish_message(message, values)
+
+    return sent, failed
+
+
+def run_outbox_worker(pool, config, once=False):
+    """Deliver pending messages until interrupted, sleeping between polls when there's nothing to do.
+
+    With once, a single pass is made and its (sent, failed) totals returned.
+    """
+    try:
+        while True:
+            sent, failed = deliver_pending(pool, config)
+            if sent or failed:
+                logger.info('Outbox: sent %s, failed %s', sent, failed)
+            if once:
+                return sent, failed
+            if not sent:
+                time.sleep(config['OUTBOX_POLL_INTERVAL'])
+    finally:
+        pool.close()
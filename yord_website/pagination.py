@@ -0,0 +1,213 @@
+"""
+Keyset (seek) pagination.
+
+Rather than loading every row and slicing the list in Python, each page is
+fetched by seeking past the last row of the previous page on an indexed sort
+key, so only ``per_page + 1`` rows are read per request. The extra row tells
+us whether there is another page without counting anything.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from .extensions import db
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class KeysetPage:
+    """
+    A single page of results fetched with keyset pagination.
+
+    Attributes
+    ----------
+    items : list
+        the rows on this page
+    page : int
+        the (1-based) number of this page
+    per_page : int
+        the maximum number of rows on a page
+    total : int
+        the total number of rows, or None if it is not known
+    total_exact : bool
+        whether total is the exact number of rows, rather than a lower bound from a capped count
+    has_prev : bool
+        whether there is a page before this one
+    has_next : bool
+        whether there is a page after this one
+    prev_cursor : str
+        opaque cursor for the page before this one
+    next_cursor : str
+        opaque cursor for the page after this one
+    """
+
+    def __init__(self, items, page, per_page, total, has_prev, has_next, order_by, total_exact=True):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_exact = total_exact
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = encode_cursor(_key_of(items[0], order_by)) if items and has_prev else None
+        self.next_cursor = encode_cursor(_key_of(items[-1], order_by)) if items and has_next else None
+
+    @property
+    def pages(self):
+        """The total number of pages, based on the total number of rows.
+
+        When the total is only a lower bound, this is the number of pages known
+        to exist so far, which grows as later pages are visited.
+        """
+        known = self.page + 1 if self.has_next else self.page
+        if self.total is None:
+            return known
+        pages = max((self.total + self.per_page - 1) // self.per_page, 1)
+        return pages if self.total_exact else max(pages, known)
+
+    def page_range(self, window=2):
+        """Page numbers to link to around the current page.
+
+        Gaps in the range are represented by None, e.g. [1, None, 4, 5, 6, None, 20].
+        """
+        return page_range(self.page, self.pages, window)
+
+
+def page_range(page, total_pages, window=2):
+    """Return the page numbers to show around the current page, with None for gaps."""
+    if total_pages < 1:
+        return []
+
+    pages = {1, total_pages}
+    pages.update(range(max(page - window, 1), min(page + window, total_pages) + 1))
+
+    result = []
+    previous = 0
+    for number in sorted(pages):
+        if number - previous > 1:
+            result.append(None)
+        result.append(number)
+        previous = number
+    return result
+
+
+def encode_cursor(values):
+    """Encode the sort key values of a row into an opaque, URL-safe cursor."""
+    payload = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor created by encode_cursor back into its sort key values."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in payload]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(f'Invalid pagination cursor: {cursor!r}')
+
+    if not isinstance(payload, list) or len(values) != size:
+        raise InvalidCursor(f'Invalid pagination cursor: {cursor!r}')
+    return values
+
+
+def paginate(statement, order_by, per_page, page=1, after=None, before=None, total=None, total_exact=True, scalars=True,
+             descending=False):
+    """
+    Fetch one page of the rows selected by statement using keyset pagination.
+
+    Parameters
+    ----------
+    statement : Select
+        the query to paginate, without any ORDER BY or LIMIT
+    order_by : tuple
+        the columns making up the (unique) sort key, e.g. (Member.date_added, Member.id)
+    per_page : int
+        the maximum number of rows on a page
+    page : int
+        the page number, used for jumps when no cursor is given and for display
+    after : str
+        cursor of the last row on the previous page
+    before : str
+        cursor of the first row on the next page
+    total : int
+        the total number of rows, if already known
+    total_exact : bool
+        whether total is exact, rather than a lower bound
+    scalars : bool
+        return ORM objects rather than rows
+    descending : bool
+        sort by the key in descending rather than ascending order
+    """
+    page = max(page, 1)
+
+    if before:
+        key = decode_cursor(before, len(order_by))
+        statement = statement.where(_seek(order_by, key, forward=descending))
+        statement = statement.order_by(*_ordering(order_by, not descending))
+        rows = _fetch(statement.limit(per_page + 1), scalars)
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, page, per_page, total, has_prev, True, order_by, total_exact)
+
+    if after:
+        key = decode_cursor(after, len(order_by))
+    elif page > 1:
+        key = _boundary_key(statement, order_by, (page - 1) * per_page, descending)
+        if key is None:
+            return KeysetPage([], page, per_page, total, True, False, order_by, total_exact)
+    else:
+        key = None
+
+    if key is not None:
+        statement = statement.where(_seek(order_by, key, forward=not descending))
+    statement = statement.order_by(*_ordering(order_by, descending))
+    rows = _fetch(statement.limit(per_page + 1), scalars)
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], page, per_page, total, key is not None, has_next, order_by, total_exact)
+
+
+def _fetch(statement, scalars):
+    if scalars:
+        return db.session.scalars(statement).all()
+    return db.session.execute(statement).all()
+
+
+def _key_of(item, order_by):
+    return [getattr(item, column.key) for column in order_by]
+
+
+def _ordering(order_by, descending):
+    return [column.desc() for column in order_by] if descending else list(order_by)
+
+
+def _boundary_key(statement, order_by, offset, descending):
+    """Find the sort key of the last row before the given offset.
+
+    Only the key columns are selected, so the database can walk the sort
+    key's index without reading the table rows it skips over.
+    """
+    keys = statement.with_only_columns(*order_by).order_by(*_ordering(order_by, descending)).offset(offset - 1).limit(1)
+    row = db.session.execute(keys).first()
+    return list(row) if row is not None else None
+
+
+def _seek(order_by, key, forward):
+    """Build the WHERE clause selecting the rows greater (or less) than the given key.
+
+    This expands (a, b) > (x, y) into a > x OR (a = x AND b > y), which
+    every database can answer from a composite index on (a, b).
+    """
+    clauses = []
+    for position, (column, value) in enumerate(zip(order_by, key)):
+        compare = column > value if forward else column < value
+        equal = [previous == previous_value for previous, previous_value in zip(order_by[:position], key[:position])]
+        clauses.append(and_(*equal, compare))
+    return or_(*clauses)
@@ -0,0 +1,143 @@
+"""
+Hashing and checking passwords on a small, bounded pool of threads.
+
+bcrypt is deliberately slow, and releases the GIL while it works. Running it
+on a pool sized for the machine's cores, rather than on however many request
+threads happen to be logging in, caps the CPU a burst of logins can take.
+When the pool and its queue are full, logins are turned away at once with
+PasswordHasherBusy (a 503 with Retry-After) rather than piling up behind
+each other until every worker is stuck.
+
+The bcrypt cost comes from BCRYPT_LOG_ROUNDS. Stored hashes made with a
+different cost are replaced the next time their owner logs in, and a login
+for a username that doesn't exist checks the password against a dummy hash
+of the same cost, so it takes as long as one that does.
+
+The new hash has a new salt, so it changes the user's credential stamp
+(see models.credential_stamp) just as a new password would: after
+BCRYPT_LOG_ROUNDS is changed, each user's first login ends their other
+sessions once, and the session of that login carries the new stamp.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .models import bcrypt
+
+_hasher_lock = threading.Lock()
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when every password hashing thread is busy and the queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many logins are being checked; try again shortly.')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a fixed number of threads, with a limit on how many calls can wait for one.
+
+    Attributes
+    ----------
+    rounds : int
+        the bcrypt cost (log2 of the number of rounds) for new hashes
+    workers : int
+        number of threads hashing at the same time
+    queue_size : int
+        number of calls which can wait for a thread before PasswordHasherBusy is raised
+    """
+
+    def __init__(self, rounds=12, workers=2, queue_size=8, retry_after=2):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # Made once, on the pool, as soon as the hasher is created rather than by the first unknown-user login
+        self._dummy_hash = self._executor.submit(bcrypt.generate_password_hash, 'not a password', rounds)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(rounds=config['BCRYPT_LOG_ROUNDS'],
+                   workers=config['PASSWORD_HASH_WORKERS'],
+                   queue_size=config['PASSWORD_HASH_QUEUE_SIZE'],
+                   retry_after=config['PASSWORD_HASH_RETRY_AFTER'])
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy(self.retry_after)
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Return a new hash of the password at the configured cost."""
+        return self._run(bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def check(self, password_hash, password):
+        """Return True if the password matches the hash.
+
+        With no hash (no such user), the password is checked against a
+        dummy hash instead, taking just as long, and False is returned.
+        """
+        if not password_hash:
+            self._run(bcrypt.check_password_hash, self.dummy_hash(), password)
+            return False
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def dummy_hash(self):
+        return self._dummy_hash.result().decode('utf-8')
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different cost from the configured one."""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def get_password_hasher():
+    """Return this app's password hasher, creating it on first use."""
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        with _hasher_lock:
+            hasher = current_app.extensions.get('password_hasher')
+            if hasher is None:
+                hasher = PasswordHasher.from_config(current_app.config)
+                current_app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def verify_login(user, password):
+    """
+    Check a login, returning True if the user exists and the password is right.
+
+    Runs the same bcrypt work whether or not the user exists, and rehashes
+    the password at the configured cost if the stored hash used another,
+    unless the pool is busy, in which case it is left for a later login.
+    A rehash ends the user's other sessions, as a password change does.
+    The caller must commit to save a new hash. Raises PasswordHasherBusy when
+    too many logins are already being checked.
+    """
+    hasher = get_password_hasher()
+    if not hasher.check(user.password_hash if user is not None else None, password):
+        return False
+
+    if hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hasher.hash(password)
+        except PasswordHasherBusy:
+            pass
+    return True
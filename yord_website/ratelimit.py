@@ -0,0 +1,193 @@
+"""
+Rate limiting for expensive endpoints, such as logging in and signing up.
+
+Each limit is a token bucket: a client may make up to N requests at once,
+and earns them back at N per period. Buckets are kept in a backend shared by
+every worker process on the machine, a small SQLite file of its own by
+default, so a client can't get around a limit by landing on another worker.
+The in-memory backend is for tests and single-process development.
+
+Limits are applied with the @rate_limit decorator, keyed by client IP
+address or by a form field such as the username, and a request over a limit
+gets 429 Too Many Requests with a Retry-After header. If the backend can't
+be reached, requests are let through rather than taking the site down.
+"""
+
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    """Turn a limit such as '10/minute' into (capacity, tokens per second)."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(second|minute|hour|day)\s*', limit)
+    if match is None or int(match.group(1)) < 1:
+        raise ValueError(f'Invalid rate limit: {limit!r}')
+    capacity = int(match.group(1))
+    return capacity, capacity / PERIODS[match.group(2)]
+
+
+def take_token(tokens, updated, capacity, rate, now):
+    """Refill a bucket and take a token from it, returning (new tokens, seconds to wait or 0 if allowed)."""
+    tokens = capacity if tokens is None else min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Token buckets in a dictionary, only shared between the threads of one process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, rate, now):
+        """Take a token from the key's bucket, returning 0 if allowed or the seconds until a token is available."""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, now))
+            tokens, wait = take_token(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """
+    Token buckets in an SQLite file shared by every process on the machine.
+
+    Attributes
+    ----------
+    path : str
+        the database file
+    prune_after : float
+        seconds after which untouched buckets, which will have refilled, are deleted
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path, prune_after=86400):
+        self.path = path
+        self.prune_after = prune_after
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit mode, so transactions are started explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key, capacity, rate, now):
+        """Take a token from the key's bucket, returning 0 if allowed or the seconds until a token is available."""
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, wait = take_token(row[0] if row else None, row[1] if row else now, capacity, rate, now)
+            connection.execute('INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                               'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                               (key, tokens, now))
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM buckets WHERE updated < ?', (now - self.prune_after,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def reset(self):
+        self._connect().execute('DELETE FROM buckets')
+
+
+def create_backend(config):
+    """Create the backend named by RATELIMIT_STORAGE: 'memory', or 'sqlite:///<path>'."""
+    storage = config['RATELIMIT_STORAGE']
+    if storage == 'memory':
+        return MemoryBackend()
+    if storage.startswith('sqlite:///'):
+        path = storage[len('sqlite:///'):]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return SQLiteBackend(path)
+    raise ValueError(f'Unknown RATELIMIT_STORAGE: {storage!r}')
+
+
+def get_backend():
+    """Return this app's rate limit backend, creating it on first use."""
+    backend = current_app.extensions.get('rate_limiter')
+    if backend is None:
+        backend = create_backend(current_app.config)
+        current_app.extensions['rate_limiter'] = backend
+    return backend
+
+
+def client_ip():
+    """Key requests by the client's IP address (set up ProxyFix when running behind a proxy)."""
+    return request.remote_addr or 'unknown'
+
+
+def form_field(name):
+    """Key requests by a submitted form field, e.g. form_field('username') to limit attempts per account."""
+    def key():
+        value = request.form.get(name, '').strip().lower()
+        return value or None
+    return key
+
+
+def rate_limit(limit_setting, key=client_ip, scope=None, methods=('POST',)):
+    """
+    Limit how often a view can be requested, returning 429 with Retry-After when over the limit.
+
+    Parameters
+    ----------
+    limit_setting : str
+        the config setting holding the limit, e.g. 'RATELIMIT_LOGIN' = '10/minute'
+    key : callable
+        returns what requests are counted by, e.g. client_ip, or None to not count the request
+    scope : str
+        name for this limit's buckets; defaults to the setting's name
+    methods : tuple
+        the request methods which are counted
+    """
+    scope = scope or limit_setting.lower()
+
+    def decorator(view):
+        @wraps(view)
+        def limited(*args, **kwargs):
+            config = current_app.config
+            if request.method in methods and config['RATELIMIT_ENABLED']:
+                value = key()
+                if value is not None:
+                    capacity, rate = parse_limit(config[limit_setting])
+                    try:
+                        wait = get_backend().hit(f'{scope}:{value}', capacity, rate, time.time())
+                    except sqlite3.Error:
+                        logger.exception('Rate limit backend failed; letting the request through')
+                        wait = 0
+                    if wait:
+                        raise TooManyRequests(retry_after=math.ceil(wait))
+            return view(*args, **kwargs)
+        return limited
+    return decorator
@@ -0,0 +1,141 @@
+"""
+Purging members who unsubscribed, or signed up, longer ago than we keep their details.
+
+A single DELETE of every expired member would hold the write lock on members
+(the whole database on SQLite) for as long as it takes, stalling sign-ups and
+the member list. Instead the IDs due to be purged are found a chunk at a time
+with keyset pagination on id, each chunk is deleted in its own short
+transaction, and the purge pauses between chunks so other writers get the lock.
+A purge which is interrupted can simply be run again.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from .dialects import is_postgresql, begin_write
+from .events import members_deleting, members_deleted
+from .extensions import db
+from .models import Member
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeProgress:
+    """
+    Running totals for a purge.
+
+    Attributes
+    ----------
+    deleted : int
+        members deleted so far
+    chunks : int
+        transactions committed so far
+    started : float
+        time.monotonic() when the purge started
+    """
+
+    def __init__(self):
+        self.deleted = 0
+        self.chunks = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __repr__(self):
+        return f'<PurgeProgress deleted={self.deleted} chunks={self.chunks} elapsed={self.elapsed:.1f}s>'
+
+
+def purge_cutoffs(config, now=None):
+    """Return (unsubscribed before, added before) from the retention settings; either may be None."""
+    now = now or datetime.now(timezone.utc)
+    unsubscribed_days = config['PURGE_UNSUBSCRIBED_AFTER_DAYS']
+    stale_days = config['PURGE_STALE_AFTER_DAYS']
+    return (now - timedelta(days=unsubscribed_days) if unsubscribed_days is not None else None,
+            now - timedelta(days=stale_days) if stale_days is not None else None)
+
+
+def purge_filter(unsubscribed_before=None, added_before=None):
+    """Return the WHERE clause for members due to be purged, or None if nothing is."""
+    conditions = []
+    if unsubscribed_before is not None:
+        conditions.append(Member.unsubscribed_at < unsubscribed_before)
+    if added_before is not None:
+        conditions.append(Member.date_added < added_before)
+    return db.or_(*conditions) if conditions else None
+
+
+def count_purgeable(unsubscribed_before=None, added_before=None):
+    """Return how many members a purge with these cutoffs would delete, without deleting anything."""
+    condition = purge_filter(unsubscribed_before, added_before)
+    if condition is None:
+        return 0
+    return db.session.scalar(db.select(db.func.count()).select_from(Member).where(condition))
+
+
+def purge_chunk(condition, after_id, chunk_size):
+    """Delete the next chunk of expired members with IDs above after_id, returning (number deleted, last ID looked at)."""
+    members = Member.__table__
+
+    # Found without the write lock; the chunk is checked again once it is held
+    ids = db.session.scalars(db.select(Member.id)
+                             .where(Member.id > after_id, condition)
+                             .order_by(Member.id)
+                             .limit(chunk_size)).all()
+    db.session.commit()
+    if not ids:
+        return 0, None
+
+    connection = db.session.connection()
+    begin_write(connection)
+    due = db.select(members.c.id, members.c.email, members.c.date_added).where(members.c.id.in_(ids), condition)
+    if is_postgresql(connection):
+        due = due.with_for_update(skip_locked=True)
+    rows = [row._asdict() for row in connection.execute(due)]
+    if rows:
+        deleted_ids = [row['id'] for row in rows]
+        members_deleting(connection, deleted_ids)
+        connection.execute(db.delete(members).where(members.c.id.in_(deleted_ids)))
+        members_deleted(connection, rows)
+    db.session.commit()
+    return len(rows), ids[-1]
+
+
+def purge_members(unsubscribed_before=None, added_before=None, chunk_size=500, pause=0.2, progress_callback=None):
+    """
+    Delete expired members a chunk at a time, returning a PurgeProgress.
+
+    Parameters
+    ----------
+    unsubscribed_before : datetime
+        purge members who unsubscribed before this time
+    added_before : datetime
+        purge members who signed up before this time
+    chunk_size : int
+        number of members deleted in each transaction
+    pause : float
+        seconds to wait between chunks
+    progress_callback : callable
+        called with the PurgeProgress after each chunk
+    """
+    progress = PurgeProgress()
+    condition = purge_filter(unsubscribed_before, added_before)
+    if condition is None:
+        return progress
+
+    after_id = 0
+    while True:
+        deleted, after_id = purge_chunk(condition, after_id, chunk_size)
+        if after_id is None:
+            break
+        progress.deleted += deleted
+        progress.chunks += 1
+        if progress_callback is not None:
+            progress_callback(progress)
+        if pause:
+            time.sleep(pause)
+
+    logger.info('Purged %s members in %s chunks', progress.deleted, progress.chunks)
+    return progress
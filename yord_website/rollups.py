@@ -0,0 +1,111 @@
+"""
+Daily sign-up totals, kept up to date as members are added and removed.
+
+The member hooks in events.py add each change to its day's row in
+signup_rollups in the same transaction, so charting a year of sign-ups
+reads at most 365 rows however long the mailing list gets. A member is
+counted on the day they signed up for as long as they stay on the list, and
+their removal is counted on the day it happens.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from .dialects import insert, begin_write, utc_date
+from .extensions import db
+from .models import Member, MemberChange, SignupRollup
+
+PERIODS = ('day', 'week')
+
+
+def utc_day(value):
+    """Return the UTC date of a datetime, treating naive datetimes as UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def adjust_rollups(connection, signups=None, removals=None):
+    """Add {day: delta} changes to the sign-ups and removals on the connection's current transaction."""
+    totals = {}
+    for day, delta in (signups or {}).items():
+        totals.setdefault(day, [0, 0])[0] += delta
+    for day, delta in (removals or {}).items():
+        totals.setdefault(day, [0, 0])[1] += delta
+    if not totals:
+        return
+
+    rollups = SignupRollup.__table__
+    statement = insert(connection, rollups)
+    statement = statement.on_conflict_do_update(index_elements=[rollups.c.day],
+                                                set_={'signups': rollups.c.signups + statement.excluded.signups,
+                                                      'removals': rollups.c.removals + statement.excluded.removals})
+    connection.execute(statement, [{'day': day, 'signups': added, 'removals': removed}
+                                   for day, (added, removed) in sorted(totals.items())])
+
+
+def members_added_to_rollups(connection, rows):
+    adjust_rollups(connection, signups=Counter(utc_day(row['date_added']) for row in rows))
+
+
+def members_removed_from_rollups(connection, rows):
+    today = datetime.now(timezone.utc).date()
+    adjust_rollups(connection,
+                   signups=Counter({day: -count for day, count in Counter(utc_day(row['date_added']) for row in rows).items()}),
+                   removals=Counter({today: len(rows)}))
+
+
+def as_date(value):
+    # SQLite's date() returns text
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_rollups():
+    """Recalculate every day's totals from the members table and the change log, returning the number of days."""
+    connection = db.session.connection()
+    begin_write(connection)
+
+    totals = {}
+    signup_day = utc_date(connection, Member.date_added)
+    for day, count in connection.execute(db.select(signup_day, db.func.count()).group_by(signup_day)):
+        totals.setdefault(as_date(day), [0, 0])[0] = count
+
+    removal_day = utc_date(connection, MemberChange.changed_at)
+    removals = db.select(removal_day, db.func.count()).where(MemberChange.operation == 'delete').group_by(removal_day)
+    for day, count in connection.execute(removals):
+        totals.setdefault(as_date(day), [0, 0])[1] = count
+
+    connection.execute(db.delete(SignupRollup.__table__))
+    if totals:
+        connection.execute(db.insert(SignupRollup.__table__),
+                           [{'day': day, 'signups': added, 'removals': removed}
+                            for day, (added, removed) in sorted(totals.items())])
+    db.session.commit()
+    return len(totals)
+
+
+def signup_series(days=365, period='day', today=None):
+    """
+    Return [(start date, signups, removals)] for each day or week in the last `days` days, oldest first.
+
+    Weeks start on Monday. Days without a rollup row are included with zero totals.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Unknown period: {period}')
+
+    today = today or datetime.now(timezone.utc).date()
+    start = today - timedelta(days=days - 1)
+    rows = db.session.execute(db.select(SignupRollup.day, SignupRollup.signups, SignupRollup.removals)
+                              .where(SignupRollup.day >= start, SignupRollup.day <= today))
+    by_day = {day: (signups, removals) for day, signups, removals in rows}
+
+    series = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        bucket = day - timedelta(days=day.weekday()) if period == 'week' else day
+        signups, removals = by_day.get(day, (0, 0))
+        totals = series.setdefault(bucket, [0, 0])
+        totals[0] += signups
+        totals[1] += removals
+
+    return [(bucket, signups, removals) for bucket, (signups, removals) in series.items()]
@@ -0,0 +1,91 @@
+"""
+Indexed prefix search over member names and email addresses.
+
+On SQLite the members table is shadowed by an FTS5 table, members_fts, which
+triggers keep in step with every insert, update and delete. On PostgreSQL a
+GIN index over a tsvector of the same words is used instead. In both cases
+email addresses are split into words at punctuation, so 'doe' and 'gmails'
+both find jane.doe@gmails.com.
+"""
+
+import re
+
+from sqlalchemy import DDL, event, text
+
+from .dialects import is_postgresql
+from .extensions import db
+from .models import Member
+
+# Each term of a search is matched as a word prefix; long queries are truncated
+MAX_SEARCH_TERMS = 8
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS members_fts USING fts5("
+    "name, email, content='members', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_insert AFTER INSERT ON members BEGIN "
+    "INSERT INTO members_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_delete AFTER DELETE ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS members_fts_update AFTER UPDATE OF name, email ON members BEGIN "
+    "INSERT INTO members_fts(members_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO members_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "INSERT INTO members_fts(members_fts) VALUES ('rebuild')",
+]
+
+# Must match search_vector() exactly for PostgreSQL to use the index
+POSTGRESQL_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_members_search ON members USING gin "
+    "(to_tsvector('simple', (name || ' ') || translate(email, '@.+_-', '     ')))",
+]
+
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Member.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+for statement in POSTGRESQL_SEARCH_DDL:
+    event.listen(Member.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+# The triggers are dropped with the members table, but the FTS table has to be dropped explicitly
+event.listen(Member.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS members_fts').execute_if(dialect='sqlite'))
+
+
+def search_vector():
+    """The words in a member's name and email address as a PostgreSQL tsvector."""
+    email_words = db.func.translate(Member.email, db.literal_column("'@.+_-'"), db.literal_column("'     '"))
+    words = Member.name.op('||')(db.literal_column("' '")).op('||')(email_words)
+    return db.func.to_tsvector(db.literal_column("'simple'"), words)
+
+
+def search_terms(query):
+    """Split a search query into lower-case words, ignoring punctuation."""
+    return re.findall(r'[^\W_]+', (query or '').lower())[:MAX_SEARCH_TERMS]
+
+
+def member_search_filter(bind, query):
+    """Return a WHERE clause matching members whose name or email contains words starting with each search term.
+
+    Returns None if the query contains no searchable words.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+
+    if is_postgresql(bind):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return search_vector().op('@@')(db.func.to_tsquery(db.literal_column("'simple'"), tsquery))
+
+    match = ' AND '.join(f'"{term}"*' for term in terms)
+    matching_ids = text('SELECT rowid FROM members_fts WHERE members_fts MATCH :match').bindparams(match=match)
+    return Member.id.in_(matching_ids.columns(db.column('rowid', db.Integer)))
+
+
+def rebuild_search_index():
+    """Create the search index if it is missing and rebuild its contents from the members table."""
+    connection = db.session.connection()
+    if is_postgresql(connection):
+        for statement in POSTGRESQL_SEARCH_DDL:
+            connection.execute(text(statement))
+        connection.execute(text('REINDEX INDEX ix_members_search'))
+    else:
+        for statement in SQLITE_SEARCH_DDL:
+            connection.execute(text(statement))
+    db.session.commit()
@@ -0,0 +1,61 @@
+"""
+Tasks which can be queued with jobs.enqueue and run by 'flask worker'.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from .extensions import db
+from .jobs import task, enqueue, heartbeat
+from .mail import SMTPPool
+from .models import Campaign, Job
+
+
+@task('deliver_outbox')
+def deliver_outbox():
+    """Send whatever is due in the outbox."""
+    from .outbox import deliver_pending
+    pool = SMTPPool.from_config(current_app.config)
+    try:
+        deliver_pending(pool, current_app.config)
+    finally:
+        pool.close()
+
+
+@task('send_campaign')
+def send_campaign(campaign_id):
+    """Send a newsletter campaign, resuming it if a previous attempt was interrupted.
+
+    The job's claim is extended after each batch, as sending a large
+    campaign takes much longer than the visibility timeout.
+    """
+    from .campaigns import send_campaign as send
+    config = current_app.config
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None or campaign.status == 'sent':
+        return
+
+    send(campaign, SMTPPool.from_config(config, size=config['CAMPAIGN_CONNECTIONS']), config['MAIL_DEFAULT_SENDER'],
+         connections=config['CAMPAIGN_CONNECTIONS'],
+         rate=config['CAMPAIGN_RATE_LIMIT'] or None,
+         batch_size=config['CAMPAIGN_BATCH_SIZE'],
+         progress_callback=lambda progress: heartbeat())
+
+
+@task('purge_members')
+def purge_members():
+    """Purge expired members, then queue the next purge PURGE_INTERVAL_HOURS from now.
+
+    Queue the first purge with 'flask enqueue-job purge_members'.
+    """
+    from .retention import purge_members as purge, purge_cutoffs
+    config = current_app.config
+    unsubscribed_before, added_before = purge_cutoffs(config)
+    purge(unsubscribed_before, added_before, chunk_size=config['PURGE_CHUNK_SIZE'], pause=config['PURGE_PAUSE'],
+          progress_callback=lambda progress: heartbeat())
+
+    interval = config['PURGE_INTERVAL_HOURS']
+    already_queued = db.session.scalar(db.select(Job.id).where(Job.name == 'purge_members', Job.status == 'queued').limit(1))
+    if interval and already_queued is None:
+        enqueue('purge_members', run_at=datetime.now(timezone.utc) + timedelta(hours=interval))
@@ -0,0 +1,72 @@
+"""
+Signed one-click unsubscribe links.
+
+Each link carries the member's id and email address signed with the app's
+SECRET_KEY, so it can be checked without looking anything up and can't be
+altered to unsubscribe someone else. Following it marks the member as
+unsubscribed with one UPDATE on the members primary key, which does nothing
+if they already have, so clicking twice or a mail client sending the
+one-click POST as well is harmless. Unsubscribed members stop receiving
+campaigns straight away and are deleted by the retention purge later.
+"""
+
+from datetime import datetime, timezone
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+
+from .dialects import begin_write
+from .events import members_updated
+from .extensions import db
+from .models import Member, normalize_email
+
+SALT = 'unsubscribe'
+
+
+def unsubscribe_serializer(secret_key=None):
+    return URLSafeSerializer(secret_key or current_app.config['SECRET_KEY'], salt=SALT)
+
+
+def unsubscribe_token(member_id, email, serializer=None):
+    """Return the signed token for a member's unsubscribe link."""
+    return (serializer or unsubscribe_serializer()).dumps([member_id, normalize_email(email)])
+
+
+def read_unsubscribe_token(token, serializer=None):
+    """Return the (member id, email) signed into a token, raising BadSignature if it has been tampered with."""
+    payload = (serializer or unsubscribe_serializer()).loads(token)
+    if (not isinstance(payload, list) or len(payload) != 2
+            or not isinstance(payload[0], int) or not isinstance(payload[1], str)):
+        raise BadSignature('Unexpected unsubscribe token payload')
+    return payload[0], payload[1]
+
+
+def unsubscribe_url_builder(config):
+    """Return a function giving the absolute unsubscribe URL for (member id, email).
+
+    The serializer is created once, so the function can be called from
+    threads without an app context, e.g. while sending a campaign.
+    """
+    serializer = unsubscribe_serializer(config['SECRET_KEY'])
+    site_url = config['SITE_URL'].rstrip('/')
+
+    def unsubscribe_url(member_id, email):
+        return f'{site_url}/unsubscribe/{unsubscribe_token(member_id, email, serializer)}'
+    return unsubscribe_url
+
+
+def unsubscribe(member_id, email):
+    """Mark a member as unsubscribed, returning False if there was no such subscribed member."""
+    members = Member.__table__
+    connection = db.session.connection()
+    begin_write(connection)
+    row = connection.execute(db.update(members)
+                             .where(members.c.id == member_id,
+                                    db.func.lower(members.c.email) == email,
+                                    members.c.unsubscribed_at.is_(None))
+                             .values(unsubscribed_at=datetime.now(timezone.utc))
+                             .returning(members.c.id, members.c.email, members.c.date_added)).first()
+    if row is not None:
+        members_updated(connection, [row._asdict()])
+    db.session.commit()
+    return row is not None
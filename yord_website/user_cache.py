@@ -0,0 +1,127 @@
+"""
+A per-process cache of the logged-in users Flask-Login loads on every request.
+
+Entries are small read-only UserRecords rather than User objects, so they
+can be shared between threads and requests. Within USER_CACHE_TTL seconds of
+being loaded, an entry is used without touching the database. After that it
+is checked against the users version counter, one read of a single counters
+row, and only reloaded from the users table if a user has been added,
+changed or removed since. A change made in this process clears its entry at
+once; other processes notice within the TTL.
+
+Each record carries a stamp derived from the user's password hash, which is
+part of the id kept in the session, so once a password change is noticed
+sessions started with the old password no longer load a user.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+
+from .counters import users_version
+from .extensions import db
+from .models import User, credential_stamp, session_id
+
+CacheEntry = namedtuple('CacheEntry', 'user version expires')
+
+
+class UserRecord(UserMixin):
+    """
+    The details of a logged-in user needed to serve a request.
+
+    Attributes
+    ----------
+    id : int
+        the user's id
+    email : str
+        the user's email address, which is their username
+    stamp : str
+        the credential stamp of the user's password hash
+    """
+
+    def __init__(self, id, email, stamp):
+        self.id = id
+        self.email = email
+        self.stamp = stamp
+
+    def get_id(self):
+        return session_id(self.id, self.stamp)
+
+    def __repr__(self):
+        return f'<UserRecord {self.email}>'
+
+
+class UserCache:
+    """
+    A least recently used cache of UserRecords by id, whose entries are revalidated after a time to live.
+
+    Attributes
+    ----------
+    max_size : int
+        the most users kept
+    ttl : float
+        seconds an entry is used before it is checked against the users version
+    """
+
+    def __init__(self, max_size=256, ttl=30, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, stamp=None):
+        """Return the UserRecord for user_id, or None if there is no such user or stamp is not theirs."""
+        user = self._load(user_id)
+        if user is not None and stamp is not None and user.stamp != stamp:
+            return None
+        return user
+
+    def _load(self, user_id):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                if entry.expires > now:
+                    return entry.user
+
+        # Read before the user, so a change made in between is noticed next time
+        version = users_version()
+        if entry is not None and entry.version == version:
+            user = entry.user
+        else:
+            row = db.session.execute(db.select(User.id, User.email, User.password_hash).where(User.id == user_id)).first()
+            user = UserRecord(row.id, row.email, credential_stamp(row.password_hash)) if row is not None else None
+
+        with self._lock:
+            if user is None:
+                self._entries.pop(user_id, None)
+            else:
+                self._entries[user_id] = CacheEntry(user, version, now + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or everyone if no id is given."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def user_changed(user_id):
+    """Forget a user in this process's cache, if there is an app with one."""
+    if has_app_context():
+        cache = current_app.extensions.get('user_cache')
+        if cache is not None:
+            cache.invalidate(user_id)